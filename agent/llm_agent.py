@@ -4,15 +4,38 @@ ERP AI Agent - LLM版本 (使用Ollama本地模型)
 通过大语言模型理解自然语言指令并自动化完成ERP系统操作
 """
 
+import argparse
 import requests
+from requests.adapters import HTTPAdapter
 import json
-import sys
+import os
+import time
+from urllib.parse import quote
 from typing import Dict, List, Optional, Any
 from colorama import init, Fore, Style
 
 # 初始化colorama
 init()
 
+# 原生Function Calling模式的系统提示词（固定内容，便于Ollama复用提示词缓存）
+NATIVE_SYSTEM_PROMPT = (
+    "你是ERP系统的AI助手。需要查询或操作数据时调用工具，可以一次调用多个工具；"
+    "订单状态只能是 completed 或 cancelled，补货数量必须是正整数；只知道产品名称时先用 search_products 查产品ID。"
+    "工具结果已经展示给用户，回答时只需简短总结。"
+)
+
+
+def _function(name: str, description: str, properties: Optional[Dict] = None, required=()) -> Dict:
+    """生成 /api/chat 的工具定义"""
+    return {
+        "type": "function",
+        "function": {
+            "name": name,
+            "description": description,
+            "parameters": {"type": "object", "properties": properties or {}, "required": list(required)},
+        },
+    }
+
 
 class LLMAgent:
     """基于LLM的ERP系统AI代理"""
@@ -21,13 +44,34 @@ class LLMAgent:
         self,
         api_base_url: str = "http://localhost:8000/api",
         ollama_base_url: str = "http://localhost:11434",
-        model: str = "qwen2.5:7b"
+        model: str = "qwen2.5:7b",
+        cache_ttl: float = 30.0,
+        use_native_tools: bool = True,
+        stream: bool = False,
+        max_tool_rounds: int = 4
     ):
         self.api_base_url = api_base_url
         self.ollama_base_url = ollama_base_url
         self.model = model
         self.conversation_history = []
-        self.products_cache = None
+
+        # 复用连接，避免每个指令都重新建立TCP连接
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=4)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        # 产品与报表查询的本地缓存：{路径: (过期时间, 数据)}，本程序的写操作会清空
+        self.cache_ttl = cache_ttl
+        self._cache: Dict[str, Any] = {}
+
+        # 产品与订单的本地副本，通过 /api/sync 只拉取上次同步之后的变更
+        self._replica: Dict[str, Any] = {"version": 0, "products": {}, "orders": {}}
+
+        # 原生模式：/api/chat + tools，一轮可执行多个工具；关闭则使用旧的 /api/generate JSON 模式
+        self.use_native_tools = use_native_tools
+        self.stream = stream
+        self.max_tool_rounds = max_tool_rounds
 
         # 定义可用的工具（Function Calling）
         self.tools = [
@@ -36,6 +80,14 @@ class LLMAgent:
                 "description": "获取产品列表，可用于查询库存信息",
                 "parameters": {}
             },
+            {
+                "name": "search_products",
+                "description": "按名称、SKU、类别或供应商搜索产品（支持错字），用于查找产品ID",
+                "parameters": {
+                    "query": "搜索关键词（必填）",
+                    "limit": "返回数量（可选，默认5）"
+                }
+            },
             {
                 "name": "create_order",
                 "description": "创建新订单",
@@ -49,6 +101,13 @@ class LLMAgent:
                 "description": "获取订单列表",
                 "parameters": {}
             },
+            {
+                "name": "get_customer",
+                "description": "按客户名称（可只给开头部分）查询客户的累计消费、已完成订单数和最近下单日",
+                "parameters": {
+                    "name": "客户名称或名称开头（必填）"
+                }
+            },
             {
                 "name": "update_order_status",
                 "description": "更新订单状态",
@@ -70,6 +129,15 @@ class LLMAgent:
                     "quantity": "补货数量（必填）"
                 }
             },
+            {
+                "name": "bulk_restock",
+                "description": "批量补货（进货单），一次为多个产品增加库存",
+                "parameters": {
+                    "items": "进货项列表，每项包含sku或product_id，以及quantity",
+                    "csv_path": "进货单CSV文件路径（可选，代替items；栏位 sku 或 product_id、quantity）",
+                    "reference": "进货单号（可选）"
+                }
+            },
             {
                 "name": "get_sales_report",
                 "description": "获取销售报表统计数据",
@@ -82,6 +150,93 @@ class LLMAgent:
             }
         ]
 
+        # 原生模式使用的精简工具定义
+        item_schema = {
+            "type": "object",
+            "properties": {"product_id": {"type": "integer"}, "quantity": {"type": "integer"}},
+            "required": ["product_id", "quantity"],
+        }
+        self.tool_schemas = [
+            _function("get_products", "产品列表及库存"),
+            _function("search_products", "按名称/SKU/类别/供应商搜索产品，查产品ID", {
+                "query": {"type": "string"},
+                "limit": {"type": "integer"},
+            }, required=("query",)),
+            _function("create_order", "创建订单", {
+                "customer_name": {"type": "string"},
+                "items": {"type": "array", "items": item_schema},
+            }, required=("customer_name", "items")),
+            _function("get_orders", "订单列表"),
+            _function("get_customer", "按客户名称或开头查询客户累计消费和订单数", {
+                "name": {"type": "string"},
+            }, required=("name",)),
+            _function("update_order_status", "更新订单状态", {
+                "order_id": {"type": "integer"},
+                "status": {"type": "string", "enum": ["completed", "cancelled"]},
+            }, required=("order_id", "status")),
+            _function("get_stock_alerts", "库存不足的产品"),
+            _function("restock_product", "产品补货", {
+                "product_id": {"type": "integer"},
+                "quantity": {"type": "integer"},
+            }, required=("product_id", "quantity")),
+            _function("bulk_restock", "批量补货（进货单），产品用sku或product_id指定，或给CSV文件路径", {
+                "items": {"type": "array", "items": {
+                    "type": "object",
+                    "properties": {"sku": {"type": "string"}, "product_id": {"type": "integer"},
+                                   "quantity": {"type": "integer"}},
+                    "required": ["quantity"],
+                }},
+                "csv_path": {"type": "string"},
+                "reference": {"type": "string"},
+            }),
+            _function("get_sales_report", "销售报表"),
+            _function("get_inventory_report", "库存报表"),
+        ]
+
+    # ==================== HTTP 与缓存 ====================
+
+    def _cached_get(self, path: str) -> Optional[Any]:
+        """带TTL缓存的GET请求，失败时返回None"""
+        entry = self._cache.get(path)
+        if entry and entry[0] > time.monotonic():
+            return entry[1]
+
+        response = self.session.get(f"{self.api_base_url}{path}")
+        if response.status_code != 200:
+            return None
+        data = response.json()
+        self._cache[path] = (time.monotonic() + self.cache_ttl, data)
+        return data
+
+    def sync_replica(self) -> bool:
+        """增量同步本地副本；服务器不支持 /api/sync 或请求失败时返回False"""
+        try:
+            response = self.session.get(f"{self.api_base_url}/sync", params={"since": self._replica["version"]})
+        except requests.exceptions.RequestException:
+            return False
+        if response.status_code != 200:
+            return False
+        changes = response.json()
+        if changes["reset"]:
+            self._replica["products"].clear()
+            self._replica["orders"].clear()
+        for table in ("products", "orders"):
+            rows = self._replica[table]
+            for row_id in changes["deleted"].get(table, []):
+                rows.pop(row_id, None)
+            for row in changes[table]:
+                rows[row["id"]] = row
+        self._replica["version"] = changes["version"]
+        return True
+
+    def _replica_rows(self, table: str) -> List[Dict]:
+        rows = self._replica[table]
+        return [rows[row_id] for row_id in sorted(rows)]
+
+    def invalidate_cache(self):
+        """写操作后清空缓存（库存、报表都可能随之变化）"""
+        self._cache.clear()
+
     def print_header(self):
         """打印欢迎信息"""
         print("\n" + "="*60)
@@ -101,7 +256,7 @@ class LLMAgent:
     def check_ollama_status(self) -> bool:
         """检查Ollama服务状态"""
         try:
-            response = requests.get(f"{self.ollama_base_url}/api/tags", timeout=2)
+            response = self.session.get(f"{self.ollama_base_url}/api/tags", timeout=2)
             return response.status_code == 200
         except:
             return False
@@ -109,7 +264,7 @@ class LLMAgent:
     def check_model_available(self) -> bool:
         """检查模型是否可用"""
         try:
-            response = requests.get(f"{self.ollama_base_url}/api/tags", timeout=2)
+            response = self.session.get(f"{self.ollama_base_url}/api/tags", timeout=2)
             if response.status_code == 200:
                 models = response.json().get('models', [])
                 return any(self.model in m.get('name', '') for m in models)
@@ -152,7 +307,7 @@ class LLMAgent:
 
         # 调用Ollama API
         try:
-            response = requests.post(
+            response = self.session.post(
                 f"{self.ollama_base_url}/api/generate",
                 json={
                     "model": self.model,
@@ -172,6 +327,107 @@ class LLMAgent:
         except Exception as e:
             return f'{{"action": "error", "response": "LLM调用异常: {str(e)}"}}'
 
+    def chat_with_tools(self, messages: List[Dict]) -> Optional[Dict]:
+        """通过 /api/chat 的原生工具调用与LLM对话，返回助手消息；失败时返回None"""
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "tools": self.tool_schemas,
+            "stream": self.stream
+        }
+        try:
+            if not self.stream:
+                response = self.session.post(f"{self.ollama_base_url}/api/chat", json=payload, timeout=60)
+                if response.status_code != 200:
+                    print(f"{Fore.RED}❌ LLM调用失败 (HTTP {response.status_code}){Style.RESET_ALL}")
+                    return None
+                return response.json().get("message", {})
+
+            # 流式输出：逐段打印回答，同时收集工具调用
+            content, tool_calls = [], []
+            with self.session.post(f"{self.ollama_base_url}/api/chat", json=payload,
+                                   timeout=60, stream=True) as response:
+                if response.status_code != 200:
+                    print(f"{Fore.RED}❌ LLM调用失败 (HTTP {response.status_code}){Style.RESET_ALL}")
+                    return None
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    message = chunk.get("message", {})
+                    if message.get("content"):
+                        if not content:
+                            print(Fore.GREEN, end="")
+                        print(message["content"], end="", flush=True)
+                        content.append(message["content"])
+                    tool_calls.extend(message.get("tool_calls") or [])
+                    if chunk.get("done"):
+                        break
+            if content:
+                print(Style.RESET_ALL)
+            return {"role": "assistant", "content": "".join(content), "tool_calls": tool_calls}
+
+        except Exception as e:
+            print(f"{Fore.RED}❌ LLM调用异常: {str(e)}{Style.RESET_ALL}")
+            return None
+
+    @staticmethod
+    def _result_for_llm(result: Dict, max_items: int = 20) -> str:
+        """把工具结果压缩后回传给LLM（列表只保留前几项的标量字段）"""
+        data = result.get("data")
+        compact = {k: v for k, v in result.items() if k not in ("data", "type")}
+        if isinstance(data, list):
+            compact["count"] = len(data)
+            compact["data"] = [
+                {k: v for k, v in row.items() if not isinstance(v, (dict, list))} if isinstance(row, dict) else row
+                for row in data[:max_items]
+            ]
+        elif data is not None:
+            compact["data"] = data
+        return json.dumps(compact, ensure_ascii=False, separators=(",", ":"))
+
+    def run_tool_loop(self, command: str):
+        """原生模式：LLM可在一轮中请求多个工具，结果回传后继续，直到给出最终回答"""
+        messages = [{"role": "system", "content": NATIVE_SYSTEM_PROMPT}]
+        messages += self.conversation_history[-6:]
+        messages.append({"role": "user", "content": command})
+
+        for _ in range(self.max_tool_rounds):
+            message = self.chat_with_tools(messages)
+            if message is None:
+                return
+
+            messages.append(message)
+            tool_calls = message.get("tool_calls") or []
+            if not tool_calls:
+                answer = message.get("content", "")
+                if not self.stream and answer:
+                    print(f"\n{Fore.GREEN}{answer}{Style.RESET_ALL}\n")
+                self.conversation_history += [
+                    {"role": "user", "content": command},
+                    {"role": "assistant", "content": answer},
+                ]
+                return
+
+            for tool_call in tool_calls:
+                function = tool_call.get("function", {})
+                name = function.get("name", "")
+                arguments = function.get("arguments") or {}
+                if isinstance(arguments, str):
+                    arguments = json.loads(arguments or "{}")
+
+                print(f"{Fore.CYAN}⚙️  执行: {name}{Style.RESET_ALL}")
+                try:
+                    result = self.execute_tool(name, arguments)
+                    self.display_result(result)
+                except Exception as e:
+                    result = {"success": False, "error": str(e)}
+                    print(f"{Fore.RED}❌ 执行失败: {str(e)}{Style.RESET_ALL}")
+
+                messages.append({"role": "tool", "content": self._result_for_llm(result)})
+
+        print(f"{Fore.YELLOW}⚠️  工具调用轮数已达上限{Style.RESET_ALL}")
+
     def execute_command(self, command: str) -> bool:
         """执行用户命令"""
         if command.lower() in ['exit', 'quit', '退出']:
@@ -180,6 +436,10 @@ class LLMAgent:
 
         print(f"{Fore.CYAN}🤔 思考中...{Style.RESET_ALL}")
 
+        if self.use_native_tools:
+            self.run_tool_loop(command)
+            return True
+
         # 调用LLM理解用户意图
         llm_response = self.chat_with_llm(command)
 
@@ -220,11 +480,14 @@ class LLMAgent:
         """执行工具调用"""
         tool_map = {
             "get_products": self.tool_get_products,
+            "search_products": self.tool_search_products,
             "create_order": self.tool_create_order,
             "get_orders": self.tool_get_orders,
+            "get_customer": self.tool_get_customer,
             "update_order_status": self.tool_update_order_status,
             "get_stock_alerts": self.tool_get_stock_alerts,
             "restock_product": self.tool_restock_product,
+            "bulk_restock": self.tool_bulk_restock,
             "get_sales_report": self.tool_get_sales_report,
             "get_inventory_report": self.tool_get_inventory_report,
         }
@@ -239,9 +502,8 @@ class LLMAgent:
 
     def tool_get_products(self, params: Dict) -> Dict:
         """获取产品列表"""
-        response = requests.get(f"{self.api_base_url}/products")
-        if response.status_code == 200:
-            products = response.json()
+        products = self._replica_rows("products") if self.sync_replica() else self._cached_get("/products")
+        if products is not None:
             return {
                 "success": True,
                 "data": products,
@@ -249,6 +511,22 @@ class LLMAgent:
             }
         return {"success": False, "error": "获取产品列表失败"}
 
+    def tool_search_products(self, params: Dict) -> Dict:
+        """搜索产品"""
+        query = (params.get("query") or "").strip()
+        if not query:
+            return {"success": False, "error": "缺少搜索关键词"}
+
+        limit = int(params.get("limit") or 5)
+        products = self._cached_get(f"/products/search?q={quote(query)}&limit={limit}")
+        if products is not None:
+            return {
+                "success": True,
+                "data": products,
+                "type": "products"
+            }
+        return {"success": False, "error": "搜索产品失败"}
+
     def tool_create_order(self, params: Dict) -> Dict:
         """创建订单"""
         customer_name = params.get("customer_name")
@@ -262,7 +540,8 @@ class LLMAgent:
             "items": items
         }
 
-        response = requests.post(f"{self.api_base_url}/orders", json=order_data)
+        response = self.session.post(f"{self.api_base_url}/orders", json=order_data)
+        self.invalidate_cache()
         if response.status_code == 200:
             order = response.json()
             return {
@@ -277,7 +556,9 @@ class LLMAgent:
 
     def tool_get_orders(self, params: Dict) -> Dict:
         """获取订单列表"""
-        response = requests.get(f"{self.api_base_url}/orders")
+        if self.sync_replica():
+            return {"success": True, "data": self._replica_rows("orders"), "type": "orders"}
+        response = self.session.get(f"{self.api_base_url}/orders")
         if response.status_code == 200:
             orders = response.json()
             return {
@@ -287,6 +568,23 @@ class LLMAgent:
             }
         return {"success": False, "error": "获取订单列表失败"}
 
+    def tool_get_customer(self, params: Dict) -> Dict:
+        """查询客户"""
+        name = (params.get("name") or "").strip()
+        if not name:
+            return {"success": False, "error": "缺少客户名称"}
+
+        customers = self._cached_get(f"/customers?name={quote(name)}&limit=5")
+        if customers is None:
+            return {"success": False, "error": "查询客户失败"}
+        if not customers:
+            return {"success": False, "error": f"找不到客户 {name}"}
+        return {
+            "success": True,
+            "data": customers,
+            "type": "customers"
+        }
+
     def tool_update_order_status(self, params: Dict) -> Dict:
         """更新订单状态"""
         order_id = params.get("order_id")
@@ -295,10 +593,11 @@ class LLMAgent:
         if not order_id or not status:
             return {"success": False, "error": "缺少订单ID或状态"}
 
-        response = requests.put(
+        response = self.session.put(
             f"{self.api_base_url}/orders/{order_id}",
             json={"status": status}
         )
+        self.invalidate_cache()
 
         if response.status_code == 200:
             order = response.json()
@@ -314,9 +613,8 @@ class LLMAgent:
 
     def tool_get_stock_alerts(self, params: Dict) -> Dict:
         """获取库存预警"""
-        response = requests.get(f"{self.api_base_url}/inventory/alerts")
-        if response.status_code == 200:
-            alerts = response.json()
+        alerts = self._cached_get("/inventory/alerts")
+        if alerts is not None:
             return {
                 "success": True,
                 "data": alerts,
@@ -332,9 +630,11 @@ class LLMAgent:
         if not product_id or not quantity:
             return {"success": False, "error": "缺少产品ID或数量"}
 
-        response = requests.post(
-            f"{self.api_base_url}/inventory/restock/{product_id}?quantity={quantity}"
+        response = self.session.post(
+            f"{self.api_base_url}/inventory/restock/{product_id}",
+            params={"quantity": quantity}
         )
+        self.invalidate_cache()
 
         if response.status_code == 200:
             result = response.json()
@@ -345,11 +645,47 @@ class LLMAgent:
             }
         return {"success": False, "error": "补货失败"}
 
+    def tool_bulk_restock(self, params: Dict) -> Dict:
+        """批量补货：items 列表或进货单 CSV；有不存在的产品时整批不执行"""
+        items = params.get("items") or []
+        csv_path = params.get("csv_path")
+        reference = params.get("reference")
+
+        if csv_path:
+            try:
+                with open(os.path.expanduser(csv_path), "rb") as f:
+                    response = self.session.post(
+                        f"{self.api_base_url}/inventory/receipts/csv",
+                        files={"file": (os.path.basename(csv_path), f, "text/csv")},
+                        params={"reference": reference} if reference else None,
+                    )
+            except OSError as e:
+                return {"success": False, "error": f"无法读取CSV文件: {e}"}
+        elif items:
+            response = self.session.post(f"{self.api_base_url}/inventory/receipts",
+                                         json={"items": items, "reference": reference})
+        else:
+            return {"success": False, "error": "缺少进货项或CSV文件"}
+        self.invalidate_cache()
+
+        if response.status_code == 200:
+            result = response.json()
+            return {
+                "success": True,
+                "message": f"已补货 {len(result['products'])} 种产品，共 {result['total_quantity']} 件",
+                "data": result["products"],
+                "type": "receipt"
+            }
+        try:
+            detail = response.json().get("detail", "补货失败")
+        except ValueError:
+            detail = "补货失败"
+        return {"success": False, "error": detail if isinstance(detail, str) else json.dumps(detail, ensure_ascii=False)}
+
     def tool_get_sales_report(self, params: Dict) -> Dict:
         """获取销售报表"""
-        response = requests.get(f"{self.api_base_url}/reports/sales")
-        if response.status_code == 200:
-            report = response.json()
+        report = self._cached_get("/reports/sales")
+        if report is not None:
             return {
                 "success": True,
                 "data": report,
@@ -359,9 +695,8 @@ class LLMAgent:
 
     def tool_get_inventory_report(self, params: Dict) -> Dict:
         """获取库存报表"""
-        response = requests.get(f"{self.api_base_url}/reports/inventory")
-        if response.status_code == 200:
-            report = response.json()
+        report = self._cached_get("/reports/inventory")
+        if report is not None:
             return {
                 "success": True,
                 "data": report,
@@ -392,8 +727,12 @@ class LLMAgent:
             self.display_order(data)
         elif result_type == "orders":
             self.display_orders(data)
+        elif result_type == "customers":
+            self.display_customers(data)
         elif result_type == "alerts":
             self.display_alerts(data)
+        elif result_type == "receipt":
+            self.display_receipt(data)
         elif result_type == "sales_report":
             self.display_sales_report(data)
         elif result_type == "inventory_report":
@@ -438,6 +777,15 @@ class LLMAgent:
             print(f"#{order['id']:<9} {order['customer_name']:<20} {order['status']:<10} ¥{order['total_amount']:<14.2f}")
         print()
 
+    def display_customers(self, customers: List[Dict]):
+        """显示客户列表"""
+        print(f"{'客户':<24} {'累计消费':<15} {'订单数':<8} {'最近下单':<12}")
+        print("-" * 62)
+        for customer in customers:
+            last_order = (customer.get('last_order_date') or '-')[:10]
+            print(f"{customer['name']:<24} ¥{customer['lifetime_value']:<14.2f} {customer['order_count']:<8} {last_order:<12}")
+        print()
+
     def display_alerts(self, alerts: List[Dict]):
         """显示库存预警"""
         if not alerts:
@@ -450,6 +798,14 @@ class LLMAgent:
             print(f"{alert['product_name']:<20} {alert['current_stock']:<12} {alert['min_stock_level']:<12} {alert['shortage']:<10}")
         print()
 
+    def display_receipt(self, products: List[Dict]):
+        """显示补货结果"""
+        print(f"{'SKU':<16} {'产品名称':<20} {'补货':<8} {'原库存':<8} {'新库存':<8}")
+        print("-" * 64)
+        for product in products:
+            print(f"{product['sku']:<16} {product['name']:<20} {product['added']:<8} {product['old_stock']:<8} {product['new_stock']:<8}")
+        print()
+
     def display_sales_report(self, report: Dict):
         """显示销售报表"""
         print(f"  总订单数: {report['total_orders']}")
@@ -482,7 +838,7 @@ class LLMAgent:
 
         # 检查ERP系统
         try:
-            response = requests.get(f"{self.api_base_url}/products", timeout=2)
+            response = self.session.get(f"{self.api_base_url}/products", timeout=2)
             if response.status_code != 200:
                 print(f"{Fore.RED}❌ 无法连接到ERP系统{Style.RESET_ALL}")
                 print(f"{Fore.YELLOW}💡 请先运行: ./start_erp.sh{Style.RESET_ALL}\n")
@@ -529,15 +885,16 @@ class LLMAgent:
 
 def main():
     """主函数"""
-    # 可以通过命令行参数指定模型
-    model = "qwen2.5:7b"  # 默认使用qwen2.5:7b，也可以改为 llama3.2, gemma2 等
-
-    if len(sys.argv) > 1:
-        model = sys.argv[1]
+    # 可以通过命令行参数指定模型，默认使用qwen2.5:7b，也可以改为 llama3.2, gemma2 等
+    parser = argparse.ArgumentParser(description="ERP AI Agent - LLM版本")
+    parser.add_argument("model", nargs="?", default="qwen2.5:7b", help="Ollama模型名称")
+    parser.add_argument("--stream", action="store_true", help="流式输出回答")
+    parser.add_argument("--legacy", action="store_true", help="使用旧的 /api/generate JSON 模式")
+    args = parser.parse_args()
 
-    print(f"使用模型: {model}")
+    print(f"使用模型: {args.model}")
 
-    agent = LLMAgent(model=model)
+    agent = LLMAgent(model=args.model, use_native_tools=not args.legacy, stream=args.stream)
     agent.run()
 
 
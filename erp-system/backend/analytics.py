@@ -0,0 +1,350 @@
+"""
+欄式分析引擎
+把 products / orders / order_items（連同歸檔表，見 archive.py）快照成 NumPy 陣列，分析型報表（類別毛利、客戶排行、
+折扣影響）以向量化 group-by 計算，不再經過逐行 ORM。
+快照依數據變更失效：以 (同步版本, 歸檔水位) 為版本，任何行程（其他 worker、manage.py）提交產品或訂單的寫入
+都會改變同步版本，下次查詢發現版本不同即重建；設定 ERP_ANALYTICS_MAX_LAG 秒數時，
+在此時間內先回傳舊快照並於背景重建。
+"""
+import os
+import threading
+import time
+from datetime import date, datetime
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+import archive
+import sync
+from database import SessionLocal, engine
+
+MAX_LAG = float(os.getenv("ERP_ANALYTICS_MAX_LAG", "0"))
+FETCH_CHUNK = 100_000
+
+# 折扣區間（discount 為比例，例如 0.05 表示 95 折；區間含右端點）
+DISCOUNT_BINS = (0.0, 1e-9, 0.05, 0.10, 0.20)
+DISCOUNT_LABELS = ("無折扣", "0-5%", "5-10%", "10-20%", "20%以上")
+
+
+# ==================== 數據版本 ====================
+
+class DataVersion(NamedTuple):
+    sync_version: int  # 產品與訂單的寫入（含刪除）都會遞增，見 database.next_sync_version
+    archive_watermark: Optional[datetime]  # 歸檔搬移不寫同步版本，以最新一筆歸檔訂單的時間判斷
+    marks: int  # 本行程 mark_stale() 的次數
+
+
+_stale_marks = 0
+
+
+def mark_stale():
+    """不寫同步版本的直接寫入（例如以 SQL 匯入數據）完成後呼叫，本行程的快照下次查詢時重建"""
+    global _stale_marks
+    _stale_marks += 1
+
+
+def data_version() -> DataVersion:
+    """目前數據的版本（兩條單行查詢）"""
+    db = SessionLocal()
+    try:
+        return DataVersion(sync.head(), archive.watermark(db), _stale_marks)
+    finally:
+        db.close()
+
+
+# ==================== 快照 ====================
+
+def _fetch_columns(cursor, sql: str, dtypes: Sequence[Any]) -> List[Any]:
+    """分批讀取結果，數值欄位逐批轉為陣列（dtype 為 object 的欄位保留為列表）"""
+    numeric = object not in dtypes
+    chunks = [[] for _ in dtypes]
+    cursor.execute(sql)
+    while True:
+        rows = cursor.fetchmany(FETCH_CHUNK)
+        if not rows:
+            break
+        if numeric:
+            # 全數值查詢整批轉成二維陣列，NULL 轉為 NaN
+            block = np.array(rows, dtype=np.float64).reshape(len(rows), len(dtypes))
+            for i in range(len(dtypes)):
+                chunks[i].append(block[:, i])
+            continue
+        for i, (values, dtype) in enumerate(zip(zip(*rows), dtypes)):
+            if dtype is object:
+                chunks[i].extend(values)
+            else:
+                chunks[i].append(np.array(values, dtype=dtype))
+    return [
+        chunk if dtype is object else np.concatenate(chunk).astype(dtype) if chunk else np.empty(0, dtype=dtype)
+        for chunk, dtype in zip(chunks, dtypes)
+    ]
+
+
+def _factorize(values: Sequence[Optional[str]], missing: str) -> Tuple[np.ndarray, List[str]]:
+    """字串欄位轉為整數編碼與對照表"""
+    index: Dict[str, int] = {}
+    codes = np.fromiter((index.setdefault(missing if v is None else v, len(index)) for v in values),
+                        dtype=np.int32, count=len(values))
+    return codes, list(index)
+
+
+def _to_days(values: list) -> np.ndarray:
+    if values and isinstance(values[0], str):
+        values = [v[:10] for v in values]
+    return np.array(values, dtype="datetime64[D]")
+
+
+def _lookup(keys: np.ndarray, values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """values 在已排序 keys 中的位置；找不到的填 0 並標記為 False"""
+    if not len(keys):
+        return np.zeros(len(values), dtype=np.int64), np.zeros(len(values), dtype=bool)
+    index = np.searchsorted(keys, values)
+    index[index >= len(keys)] = 0
+    found = keys[index] == values
+    index[~found] = 0
+    return index, found
+
+
+class Snapshot:
+    """三張表的欄式快照；明細以陣列索引連到訂單與產品"""
+
+    def __init__(self, version: DataVersion):
+        self.version = version
+        self.built_at = time.time()
+        self.build_seconds = 0.0
+
+    @classmethod
+    def load(cls, version: DataVersion) -> "Snapshot":
+        start = time.perf_counter()
+        snap = cls(version)
+        # 直接使用 DBAPI 游標，避免為數百萬行建立 Row 物件
+        conn = engine.raw_connection()
+        try:
+            cursor = conn.cursor()
+            ids, names, categories, snap.product_price, snap.product_cost = _fetch_columns(
+                cursor, "SELECT id, name, category, price, cost FROM products ORDER BY id",
+                (np.int64, object, object, np.float64, np.float64))
+            snap.product_ids = ids
+            snap.product_names = names
+            snap.product_category, snap.categories = _factorize(categories, "未分類")
+
+            ids, customers, statuses, dates, totals = _fetch_columns(
+                cursor, "SELECT id, customer_name, status, order_date, total_amount FROM orders UNION ALL "
+                        "SELECT id, customer_name, status, order_date, total_amount FROM orders_archive ORDER BY id",
+                (np.int64, object, object, object, np.float64))
+            snap.order_ids = ids
+            snap.order_customer, snap.customers = _factorize(customers, "")
+            snap.order_status, snap.statuses = _factorize(statuses, "pending")
+            snap.order_day = _to_days(dates)
+            snap.order_total = np.nan_to_num(totals)
+
+            item_order_ids, item_product_ids, quantities, unit_prices, subtotals, discounts = _fetch_columns(
+                cursor, "SELECT order_id, product_id, quantity, unit_price, subtotal, discount FROM order_items UNION ALL "
+                        "SELECT order_id, product_id, quantity, unit_price, subtotal, discount FROM order_items_archive",
+                (np.int64, np.int64, np.float64, np.float64, np.float64, np.float64))
+        finally:
+            conn.close()
+
+        snap.item_order, order_found = _lookup(snap.order_ids, item_order_ids)
+        snap.item_product, product_found = _lookup(snap.product_ids, item_product_ids)
+        # 孤立明細（訂單或產品已不存在）不參與計算
+        snap.item_valid = order_found & product_found
+        snap.item_quantity = np.nan_to_num(quantities)
+        snap.item_unit_price = np.nan_to_num(unit_prices)
+        snap.item_subtotal = np.nan_to_num(subtotals)
+        snap.item_discount = np.nan_to_num(discounts)
+
+        snap.build_seconds = time.perf_counter() - start
+        return snap
+
+    # ---------- 篩選 ----------
+
+    def order_mask(self, start: Optional[date], end: Optional[date], statuses: Sequence[str]) -> np.ndarray:
+        mask = np.ones(len(self.order_ids), dtype=bool)
+        if statuses:
+            codes = [self.statuses.index(s) for s in statuses if s in self.statuses]
+            mask &= np.isin(self.order_status, codes)
+        if start is not None:
+            mask &= self.order_day >= np.datetime64(start, "D")
+        if end is not None:
+            mask &= self.order_day <= np.datetime64(end, "D")
+        return mask
+
+    def item_mask(self, order_mask: np.ndarray) -> np.ndarray:
+        if not len(self.order_ids):
+            return np.zeros(len(self.item_order), dtype=bool)
+        return self.item_valid & order_mask[self.item_order]
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "version": self.version._asdict(),
+            "built_at": self.built_at,
+            "build_ms": round(self.build_seconds * 1000, 3),
+            "products": len(self.product_ids),
+            "orders": len(self.order_ids),
+            "order_items": len(self.item_order),
+        }
+
+
+# ==================== 報表 ====================
+
+def margin_by_category(snap: Snapshot, start: Optional[date] = None, end: Optional[date] = None,
+                       statuses: Sequence[str] = ("completed",)) -> List[Dict[str, Any]]:
+    """各類別的銷售額、成本、毛利與毛利率（成本 = 數量 × Product.cost）"""
+    m = snap.item_mask(snap.order_mask(start, end, statuses))
+    product = snap.item_product[m]
+    category = snap.product_category[product]
+    quantity = snap.item_quantity[m]
+    unit_cost = snap.product_cost[product]
+    has_cost = ~np.isnan(unit_cost)
+
+    n = len(snap.categories)
+    revenue = np.bincount(category, weights=snap.item_subtotal[m], minlength=n)
+    cost = np.bincount(category, weights=np.where(has_cost, unit_cost, 0.0) * quantity, minlength=n)
+    units = np.bincount(category, weights=quantity, minlength=n)
+    items = np.bincount(category, minlength=n)
+    missing_cost = np.bincount(category, weights=~has_cost, minlength=n)
+
+    rows = []
+    for i in np.argsort(-revenue):
+        if not items[i]:
+            continue
+        margin = revenue[i] - cost[i]
+        rows.append({
+            "category": snap.categories[i],
+            "revenue": round(float(revenue[i]), 2),
+            "cost": round(float(cost[i]), 2),
+            "margin": round(float(margin), 2),
+            "margin_pct": round(float(margin / revenue[i] * 100), 2) if revenue[i] else 0.0,
+            "units_sold": int(units[i]),
+            "order_items": int(items[i]),
+            "items_without_cost": int(missing_cost[i]),
+        })
+    return rows
+
+
+def customer_ranking(snap: Snapshot, start: Optional[date] = None, end: Optional[date] = None,
+                     statuses: Sequence[str] = ("completed",), limit: int = 20) -> List[Dict[str, Any]]:
+    """按銷售額排序的客戶排行"""
+    om = snap.order_mask(start, end, statuses)
+    customer = snap.order_customer[om]
+    n = len(snap.customers)
+    revenue = np.bincount(customer, weights=snap.order_total[om], minlength=n)
+    orders = np.bincount(customer, minlength=n)
+
+    last_day = np.full(n, np.datetime64("NaT"), dtype="datetime64[D]")
+    if len(customer):
+        # 依日期排序後，每個客戶最後一次出現即為最近下單日
+        order = np.argsort(snap.order_day[om], kind="stable")
+        last_day[customer[order]] = snap.order_day[om][order]
+
+    im = snap.item_mask(om)
+    units = np.bincount(snap.order_customer[snap.item_order[im]], weights=snap.item_quantity[im], minlength=n)
+
+    ranked = [i for i in np.argsort(-revenue, kind="stable") if orders[i]][:limit]
+    return [{
+        "rank": rank,
+        "customer_name": snap.customers[i],
+        "revenue": round(float(revenue[i]), 2),
+        "order_count": int(orders[i]),
+        "avg_order_value": round(float(revenue[i] / orders[i]), 2),
+        "units_sold": int(units[i]),
+        "last_order_date": str(last_day[i]),
+    } for rank, i in enumerate(ranked, start=1)]
+
+
+def discount_impact(snap: Snapshot, start: Optional[date] = None, end: Optional[date] = None,
+                    statuses: Sequence[str] = ("completed",)) -> List[Dict[str, Any]]:
+    """各折扣區間的銷量、折讓金額與毛利"""
+    m = snap.item_mask(snap.order_mask(start, end, statuses))
+    product = snap.item_product[m]
+    quantity = snap.item_quantity[m]
+    subtotal = snap.item_subtotal[m]
+    list_amount = snap.item_unit_price[m] * quantity
+    unit_cost = snap.product_cost[product]
+    cost = np.where(np.isnan(unit_cost), 0.0, unit_cost) * quantity
+
+    bucket = np.digitize(snap.item_discount[m], DISCOUNT_BINS[1:], right=True)
+    n = len(DISCOUNT_LABELS)
+    items = np.bincount(bucket, minlength=n)
+    units = np.bincount(bucket, weights=quantity, minlength=n)
+    revenue = np.bincount(bucket, weights=subtotal, minlength=n)
+    gross = np.bincount(bucket, weights=list_amount, minlength=n)
+    costs = np.bincount(bucket, weights=cost, minlength=n)
+
+    rows = []
+    for i, label in enumerate(DISCOUNT_LABELS):
+        margin = revenue[i] - costs[i]
+        rows.append({
+            "discount_range": label,
+            "order_items": int(items[i]),
+            "units_sold": int(units[i]),
+            "revenue": round(float(revenue[i]), 2),
+            "discount_amount": round(float(gross[i] - revenue[i]), 2),
+            "margin": round(float(margin), 2),
+            "margin_pct": round(float(margin / revenue[i] * 100), 2) if revenue[i] else 0.0,
+            "avg_units_per_item": round(float(units[i] / items[i]), 2) if items[i] else 0.0,
+        })
+    return rows
+
+
+# ==================== 快照管理 ====================
+
+class AnalyticsEngine:
+    """持有目前快照，依變更版本決定何時重建"""
+
+    def __init__(self, max_lag: float = MAX_LAG):
+        self.max_lag = max_lag
+        self._snapshot: Optional[Snapshot] = None
+        self._build_lock = threading.Lock()
+        self._refreshing = False
+
+    def _rebuild(self) -> Snapshot:
+        with self._build_lock:
+            version = data_version()
+            snap = self._snapshot
+            if snap is None or snap.version != version:
+                snap = Snapshot.load(version)
+                self._snapshot = snap
+            return snap
+
+    def _rebuild_in_background(self):
+        if self._refreshing:
+            return
+        self._refreshing = True
+
+        def run():
+            try:
+                self._rebuild()
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=run, name="analytics-refresh", daemon=True).start()
+
+    def snapshot(self) -> Snapshot:
+        snap = self._snapshot
+        if snap is not None and snap.version == data_version():
+            return snap
+        if snap is not None and time.time() - snap.built_at < self.max_lag:
+            self._rebuild_in_background()
+            return snap
+        return self._rebuild()
+
+    def status(self) -> Dict[str, Any]:
+        snap = self._snapshot
+        version = data_version()
+        return {
+            "current_version": version._asdict(),
+            "max_lag_seconds": self.max_lag,
+            "stale": snap is None or snap.version != version,
+            "snapshot": snap.info() if snap else None,
+        }
+
+
+# 全局分析引擎實例
+analytics_engine = AnalyticsEngine()
+
+
+def get_analytics() -> AnalyticsEngine:
+    """獲取分析引擎實例"""
+    return analytics_engine
@@ -0,0 +1,170 @@
+"""
+訂單歸檔
+orders / order_items 只保留近期與未結束的訂單：已完成或已取消、且早於門檻月份的訂單整月搬到
+orders_archive / order_items_archive（保留原 id），熱表與其索引不再隨歷史無限增長。
+
+歸檔不改變任何統計：銷售彙總、客戶統計與庫存都已計入這些訂單，搬移時不重算；
+需要從訂單重新計算的地方（銷售報表、客戶統計、銷售彙總重算、分析快照）以 database.ORDER_SOURCES 同時讀取兩邊。
+列表 API 的日期區間早於歸檔水位（最新一筆歸檔訂單的時間）時才合併查詢歸檔表，單筆查詢在熱表找不到時改查歸檔表。
+已歸檔的訂單不能再修改；搬移不寫同步版本也不產生刪除記錄，已同步的客戶端保留原有副本，完整快照只含熱表。
+
+每批（ERP_ARCHIVE_BATCH 筆訂單）一個交易，以 INSERT ... SELECT 複製後刪除熱表的行。
+orders / order_items 的 id 以 AUTOINCREMENT 產生（遷移 0006），刪除訂單後也不會重用，新訂單不會與歸檔的 id 重複。
+
+用法：python manage.py archive-orders --after-days 365
+"""
+import heapq
+import itertools
+import os
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, func, insert, literal, select
+from sqlalchemy.orm import Session, selectinload
+
+from database import (
+    ORDER_SOURCES, ArchivedOrder, ArchivedOrderItem, Order as DBOrder, OrderItem as DBOrderItem,
+    Product as DBProduct, SessionLocal,
+)
+
+AFTER_DAYS = int(os.getenv("ERP_ARCHIVE_AFTER_DAYS", "365"))
+BATCH = int(os.getenv("ERP_ARCHIVE_BATCH", "500"))
+STATUSES = ("completed", "cancelled")
+
+_orders = DBOrder.__table__
+_items = DBOrderItem.__table__
+_archived_orders = ArchivedOrder.__table__
+_archived_items = ArchivedOrderItem.__table__
+
+
+def cutoff(after_days: int = AFTER_DAYS, today: Optional[date] = None) -> date:
+    """早於這一天（某月 1 日）的訂單可以歸檔：today - after_days 所在月份的月初，最晚為本月月初"""
+    # 訂單時間以 UTC 寫入；本月的訂單留在熱表，儀表板的本月計數只讀熱表
+    today = today or datetime.utcnow().date()
+    return min((today - timedelta(days=max(after_days, 0))).replace(day=1), today.replace(day=1))
+
+
+def run(before: Optional[date] = None, batch: int = BATCH,
+        progress: Optional[Callable[[int, int], None]] = None) -> Dict:
+    """把 before 之前已完成或已取消的訂單搬到歸檔表，返回 {before, orders, items}"""
+    before = min(before or cutoff(), cutoff(0))
+    since = datetime.combine(before, datetime.min.time())
+    moved_orders = moved_items = 0
+    while True:
+        db: Session = SessionLocal()
+        try:
+            ids = db.execute(
+                select(_orders.c.id).where(_orders.c.status.in_(STATUSES), _orders.c.order_date < since)
+                .order_by(_orders.c.id).limit(batch)
+            ).scalars().all()
+            if not ids:
+                break
+
+            columns = [c.name for c in _orders.columns]
+            db.execute(insert(_archived_orders).from_select(
+                columns + ["archived_at"],
+                select(*[_orders.c[name] for name in columns], literal(datetime.utcnow()))
+                .where(_orders.c.id.in_(ids))))
+            item_columns = [c.name for c in _items.columns]
+            items = db.execute(insert(_archived_items).from_select(
+                item_columns, select(*[_items.c[name] for name in item_columns]).where(_items.c.order_id.in_(ids))
+            )).rowcount
+            db.execute(delete(_items).where(_items.c.order_id.in_(ids)))
+            db.execute(delete(_orders).where(_orders.c.id.in_(ids)))
+            db.commit()
+        finally:
+            db.close()
+        moved_orders += len(ids)
+        moved_items += items
+        if progress:
+            progress(moved_orders, moved_items)
+    return {"before": before, "orders": moved_orders, "items": moved_items}
+
+
+# ==================== 查詢 ====================
+
+def watermark(db: Session) -> Optional[datetime]:
+    """最新一筆歸檔訂單的時間；沒有歸檔時為 None"""
+    return db.execute(select(func.max(_archived_orders.c.order_date))).scalar()
+
+
+def needs_archive(db: Session, start: Optional[date], end: Optional[date]) -> bool:
+    """指定了日期區間、且區間的起點早於歸檔水位時需要合併查詢歸檔表"""
+    if start is None and end is None:
+        return False
+    mark = watermark(db)
+    return mark is not None and (start is None or datetime.combine(start, datetime.min.time()) <= mark)
+
+
+def get(db: Session, order_id: int) -> Optional[ArchivedOrder]:
+    return db.query(ArchivedOrder).filter(ArchivedOrder.id == order_id).first()
+
+
+def list_orders(db: Session, start: Optional[date] = None, end: Optional[date] = None,
+                customer_id: Optional[int] = None, status: Optional[str] = None,
+                skip: int = 0, limit: int = 100, newest_first: bool = False) -> List:
+    """
+    按下單時間排序的訂單（熱表為 Order、歸檔為 ArchivedOrder，欄位相同），end 當天包含在內；
+    只有 needs_archive 時才查詢歸檔表：兩邊各取前 skip + limit 個鍵（可走 (customer_id, order_date) 等索引），
+    在 Python 合併後切出這一頁，再分別載入
+    """
+    def keys(model):
+        query = select(model.id, model.order_date)
+        if start is not None:
+            query = query.where(model.order_date >= datetime.combine(start, datetime.min.time()))
+        if end is not None:
+            query = query.where(model.order_date < datetime.combine(end + timedelta(days=1), datetime.min.time()))
+        if customer_id is not None:
+            query = query.where(model.customer_id == customer_id)
+        if status is not None:
+            query = query.where(model.status == status)
+        order = (model.order_date.desc(), model.id.desc()) if newest_first else (model.order_date, model.id)
+        return [(row.order_date, row.id, model) for row in db.execute(query.order_by(*order).limit(skip + limit))]
+
+    sources = [DBOrder] + ([ArchivedOrder] if needs_archive(db, start, end) else [])
+    merged = heapq.merge(*(keys(model) for model in sources), key=lambda k: (k[0], k[1]), reverse=newest_first)
+    page = list(itertools.islice(merged, skip, skip + limit))
+
+    loaded = {}
+    for model in sources:
+        ids = [order_id for _, order_id, source in page if source is model]
+        if ids:
+            for obj in db.query(model).filter(model.id.in_(ids)).options(selectinload(model.items)):
+                loaded[(model, obj.id)] = obj
+    return [loaded[(model, order_id)] for _, order_id, model in page]
+
+
+# ==================== 跨歸檔的統計 ====================
+
+def status_totals(db: Session) -> Dict[str, Tuple[int, float]]:
+    """全部訂單按狀態的 (訂單數, 金額)"""
+    totals: Dict[str, Tuple[int, float]] = {}
+    for order_model, _ in ORDER_SOURCES:
+        for status, count, amount in db.query(order_model.status, func.count(order_model.id),
+                                              func.coalesce(func.sum(order_model.total_amount), 0.0)) \
+                .group_by(order_model.status):
+            previous = totals.get(status, (0, 0.0))
+            totals[status] = (previous[0] + count, previous[1] + amount)
+    return totals
+
+
+def product_sales(db: Session) -> Dict[int, Tuple[int, float]]:
+    """已完成訂單按產品的 (銷量, 營收)"""
+    sales: Dict[int, Tuple[int, float]] = {}
+    for order_model, item_model in ORDER_SOURCES:
+        for product_id, quantity, revenue in db.query(item_model.product_id, func.sum(item_model.quantity),
+                                                      func.sum(item_model.subtotal)) \
+                .join(order_model, order_model.id == item_model.order_id) \
+                .filter(order_model.status == "completed", item_model.product_id.isnot(None)) \
+                .group_by(item_model.product_id):
+            previous = sales.get(product_id, (0, 0.0))
+            sales[product_id] = (previous[0] + (quantity or 0), previous[1] + (revenue or 0.0))
+    return sales
+
+
+def top_products(db: Session, limit: int = 5) -> List[Dict]:
+    sales = product_sales(db)
+    top = sorted(sales.items(), key=lambda kv: kv[1][1], reverse=True)[:limit]
+    names = dict(db.query(DBProduct.id, DBProduct.name).filter(DBProduct.id.in_([pid for pid, _ in top])))
+    return [{"product_name": names.get(pid), "quantity": quantity, "revenue": revenue}
+            for pid, (quantity, revenue) in top]
@@ -0,0 +1,193 @@
+"""
+讀取快取：單飛（single-flight）與過期重新驗證（stale-while-revalidate）
+昂貴的唯讀端點（報表、儀表板）以 (名稱, 參數) 為鍵快取計算結果：
+
+- TTL 內直接返回，不查數據庫；
+- TTL 過後以 validator 讀取資料版本（預設為同步版本，見 sync.head），沒有寫入時延長原結果；
+- 有寫入時，距上次確認仍有效不超過 max_stale 秒則先返回舊結果，由背景執行緒重新計算；
+- 沒有結果或舊結果過舊時，同一鍵的並發請求只有第一個執行計算，其餘等待並共用結果。
+  背景重新計算也登記為進行中的計算，之後的請求同樣等待它而不重複計算。
+
+計算失敗時所有等待者收到同一個例外，不寫入快取；背景重新計算失敗只記錄日誌，繼續返回舊結果。
+計算在自己的 Session 內進行，與請求的 Session 無關；設定唯讀副本時讀取已同步到該資料版本的副本（見 database.read_session）。
+每個 worker 行程各自快取。
+ERP_READ_CACHE=off 時每個請求直接計算（用於對照測試，見 benchmarks/bench_cache.py）。
+"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, NamedTuple, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+import sync
+from database import read_session
+from metrics import Counter, registry
+
+ENABLED = os.getenv("ERP_READ_CACHE", "on") != "off"
+TTL_SECONDS = float(os.getenv("ERP_READ_CACHE_TTL", "5"))
+MAX_STALE_SECONDS = float(os.getenv("ERP_READ_CACHE_MAX_STALE", "60"))
+REFRESH_WORKERS = int(os.getenv("ERP_READ_CACHE_WORKERS", "2"))
+
+logger = logging.getLogger(__name__)
+
+RESULTS = registry.register(Counter(
+    "erp_read_cache_requests_total",
+    "讀取快取結果（hit/revalidated/stale/miss/coalesced/refresh/refresh_error/bypass）", ("cache", "result")))
+
+Key = Tuple[Hashable, ...]
+
+
+class Entry(NamedTuple):
+    value: Any
+    token: Any          # 計算前讀取的資料版本
+    checked_at: float   # 最後一次確認結果有效的時間
+
+
+class Flight:
+    """進行中的計算；其他請求在 done 上等待"""
+    __slots__ = ("done", "value", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class ReadCache:
+    """單飛 + 過期重新驗證；validator 為 None 時只按時間判斷"""
+
+    def __init__(self, ttl: float = TTL_SECONDS, max_stale: float = MAX_STALE_SECONDS,
+                 validator: Optional[Callable[[], Any]] = sync.head, workers: int = REFRESH_WORKERS,
+                 enabled: bool = ENABLED):
+        self.enabled = enabled
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.validator = validator
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._entries: Dict[Key, Entry] = {}
+        self._flights: Dict[Key, Flight] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def get(self, name: str, compute: Callable[..., Any], *args: Hashable,
+            ttl: Optional[float] = None, max_stale: Optional[float] = None) -> Any:
+        """返回 compute(db, *args) 的結果；args 同時作為快取鍵的一部分"""
+        if not self.enabled:
+            RESULTS.inc((name, "bypass"))
+            db: Session = read_session()
+            try:
+                return compute(db, *args)
+            finally:
+                db.close()
+
+        key = (name,) + args
+        ttl = self.ttl if ttl is None else ttl
+        max_stale = self.max_stale if max_stale is None else max_stale
+
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+            if entry is not None:
+                now = time.monotonic()
+                if now - entry.checked_at < ttl:
+                    RESULTS.inc((name, "hit"))
+                    return entry.value
+                if self.validator is not None and self.validator() == entry.token:
+                    with self._lock:
+                        self._entries[key] = entry._replace(checked_at=now)
+                    RESULTS.inc((name, "revalidated"))
+                    return entry.value
+                if now - entry.checked_at < ttl + max_stale:
+                    self._refresh_later(key, entry, compute, args)
+                    RESULTS.inc((name, "stale"))
+                    return entry.value
+
+            flight, leader = self._join(key, entry)
+            if flight is not None:
+                break
+            # 判斷期間其他請求已寫入新結果，重新判斷
+
+        if leader:
+            RESULTS.inc((name, "miss"))
+            self._run(key, flight, compute, args)
+        else:
+            RESULTS.inc((name, "coalesced"))
+            flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.value
+
+    def invalidate(self, name: Optional[str] = None):
+        """清除指定名稱（或全部）的結果；進行中的計算不受影響"""
+        with self._lock:
+            if name is None:
+                self._entries.clear()
+            else:
+                for key in [k for k in self._entries if k[0] == name]:
+                    del self._entries[key]
+
+    def status(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._entries), "in_flight": len(self._flights)}
+
+    # ---------- 內部 ----------
+
+    def _join(self, key: Key, seen: Optional[Entry]) -> Tuple[Optional[Flight], bool]:
+        """
+        加入進行中的計算，或在結果仍是 seen 時登記新的計算，返回 (計算, 是否由自己執行)；
+        結果已被其他計算更新時返回 (None, False)，避免剛完成的計算被重複執行
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                return flight, False
+            if self._entries.get(key) is not seen:
+                return None, False
+            flight = self._flights[key] = Flight()
+            return flight, True
+
+    def _run(self, key: Key, flight: Flight, compute: Callable[..., Any], args: tuple):
+        try:
+            # 先讀版本再計算：計算期間提交的寫入會讓下次驗證失敗，而不是被當成已包含
+            token = self.validator() if self.validator is not None else None
+            # 副本落後於 token 時改讀主庫，結果不會比 token 舊
+            db: Session = read_session(token if isinstance(token, int) else 0)
+            try:
+                flight.value = compute(db, *args)
+            finally:
+                db.close()
+            with self._lock:
+                self._entries[key] = Entry(flight.value, token, time.monotonic())
+        except BaseException as exc:
+            flight.error = exc
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    def _refresh_later(self, key: Key, stale: Entry, compute: Callable[..., Any], args: tuple):
+        flight, leader = self._join(key, stale)
+        if not leader:
+            return
+        RESULTS.inc((key[0], "refresh"))
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="read-cache")
+            executor = self._executor
+        executor.submit(self._refresh, key, flight, compute, args)
+
+    def _refresh(self, key: Key, flight: Flight, compute: Callable[..., Any], args: tuple):
+        self._run(key, flight, compute, args)
+        if flight.error is not None:
+            RESULTS.inc((key[0], "refresh_error"))
+            logger.warning("背景重新計算 %s 失敗: %s", key, flight.error)
+
+
+cache = ReadCache()
+
+
+def get_cache() -> ReadCache:
+    return cache
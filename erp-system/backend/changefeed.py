@@ -0,0 +1,321 @@
+"""
+變更推送（Server-Sent Events）
+訂單與產品的寫入在提交後轉成精簡的增量事件，推送給 /api/events 的訂閱者，
+頁面只更新受影響的那一行或計數，不必重新載入整個列表：
+
+    order.created / order.status_changed / order.deleted
+    stock.changed / product.deleted
+    alert.raised / alert.cleared（庫存低於或回到最低庫存）
+    resync（無法逐筆描述的變更，或訂閱者落後太多，頁面需要重新載入）
+
+事件在 Session 的 after_flush 收集、after_commit 發佈，回滾的交易不會發出事件；
+API 與 ERPAgent 都經過 SessionLocal，兩條寫入路徑都會涵蓋。
+每個事件只編碼一次，所有訂閱者共用同一段位元組；最近的事件保留在緩衝區，斷線重連時依 Last-Event-ID 補發。
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import AsyncIterator, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from sqlalchemy import event, inspect
+
+from database import Order as DBOrder, Product as DBProduct, SessionLocal
+
+BUFFER_SIZE = int(os.getenv("ERP_CHANGEFEED_BUFFER", "2000"))  # 保留最近的事件數，供重連補發
+QUEUE_SIZE = int(os.getenv("ERP_CHANGEFEED_QUEUE", "1000"))  # 每個訂閱者最多積壓的事件數
+BULK_EVENTS = int(os.getenv("ERP_CHANGEFEED_BULK", "500"))  # set-based 寫入超過此筆數時改送 resync
+HEARTBEAT_SECONDS = 15.0
+
+# 事件類型前綴 → 訂閱主題
+TOPICS = {"order": "orders", "stock": "stock", "product": "stock", "alert": "alerts"}
+
+
+def _json_default(value):
+    # 日期以 ISO 8601 輸出，與 API 回應一致，瀏覽器的 Date 可以直接解析
+    return value.isoformat() if hasattr(value, "isoformat") else str(value)
+
+
+class Event(NamedTuple):
+    id: int
+    topic: Optional[str]  # None 表示所有訂閱者都會收到（resync）
+    frame: bytes  # 已編碼的 SSE 訊息
+
+
+class Subscriber:
+    """一條 SSE 連接；只在事件迴圈執行緒中存取"""
+
+    def __init__(self, topics: Optional[Set[str]], maxsize: int):
+        self.topics = topics
+        self.queue: "asyncio.Queue[Event]" = asyncio.Queue(maxsize)
+        self.overflowed = False
+
+    def wants(self, e: Event) -> bool:
+        return self.topics is None or e.topic is None or e.topic in self.topics
+
+    def offer(self, events: Iterable[Event]):
+        if self.overflowed:
+            return
+        for e in events:
+            if not self.wants(e):
+                continue
+            try:
+                self.queue.put_nowait(e)
+            except asyncio.QueueFull:
+                # 消費太慢：丟棄積壓，改送一個 resync
+                self.overflowed = True
+                return
+
+
+class ChangeFeed:
+    """事件序號、最近事件緩衝區與各事件迴圈上的訂閱者"""
+
+    def __init__(self, buffer_size: int = BUFFER_SIZE, queue_size: int = QUEUE_SIZE):
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._buffer: "deque[Event]" = deque(maxlen=buffer_size)
+        self._subscribers: Dict[asyncio.AbstractEventLoop, Set[Subscriber]] = {}
+        self.queue_size = queue_size
+        self.published = 0
+
+    def _frame(self, type_: str, data: dict, ts: float) -> Event:
+        self._seq += 1
+        payload = json.dumps({"id": self._seq, "type": type_, "ts": ts, "data": data},
+                             ensure_ascii=False, default=_json_default)
+        return Event(self._seq, TOPICS.get(type_.split(".")[0]), f"id: {self._seq}\ndata: {payload}\n\n".encode())
+
+    def publish(self, changes: List[Tuple[str, dict]]):
+        """發佈一個交易產生的事件；可在任何執行緒呼叫"""
+        if not changes:
+            return
+        now = time.time()
+        with self._lock:
+            events = [self._frame(type_, data, now) for type_, data in changes]
+            self._buffer.extend(events)
+            self.published += len(events)
+            targets = list(self._subscribers.items())
+        for loop, subscribers in targets:
+            try:
+                loop.call_soon_threadsafe(self._dispatch, subscribers, events)
+            except RuntimeError:  # 事件迴圈已關閉
+                with self._lock:
+                    self._subscribers.pop(loop, None)
+
+    @staticmethod
+    def _dispatch(subscribers: Set[Subscriber], events: List[Event]):
+        for subscriber in list(subscribers):
+            subscriber.offer(events)
+
+    def subscribe(self, topics: Optional[Set[str]] = None,
+                  last_event_id: Optional[int] = None) -> Tuple[Subscriber, List[Event], bool]:
+        """
+        在目前的事件迴圈上登記訂閱者；返回 (訂閱者, 需要補發的事件, 是否完整)。
+        登記與讀取緩衝區在同一把鎖內，之後發佈的事件一定會送進佇列，不會漏也不會重複
+        """
+        subscriber = Subscriber(topics, self.queue_size)
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self._subscribers.setdefault(loop, set()).add(subscriber)
+            if last_event_id is None:
+                return subscriber, [], True
+            oldest = self._buffer[0].id if self._buffer else self._seq + 1
+            complete = oldest - 1 <= last_event_id <= self._seq
+            backlog = [e for e in self._buffer if e.id > last_event_id and subscriber.wants(e)]
+        return subscriber, backlog if complete else [], complete
+
+    def unsubscribe(self, subscriber: Subscriber):
+        with self._lock:
+            for loop, subscribers in list(self._subscribers.items()):
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[loop]
+
+    def resync_frame(self, reason: str) -> bytes:
+        with self._lock:
+            seq = self._seq
+        payload = json.dumps({"id": seq, "type": "resync", "ts": time.time(), "data": {"reason": reason}},
+                             ensure_ascii=False)
+        return f"id: {seq}\ndata: {payload}\n\n".encode()
+
+    def status(self) -> Dict:
+        with self._lock:
+            return {"last_event_id": self._seq, "published": self.published, "buffered": len(self._buffer),
+                    "subscribers": sum(len(s) for s in self._subscribers.values())}
+
+
+feed = ChangeFeed()
+
+
+def get_feed() -> ChangeFeed:
+    return feed
+
+
+async def stream(topics: Optional[Set[str]] = None, last_event_id: Optional[int] = None) -> AsyncIterator[bytes]:
+    """SSE 回應內容；佇列中已有的事件合併成一次寫出，降低大量訂閱者時的系統呼叫次數"""
+    subscriber, backlog, complete = feed.subscribe(topics, last_event_id)
+    try:
+        yield b"retry: 3000\n\n"
+        if not complete:
+            yield feed.resync_frame("missed")
+        if backlog:
+            yield b"".join(e.frame for e in backlog)
+        while True:
+            try:
+                first = await asyncio.wait_for(subscriber.queue.get(), HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield b": keepalive\n\n"
+                continue
+            frames = [first.frame]
+            while not subscriber.queue.empty():
+                frames.append(subscriber.queue.get_nowait().frame)
+            if subscriber.overflowed:
+                while not subscriber.queue.empty():
+                    subscriber.queue.get_nowait()
+                subscriber.overflowed = False
+                frames = [feed.resync_frame("overflow")]
+            yield b"".join(frames)
+    finally:
+        feed.unsubscribe(subscriber)
+
+
+def record(session, type_: str, data: dict):
+    """set-based 寫入（不經過 flush）可在提交前手動加入事件"""
+    session.info.setdefault("changefeed_explicit", []).append((type_, data))
+
+
+def record_stock(session, product_id: int, sku: str, name: str, old_stock: int, stock: int, min_level: int):
+    """set-based 庫存調整的 stock.changed 與預警事件"""
+    base = {"product_id": product_id, "sku": sku, "name": name}
+    for type_, data in _stock_events(base, (old_stock, min_level), stock, min_level):
+        record(session, type_, data)
+
+
+def resync(session, table: str):
+    """變更太多、逐筆推送不划算時，提交後改送 resync"""
+    session.info.setdefault("changefeed_resync", set()).add(table)
+
+
+# ==================== 收集變更 ====================
+
+def _order_data(order: DBOrder) -> dict:
+    return {"id": order.id, "order_number": order.order_number, "customer_name": order.customer_name,
+            "order_date": order.order_date, "status": order.status, "total_amount": order.total_amount}
+
+
+def _old(obj, attr: str):
+    history = inspect(obj).attrs[attr].history
+    if history.deleted:
+        return history.deleted[0]
+    return getattr(obj, attr)
+
+
+def _low(stock: Optional[int], min_level: Optional[int]) -> bool:
+    # 與 /api/inventory/alerts 相同的判斷
+    return stock is not None and stock < (min_level or 0)
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _collect_changes(session, flush_context):
+    orders: Dict[int, list] = session.info.setdefault("changefeed_orders", {})
+    stock: Dict[int, dict] = session.info.setdefault("changefeed_stock", {})
+
+    for obj in session.new:
+        if isinstance(obj, DBOrder):
+            orders[obj.id] = ["order.created", None, _order_data(obj)]
+        elif isinstance(obj, DBProduct):
+            stock[obj.id] = {"old": (None, None), "product": obj}
+    for obj in session.dirty:
+        if isinstance(obj, DBOrder):
+            entry = orders.get(obj.id)
+            if entry is not None:
+                entry[2] = _order_data(obj)  # 同一交易內建立後又更新（例如先 flush 取 id 再寫總額）
+            elif inspect(obj).attrs.status.history.has_changes():
+                orders[obj.id] = ["order.status_changed", _old(obj, "status"), _order_data(obj)]
+        elif isinstance(obj, DBProduct) and obj.id not in stock:
+            state = inspect(obj).attrs
+            if state.stock_quantity.history.has_changes() or state.min_stock_level.history.has_changes():
+                stock[obj.id] = {"old": (_old(obj, "stock_quantity"), _old(obj, "min_stock_level")), "product": obj}
+    for obj in session.deleted:
+        if isinstance(obj, DBOrder):
+            entry = orders.pop(obj.id, None)
+            if entry is None or entry[0] != "order.created":
+                orders[obj.id] = ["order.deleted", None, _order_data(obj)]
+        elif isinstance(obj, DBProduct):
+            entry = stock.get(obj.id)
+            stock[obj.id] = {"old": entry["old"] if entry else (obj.stock_quantity, obj.min_stock_level),
+                             "product": obj, "deleted": True}
+
+
+@event.listens_for(SessionLocal, "do_orm_execute")
+def _on_bulk_write(state):
+    # 批量 update()/delete() 無法逐筆描述，提交後通知頁面重新載入
+    if (state.is_update or state.is_delete) and state.bind_mapper is not None \
+            and state.bind_mapper.class_ in (DBOrder, DBProduct):
+        state.session.info.setdefault("changefeed_resync", set()).add(state.bind_mapper.class_.__tablename__)
+
+
+def _build_events(orders: Dict[int, list], stock: Dict[int, dict]) -> List[Tuple[str, dict]]:
+    changes: List[Tuple[str, dict]] = []
+    for type_, old_status, data in orders.values():
+        if type_ == "order.status_changed":
+            if old_status == data["status"]:
+                continue
+            data = dict(data, old_status=old_status)
+        changes.append((type_, data))
+    for product_id, entry in stock.items():
+        product = entry["product"]
+        base = {"product_id": product_id, "sku": product.sku, "name": product.name}
+        changes += _stock_events(base, entry["old"], product.stock_quantity, product.min_stock_level,
+                                 entry.get("deleted", False))
+    return changes
+
+
+def _stock_events(base: dict, old: Tuple[Optional[int], Optional[int]], stock: Optional[int],
+                  min_level: Optional[int], deleted: bool = False) -> List[Tuple[str, dict]]:
+    old_stock, old_min = old
+    changes: List[Tuple[str, dict]] = []
+    if deleted:
+        changes.append(("product.deleted", base))
+    elif old_stock != stock or old_min != min_level:
+        changes.append(("stock.changed", dict(base, stock_quantity=stock, old_stock_quantity=old_stock,
+                                              min_stock_level=min_level)))
+    was_low = _low(old_stock, old_min)
+    is_low = not deleted and _low(stock, min_level)
+    if is_low and not was_low:
+        changes.append(("alert.raised", dict(base, current_stock=stock, min_stock_level=min_level,
+                                             shortage=min_level - stock)))
+    elif was_low and not is_low:
+        changes.append(("alert.cleared", base))
+    return changes
+
+
+def _discard(session):
+    for key in ("changefeed_orders", "changefeed_stock", "changefeed_resync", "changefeed_explicit"):
+        session.info.pop(key, None)
+
+
+@event.listens_for(SessionLocal, "before_commit")
+def _prepare_events(session):
+    # 提交後物件屬性會過期，事件內容在提交前（最後一次 flush 之後）組好
+    session.flush()
+    session.info["changefeed_ready"] = _build_events(session.info.get("changefeed_orders", {}),
+                                                     session.info.get("changefeed_stock", {}))
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _publish_changes(session):
+    changes = session.info.pop("changefeed_ready", [])
+    changes += session.info.get("changefeed_explicit", [])
+    tables = session.info.get("changefeed_resync")
+    _discard(session)
+    if tables:
+        changes.append(("resync", {"tables": sorted(tables)}))
+    feed.publish(changes)
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _discard_changes(session):
+    session.info.pop("changefeed_ready", None)
+    _discard(session)
@@ -0,0 +1,130 @@
+"""
+客戶主檔
+訂單上的客戶名稱、電郵、電話、地址去重成 customers 表，訂單以 customer_id 關聯。
+客戶以正規化名稱（name_key）識別；累計消費、訂單數與最近下單日只計已完成訂單，
+訂單狀態改變時以 (customer_id, order_date) 索引重算該客戶，不必掃描整個訂單表；統計包括已歸檔的訂單。
+"""
+import re
+import unicodedata
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from database import ORDER_SOURCES, Customer as DBCustomer, Order as DBOrder, upsert_insert
+
+_SPACES = re.compile(r"\s+")
+
+
+def name_key(name: Optional[str]) -> str:
+    """全形轉半形、合併空白、不分大小寫"""
+    return _SPACES.sub(" ", unicodedata.normalize("NFKC", name or "")).strip().casefold()
+
+
+# ==================== 建立與查找 ====================
+
+def get_or_create(db: Session, name: str, email: Optional[str] = None, phone: Optional[str] = None,
+                  address: Optional[str] = None) -> DBCustomer:
+    """按名稱查找客戶，不存在時建立；有新的聯絡資料時更新客戶主檔"""
+    key = name_key(name)
+    customer = db.query(DBCustomer).filter(DBCustomer.name_key == key).first()
+    if customer is None:
+        created = _insert(db, dict(name=name.strip(), name_key=key, email=email, phone=phone, address=address,
+                                   lifetime_value=0.0, order_count=0))
+        customer = db.query(DBCustomer).filter(DBCustomer.name_key == key).one()
+        if created:
+            return customer
+
+    for field, value in (("email", email), ("phone", phone), ("address", address)):
+        if value:
+            setattr(customer, field, value)
+    return customer
+
+
+def _insert(db: Session, values: Dict) -> bool:
+    """
+    寫入新客戶，返回是否由本交易建立。同名客戶的第一張訂單並發到達時，另一個交易可能已先建立，
+    以 INSERT ... ON CONFLICT DO NOTHING（不支援時在 SAVEPOINT 內捕捉唯一約束錯誤）略過，不讓整張訂單失敗
+    """
+    insert = upsert_insert(db)
+    if insert is not None:
+        stmt = insert(DBCustomer.__table__).values(**values).on_conflict_do_nothing(index_elements=["name_key"])
+        return db.execute(stmt).rowcount > 0
+    try:
+        with db.begin_nested():
+            db.add(DBCustomer(**values))
+        return True
+    except IntegrityError:
+        return False
+
+
+def find(db: Session, name: Optional[str] = None, email: Optional[str] = None,
+         prefix: bool = True, limit: int = 20) -> List[DBCustomer]:
+    """按名稱（完全相符優先，其次前綴）或電郵查找，都走索引"""
+    query = db.query(DBCustomer)
+    if email:
+        query = query.filter(DBCustomer.email == email.strip())
+    if name:
+        key = name_key(name)
+        exact = query.filter(DBCustomer.name_key == key).first()
+        if exact is not None or not prefix:
+            return [exact] if exact is not None else []
+        # name_key >= key AND name_key < key + U+FFFF 是索引上的範圍掃描
+        query = query.filter(DBCustomer.name_key >= key, DBCustomer.name_key < key + "\uffff") \
+            .order_by(DBCustomer.name_key)
+    return query.limit(limit).all()
+
+
+# ==================== 統計 ====================
+
+def _completed_stats(db: Session, ids: Optional[Iterable[int]] = None) -> Dict[int, Tuple[float, int, Optional[datetime]]]:
+    """已完成訂單按客戶的 (金額, 訂單數, 最近下單日)，包括已歸檔的訂單"""
+    stats: Dict[int, Tuple[float, int, Optional[datetime]]] = {}
+    for order_model, _ in ORDER_SOURCES:
+        query = db.query(order_model.customer_id, func.sum(order_model.total_amount), func.count(order_model.id),
+                         func.max(order_model.order_date)).filter(order_model.status == "completed")
+        query = query.filter(order_model.customer_id.in_(ids)) if ids is not None \
+            else query.filter(order_model.customer_id.isnot(None))
+        for cid, revenue, count, last in query.group_by(order_model.customer_id):
+            previous = stats.get(cid)
+            if previous is not None:
+                revenue = (revenue or 0.0) + (previous[0] or 0.0)
+                count += previous[1]
+                last = max(filter(None, (last, previous[2])), default=None)
+            stats[cid] = (revenue, count, last)
+    return stats
+
+
+def refresh_stats(db: Session, customer_ids: Iterable[Optional[int]]):
+    """重算指定客戶的累計消費、訂單數與最近下單日"""
+    ids = {cid for cid in customer_ids if cid is not None}
+    if not ids:
+        return
+    db.flush()
+    stats = _completed_stats(db, ids)
+
+    for customer in db.query(DBCustomer).filter(DBCustomer.id.in_(ids)):
+        revenue, count, last = stats.get(customer.id, (0.0, 0, None))
+        customer.lifetime_value = round(revenue or 0.0, 2)
+        customer.order_count = count
+        customer.last_order_date = last
+
+
+def on_status_change(db: Session, order: DBOrder, old_status: Optional[str], new_status: Optional[str]):
+    """訂單進入或離開 completed（new_status 為 None 表示刪除）時更新客戶統計；需在狀態寫入或刪除之後呼叫"""
+    if (old_status == "completed") != (new_status == "completed"):
+        refresh_stats(db, [order.customer_id])
+
+
+def rebuild_stats(db: Session):
+    """以一次 GROUP BY 重算全部客戶的統計"""
+    db.flush()
+    stats = _completed_stats(db)
+    mappings = []
+    for (cid,) in db.query(DBCustomer.id):
+        revenue, count, last = stats.get(cid, (0.0, 0, None))
+        mappings.append({"id": cid, "lifetime_value": round(revenue or 0.0, 2),
+                         "order_count": count, "last_order_date": last})
+    db.bulk_update_mappings(DBCustomer, mappings)
@@ -0,0 +1,73 @@
+"""
+儀表板數據
+首頁的計數（本月訂單、本月營收、待處理訂單、庫存預警）以一條聚合查詢取得，各子查詢都走索引
+（庫存預警比較兩欄，與 /api/inventory/alerts 相同需要掃描產品表），最近訂單按主鍵倒序取前 N 筆，
+不必下載整個訂單列表。
+
+序列化後的回應按 (月份, 筆數) 放在讀取快取（cache.py）：TTL 內直接返回，不查數據庫；
+TTL 過後只讀取同步版本，產品與訂單沒有寫入時沿用原結果。計數必須與版本一致，不返回過期結果，
+並發請求共用一次計算。ETag 由版本產生，客戶端帶 If-None-Match 時返回 304。
+"""
+import json
+import os
+from datetime import date, datetime
+from typing import NamedTuple, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+import cache
+from database import Order as DBOrder, Product as DBProduct, SyncState
+from models import Dashboard, DashboardOrder
+
+TTL_SECONDS = float(os.getenv("ERP_DASHBOARD_TTL", "5"))
+MAX_RECENT = 50
+
+
+def month_start(today: Optional[date] = None) -> date:
+    # 訂單時間以 UTC 寫入（見 Order.order_date 的預設值）
+    today = today or datetime.utcnow().date()
+    return today.replace(day=1)
+
+
+def compute(db: Session, recent: int = 10, month: Optional[date] = None) -> Dashboard:
+    """計數與最近訂單"""
+    month = month or month_start()
+    since = datetime.combine(month, datetime.min.time())
+    counters = select(
+        select(func.count(DBOrder.id)).where(DBOrder.order_date >= since).scalar_subquery(),
+        select(func.coalesce(func.sum(DBOrder.total_amount), 0.0))
+        .where(DBOrder.status == "completed", DBOrder.order_date >= since).scalar_subquery(),
+        select(func.count(DBOrder.id)).where(DBOrder.status == "pending").scalar_subquery(),
+        select(func.count(DBProduct.id))
+        .where(DBProduct.stock_quantity < DBProduct.min_stock_level).scalar_subquery(),
+        select(SyncState.version).where(SyncState.id == 1).scalar_subquery(),
+    )
+    month_orders, month_revenue, pending, alerts, version = db.execute(counters).one()
+
+    rows = db.execute(
+        select(DBOrder.id, DBOrder.order_number, DBOrder.customer_name, DBOrder.order_date,
+               DBOrder.status, DBOrder.total_amount)
+        .order_by(DBOrder.id.desc()).limit(recent)
+    ).all()
+    return Dashboard(
+        month_start=month, month_orders=month_orders, month_revenue=round(month_revenue, 2),
+        pending_orders=pending, stock_alerts=alerts, version=version or 0,
+        recent_orders=[DashboardOrder(**row._mapping) for row in rows],
+    )
+
+
+class Page(NamedTuple):
+    etag: str
+    body: bytes
+
+
+def render(db: Session, recent: int, month: date) -> Page:
+    data = compute(db, recent, month)
+    # 計數與版本來自同一條語句，以它回報的版本產生 ETag
+    body = json.dumps(data.model_dump(mode="json"), ensure_ascii=False).encode()
+    return Page(f'"dash-{data.version}-{month:%Y%m}-{recent}"', body)
+
+
+def get(recent: int = 10) -> Page:
+    return cache.get_cache().get("dashboard", render, recent, month_start(), ttl=TTL_SECONDS, max_stale=0)
@@ -1,15 +1,57 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, ForeignKey, Text
+from sqlalchemy import create_engine, event, inspect, select, update, Column, Integer, String, Float, Date, DateTime, ForeignKey, Text, UniqueConstraint, Index
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session, sessionmaker, relationship
+from contextlib import contextmanager
+from contextvars import ContextVar
 from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional
+import itertools
+import logging
+import os
 import random
+import time
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./erp_demo.db"
+# 可透過環境變數切換數據庫（例如性能測試使用臨時數據庫）
+SQLALCHEMY_DATABASE_URL = os.getenv("ERP_DATABASE_URL", "sqlite:///./erp_demo.db")
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# 唯讀副本（逗號分隔的連接字串，例如 sqlite:///./replica1.db 或 Postgres 的熱備庫）；未設定時全部讀寫都使用主庫
+REPLICA_URLS = [url.strip() for url in os.getenv("ERP_REPLICA_URLS", "").split(",") if url.strip()]
+# 副本同步版本的快取秒數：選擇副本時不必每次先查詢副本，版本只會增加，快取的舊值只會讓讀取多走主庫
+REPLICA_CHECK_SECONDS = float(os.getenv("ERP_REPLICA_CHECK_SECONDS", "1"))
+
+logger = logging.getLogger(__name__)
+
+
+def _create_engine(url: str):
+    return create_engine(url, connect_args={"check_same_thread": False} if url.startswith("sqlite") else {})
+
+
+engine = _create_engine(SQLALCHEMY_DATABASE_URL)
+replica_engines = [_create_engine(url) for url in REPLICA_URLS]
+
+
+class RoutingSession(Session):
+    """
+    讀寫分離的 Session：read_session() 建立的 Session 把查詢送到唯讀副本，其他 Session 只使用主庫。
+    flush、INSERT/UPDATE/DELETE、SELECT ... FOR UPDATE 與取得同步版本一律走主庫，
+    之後同一個 Session 的查詢也留在主庫，讀得到自己的寫入
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        info = self.info
+        if not info.get("replica_ok") or info.get("primary"):
+            return engine
+        if self._flushing or (clause is not None and (
+                clause.is_dml or getattr(clause, "_for_update_arg", None) is not None)):
+            info["primary"] = True
+            return engine
+        if "replica" not in info:
+            info["replica"] = _pick_replica(info.get("min_version", 0))
+        return info["replica"]
+
+
+SessionLocal = sessionmaker(class_=RoutingSession, autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 
@@ -26,15 +68,42 @@ class Product(Base):
     stock_quantity = Column(Integer, default=0)
     min_stock_level = Column(Integer, default=10)
     supplier = Column(String)  # 供應商
+    version = Column(Integer, default=0, index=True)  # 最後一次寫入的同步版本（見 sync_state）
+    updated_at = Column(DateTime, default=datetime.utcnow)
 
     order_items = relationship("OrderItem", back_populates="product")
 
 
+class Customer(Base):
+    """客戶主檔：訂單上的客戶資料去重後的維度表，統計欄位只計已完成訂單"""
+    __tablename__ = "customers"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, nullable=False)
+    name_key = Column(String, unique=True, index=True, nullable=False)  # 正規化名稱，用於查找與去重
+    email = Column(String, index=True)
+    phone = Column(String)
+    address = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    lifetime_value = Column(Float, default=0.0, index=True)  # 累計消費金額
+    order_count = Column(Integer, default=0)
+    last_order_date = Column(DateTime, index=True)
+
+    orders = relationship("Order", back_populates="customer")
+
+
 class Order(Base):
     __tablename__ = "orders"
+    __table_args__ = (
+        Index("ix_orders_customer_date", "customer_id", "order_date"),
+        Index("ix_orders_status_date", "status", "order_date"),
+        # id 不重用（SQLite 預設會重用已刪除的最大 id），已歸檔訂單的 id 不會被新訂單佔用
+        {"sqlite_autoincrement": True},
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     order_number = Column(String, unique=True, index=True)  # 訂單編號
+    customer_id = Column(Integer, ForeignKey("customers.id"))
     customer_name = Column(String, index=True)
     customer_email = Column(String)
     customer_phone = Column(String)
@@ -43,12 +112,20 @@ class Order(Base):
     status = Column(String, default="pending")  # pending, processing, completed, cancelled
     total_amount = Column(Float, default=0.0)
     notes = Column(Text)  # 備註
+    version = Column(Integer, default=0, index=True)  # 最後一次寫入的同步版本（見 sync_state）
+    updated_at = Column(DateTime, default=datetime.utcnow)
 
     items = relationship("OrderItem", back_populates="order", cascade="all, delete-orphan")
+    customer = relationship("Customer", back_populates="orders")
 
 
 class OrderItem(Base):
     __tablename__ = "order_items"
+    __table_args__ = (
+        Index("ix_order_items_order", "order_id"),
+        Index("ix_order_items_product_order", "product_id", "order_id"),
+        {"sqlite_autoincrement": True},
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     order_id = Column(Integer, ForeignKey("orders.id"))
@@ -62,440 +139,709 @@ class OrderItem(Base):
     product = relationship("Product", back_populates="order_items")
 
 
-def init_db():
-    Base.metadata.create_all(bind=engine)
+class SalesRollup(Base):
+    """銷售彙總：已完成訂單按時間桶（日/週/月）與維度預先累計"""
+    __tablename__ = "sales_rollups"
+    __table_args__ = (
+        UniqueConstraint("granularity", "dimension", "dimension_key", "bucket_start", name="uq_sales_rollup_bucket"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    granularity = Column(String, nullable=False)  # day, week, month
+    bucket_start = Column(Date, nullable=False)  # 桶的起始日（週從星期一開始）
+    dimension = Column(String, nullable=False)  # all, product, category, customer
+    dimension_key = Column(String, nullable=False, default="")
+    revenue = Column(Float, default=0.0)
+    order_count = Column(Integer, default=0)
+    units_sold = Column(Integer, default=0)
+
+
+class ArchivedOrder(Base):
+    """已歸檔的訂單（見 archive.py）：欄位與 orders 相同，保留原 id；只讀，不參與同步與變更推送"""
+    __tablename__ = "orders_archive"
+    __table_args__ = (
+        Index("ix_orders_archive_customer_date", "customer_id", "order_date"),
+        Index("ix_orders_archive_date", "order_date"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    order_number = Column(String)
+    customer_id = Column(Integer)
+    customer_name = Column(String)
+    customer_email = Column(String)
+    customer_phone = Column(String)
+    shipping_address = Column(Text)
+    order_date = Column(DateTime)
+    status = Column(String)
+    total_amount = Column(Float, default=0.0)
+    notes = Column(Text)
+    version = Column(Integer, default=0)
+    updated_at = Column(DateTime)
+    archived_at = Column(DateTime, default=datetime.utcnow)
+
+    items = relationship("ArchivedOrderItem", back_populates="order")
+
+
+class ArchivedOrderItem(Base):
+    __tablename__ = "order_items_archive"
+    __table_args__ = (
+        Index("ix_order_items_archive_order", "order_id"),
+        Index("ix_order_items_archive_product_order", "product_id", "order_id"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    order_id = Column(Integer, ForeignKey("orders_archive.id"))
+    product_id = Column(Integer)  # 不設外鍵：產品刪除後歸檔的明細不變
+    quantity = Column(Integer)
+    unit_price = Column(Float)
+    subtotal = Column(Float)
+    discount = Column(Float, default=0.0)
+
+    order = relationship("ArchivedOrder", back_populates="items")
+    product = relationship("Product", primaryjoin="foreign(ArchivedOrderItem.product_id) == Product.id",
+                           viewonly=True)
+
+
+# 全部訂單的來源：(訂單, 明細)；跨越歸檔的統計（報表、客戶統計、銷售彙總重算）逐一查詢後合併
+ORDER_SOURCES = ((Order, OrderItem), (ArchivedOrder, ArchivedOrderItem))
+
+
+class SyncState(Base):
+    """同步版本計數器（單行）：每個寫入產品或訂單的交易取得下一個版本號"""
+    __tablename__ = "sync_state"
+
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    pruned_version = Column(Integer, nullable=False, default=0)  # 此版本（含）之前的刪除記錄已清除
+
+
+class SyncTombstone(Base):
+    """已刪除的產品與訂單，供增量同步通知客戶端移除"""
+    __tablename__ = "sync_tombstones"
+    __table_args__ = (
+        Index("ix_sync_tombstones_version", "version"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    table_name = Column(String, nullable=False)  # products, orders
+    row_id = Column(Integer, nullable=False)
+    version = Column(Integer, nullable=False)
+    deleted_at = Column(DateTime, default=datetime.utcnow)
+
+
+class StockMovement(Base):
+    """庫存異動帳（只新增、不修改）；與改動庫存的寫入在同一個交易內寫入"""
+    __tablename__ = "stock_movements"
+    __table_args__ = (
+        Index("ix_stock_movements_version", "version"),
+        Index("ix_stock_movements_product_version", "product_id", "version"),
+        Index("ix_stock_movements_product_created", "product_id", "created_at"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    product_id = Column(Integer, nullable=False)  # 不設外鍵：產品刪除後帳目仍保留
+    change = Column(Integer, nullable=False)  # 正數入庫、負數出庫
+    reason = Column(String, nullable=False)  # initial, order, cancel, delete, restock, receipt, adjustment, product_deleted
+    order_id = Column(Integer)
+    reference = Column(String)  # 進貨單號等
+    version = Column(Integer, nullable=False)  # 交易的同步版本，即提交順序
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class StockSnapshot(Base):
+    """
+    某個同步版本時各產品的庫存；每次快照記下全部結存非零的產品，
+    時間點查詢只讀取一次快照加上之後的異動
+    """
+    __tablename__ = "stock_snapshots"
+    __table_args__ = (
+        Index("ux_stock_snapshots_version_product", "version", "product_id", unique=True),
+        Index("ix_stock_snapshots_taken", "taken_at", "version"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    product_id = Column(Integer, nullable=False)
+    quantity = Column(Integer, nullable=False)
+    version = Column(Integer, nullable=False)  # 已計入版本 ≤ version 的全部異動
+    taken_at = Column(DateTime, default=datetime.utcnow)
+
+
+def init_db(seed: Optional[int] = None):
+    """
+    建立或升級表結構並寫入初始數據（冪等）。
+    由 manage.py init-db 在啟動服務前執行一次；API 啟動時只做 schema_pending() 檢查
+    """
+    # 表結構由遷移建立與演進（見 migrations.py）
+    from migrations import upgrade
+    upgrade(engine)
 
-    # 添加初始數據
     db = SessionLocal()
+    try:
+        # 舊數據的客戶主檔與銷售彙總由遷移回填（見 migrations.py），manage.py migrate 升級得到相同的數據
+        seed_demo_data(db, seed=seed)
+    finally:
+        db.close()
+
 
-    # 檢查是否已有數據
-    if db.query(Product).count() == 0:
-        # 真實的產品數據 - 電腦及辦公用品類別
-        initial_products = [
-            # 筆記本電腦系列
-            Product(
-                name="Dell Latitude 5420 商務筆記本",
-                sku="NB-DELL-5420",
-                category="筆記本電腦",
-                description="14吋 FHD, Intel i5-1135G7, 8GB RAM, 256GB SSD, Windows 11 Pro",
-                price=7299.00,
-                cost=5800.00,
-                stock_quantity=45,
-                min_stock_level=15,
-                supplier="Dell 台灣"
-            ),
-            Product(
-                name="HP EliteBook 840 G8",
-                sku="NB-HP-840G8",
-                category="筆記本電腦",
-                description="14吋 FHD, Intel i7-1165G7, 16GB RAM, 512GB SSD, Windows 11 Pro",
-                price=9899.00,
-                cost=7900.00,
-                stock_quantity=32,
-                min_stock_level=10,
-                supplier="HP 台灣"
-            ),
-            Product(
-                name="Lenovo ThinkPad X1 Carbon Gen 9",
-                sku="NB-LEN-X1C9",
-                category="筆記本電腦",
-                description="14吋 WQHD, Intel i7-1185G7, 16GB RAM, 1TB SSD, 碳纖維機身",
-                price=12999.00,
-                cost=10200.00,
-                stock_quantity=18,
-                min_stock_level=8,
-                supplier="Lenovo 台灣"
-            ),
-            Product(
-                name="ASUS VivoBook 15",
-                sku="NB-ASUS-VB15",
-                category="筆記本電腦",
-                description="15.6吋 FHD, AMD Ryzen 5 5500U, 8GB RAM, 512GB SSD, 輕薄設計",
-                price=5499.00,
-                cost=4200.00,
-                stock_quantity=65,
-                min_stock_level=20,
-                supplier="華碩台灣"
-            ),
-
-            # 台式電腦系列
-            Product(
-                name="Dell OptiPlex 7090 Tower",
-                sku="PC-DELL-7090",
-                category="台式電腦",
-                description="Intel i7-11700, 16GB DDR4, 512GB SSD + 1TB HDD, Windows 11 Pro",
-                price=8599.00,
-                cost=6800.00,
-                stock_quantity=28,
-                min_stock_level=10,
-                supplier="Dell 台灣"
-            ),
-            Product(
-                name="HP ProDesk 600 G6 SFF",
-                sku="PC-HP-600G6",
-                category="台式電腦",
-                description="Intel i5-10500, 8GB DDR4, 256GB SSD, 小機殼設計",
-                price=6299.00,
-                cost=4900.00,
-                stock_quantity=38,
-                min_stock_level=12,
-                supplier="HP 台灣"
-            ),
-            Product(
-                name="Lenovo ThinkCentre M90a AIO",
-                sku="PC-LEN-M90A",
-                category="一體機",
-                description="23.8吋 FHD All-in-One, Intel i5-10500, 8GB RAM, 512GB SSD",
-                price=7899.00,
-                cost=6200.00,
-                stock_quantity=22,
-                min_stock_level=8,
-                supplier="Lenovo 台灣"
-            ),
-
-            # 顯示器系列
-            Product(
-                name="Dell UltraSharp U2722DE",
-                sku="MON-DELL-U27",
-                category="顯示器",
-                description="27吋 QHD IPS, USB-C, 高度可調, 防眩光",
-                price=4599.00,
-                cost=3500.00,
-                stock_quantity=85,
-                min_stock_level=25,
-                supplier="Dell 台灣"
-            ),
-            Product(
-                name="LG 27UP850-W 4K",
-                sku="MON-LG-27UP",
-                category="顯示器",
-                description="27吋 4K UHD IPS, HDR10, USB-C 96W 供電",
-                price=5299.00,
-                cost=4100.00,
-                stock_quantity=72,
-                min_stock_level=20,
-                supplier="LG 台灣"
-            ),
-            Product(
-                name="ASUS ProArt PA247CV",
-                sku="MON-ASUS-PA24",
-                category="顯示器",
-                description="23.8吋 FHD IPS, 100% sRGB, 專業色彩校準",
-                price=3299.00,
-                cost=2500.00,
-                stock_quantity=95,
-                min_stock_level=30,
-                supplier="華碩台灣"
-            ),
-            Product(
-                name="BenQ GW2485TC 護眼螢幕",
-                sku="MON-BENQ-GW24",
-                category="顯示器",
-                description="24吋 FHD IPS, 低藍光不閃屏, 內建喇叭",
-                price=2899.00,
-                cost=2200.00,
-                stock_quantity=110,
-                min_stock_level=35,
-                supplier="明基台灣"
-            ),
-
-            # 鍵盤系列
-            Product(
-                name="Logitech MX Keys 無線鍵盤",
-                sku="KB-LOG-MXK",
-                category="鍵盤",
-                description="背光無線鍵盤, 智能感應, 多設備切換, 可充電",
-                price=2499.00,
-                cost=1800.00,
-                stock_quantity=156,
-                min_stock_level=50,
-                supplier="羅技台灣"
-            ),
-            Product(
-                name="Keychron K2 機械鍵盤",
-                sku="KB-KEY-K2",
-                category="鍵盤",
-                description="無線/有線雙模, 青軸, RGB背光, Mac/Win兼容",
-                price=1899.00,
-                cost=1400.00,
-                stock_quantity=188,
-                min_stock_level=60,
-                supplier="Keychron"
-            ),
-            Product(
-                name="Microsoft 人體工學鍵盤",
-                sku="KB-MS-ERGO",
-                category="鍵盤",
-                description="分離式設計, 掌托, 減輕手腕壓力",
-                price=1599.00,
-                cost=1200.00,
-                stock_quantity=142,
-                min_stock_level=45,
-                supplier="微軟台灣"
-            ),
-            Product(
-                name="Dell KB216 有線鍵盤",
-                sku="KB-DELL-216",
-                category="鍵盤",
-                description="標準薄膜鍵盤, 防潑濺設計, 靜音按鍵",
-                price=399.00,
-                cost=280.00,
-                stock_quantity=245,
-                min_stock_level=80,
-                supplier="Dell 台灣"
-            ),
-
-            # 滑鼠系列
-            Product(
-                name="Logitech MX Master 3S",
-                sku="MS-LOG-MX3S",
-                category="滑鼠",
-                description="無線滑鼠, 8K DPI, 靜音點擊, 快速充電, 多設備",
-                price=1999.00,
-                cost=1500.00,
-                stock_quantity=198,
-                min_stock_level=65,
-                supplier="羅技台灣"
-            ),
-            Product(
-                name="Microsoft Surface 精準滑鼠",
-                sku="MS-MS-SURF",
-                category="滑鼠",
-                description="藍牙無線, 三設備切換, 符合人體工學",
-                price=1299.00,
-                cost=950.00,
-                stock_quantity=175,
-                min_stock_level=55,
-                supplier="微軟台灣"
-            ),
-            Product(
-                name="HP X3000 無線滑鼠",
-                sku="MS-HP-X3000",
-                category="滑鼠",
-                description="2.4GHz 無線, 1200 DPI, 節能設計",
-                price=299.00,
-                cost=200.00,
-                stock_quantity=285,
-                min_stock_level=95,
-                supplier="HP 台灣"
-            ),
-
-            # 打印機系列
-            Product(
-                name="HP LaserJet Pro M404n",
-                sku="PR-HP-M404",
-                category="打印機",
-                description="黑白雷射印表機, 38ppm, 網路列印, 雙面列印",
-                price=6599.00,
-                cost=5100.00,
-                stock_quantity=24,
-                min_stock_level=8,
-                supplier="HP 台灣"
-            ),
-            Product(
-                name="Canon PIXMA G6070",
-                sku="PR-CAN-G6070",
-                category="打印機",
-                description="大供墨多功能事務機, 彩色列印/掃描/影印, WiFi",
-                price=5299.00,
-                cost=4000.00,
-                stock_quantity=18,
-                min_stock_level=6,
-                supplier="Canon 台灣"
-            ),
-            Product(
-                name="Epson WorkForce WF-2950",
-                sku="PR-EP-WF2950",
-                category="打印機",
-                description="四合一彩色噴墨, WiFi Direct, 自動雙面列印",
-                price=3899.00,
-                cost=2900.00,
-                stock_quantity=32,
-                min_stock_level=10,
-                supplier="Epson 台灣"
-            ),
-            Product(
-                name="Brother DCP-L2550DW",
-                sku="PR-BR-L2550",
-                category="打印機",
-                description="黑白雷射多功能複合機, 34ppm, 雙面列印掃描",
-                price=4799.00,
-                cost=3600.00,
-                stock_quantity=21,
-                min_stock_level=7,
-                supplier="Brother 台灣"
-            ),
-
-            # 網路設備
-            Product(
-                name="TP-Link Archer AX73 路由器",
-                sku="NET-TPL-AX73",
-                category="網路設備",
-                description="Wi-Fi 6 雙頻路由器, AX5400, 5 GHz 4804Mbps",
-                price=2599.00,
-                cost=1900.00,
-                stock_quantity=68,
-                min_stock_level=22,
-                supplier="TP-Link 台灣"
-            ),
-            Product(
-                name="ASUS RT-AX86U Pro",
-                sku="NET-ASUS-AX86",
-                category="網路設備",
-                description="Wi-Fi 6 電競路由器, AX5700, AiMesh, 2.5G 網口",
-                price=5299.00,
-                cost=4100.00,
-                stock_quantity=42,
-                min_stock_level=15,
-                supplier="華碩台灣"
-            ),
-
-            # 辦公配件
-            Product(
-                name="WD My Passport 2TB 外接硬碟",
-                sku="ACC-WD-PP2TB",
-                category="儲存設備",
-                description="2.5吋 USB 3.2, 密碼保護, 自動備份軟體",
-                price=1899.00,
-                cost=1400.00,
-                stock_quantity=135,
-                min_stock_level=45,
-                supplier="威騰電子"
-            ),
-            Product(
-                name="Seagate Backup Plus 4TB",
-                sku="ACC-SG-BP4TB",
-                category="儲存設備",
-                description="桌上型外接硬碟, USB 3.0, 200GB 雲端儲存",
-                price=2899.00,
-                cost=2200.00,
-                stock_quantity=98,
-                min_stock_level=32,
-                supplier="希捷科技"
-            ),
-            Product(
-                name="Logitech C920 HD Pro 網路攝影機",
-                sku="ACC-LOG-C920",
-                category="視訊設備",
-                description="1080p Full HD, 自動對焦, 立體聲音訊, 視訊會議",
-                price=1599.00,
-                cost=1200.00,
-                stock_quantity=88,
-                min_stock_level=30,
-                supplier="羅技台灣"
-            ),
-            Product(
-                name="APC BX1000M UPS 不斷電系統",
-                sku="ACC-APC-BX1000",
-                category="電源設備",
-                description="1000VA/600W, 6個插座, AVR穩壓, LCD顯示",
-                price=3299.00,
-                cost=2500.00,
-                stock_quantity=45,
-                min_stock_level=15,
-                supplier="APC 台灣"
-            ),
-        ]
-        db.add_all(initial_products)
-        db.commit()
-
-        # 創建真實的客戶訂單數據
-        customers = [
-            {
-                "name": "台北科技股份有限公司",
-                "email": "purchasing@taipeitech.com.tw",
-                "phone": "02-2712-3456",
-                "address": "台北市信義區信義路五段7號15樓"
-            },
-            {
-                "name": "新竹軟體科技有限公司",
-                "email": "admin@hcsoftware.com.tw",
-                "phone": "03-5678-9012",
-                "address": "新竹市東區光復路二段101號8樓"
-            },
-            {
-                "name": "台中製造工業股份有限公司",
-                "email": "order@tcmanufacturing.com.tw",
-                "phone": "04-2358-7890",
-                "address": "台中市西屯區工業區一路88號"
-            },
-            {
-                "name": "高雄貿易企業有限公司",
-                "email": "info@khtrade.com.tw",
-                "phone": "07-3456-7890",
-                "address": "高雄市前鎮區中山四路100號3樓"
-            },
-            {
-                "name": "桃園電子科技股份有限公司",
-                "email": "contact@tyelectronics.com.tw",
-                "phone": "03-3345-6789",
-                "address": "桃園市中壢區中山東路四段525號"
-            },
-            {
-                "name": "台南精密工業有限公司",
-                "email": "sales@tnprecision.com.tw",
-                "phone": "06-2789-1234",
-                "address": "台南市永康區中正南路539號"
-            },
-        ]
-
-        # 創建過去三個月的訂單
-        products_list = db.query(Product).all()
-        base_date = datetime.now() - timedelta(days=90)
-
-        order_statuses = ["completed", "completed", "completed", "completed", "processing", "pending"]
-
-        for i in range(25):  # 創建25筆訂單
-            customer = random.choice(customers)
-            order_date = base_date + timedelta(days=random.randint(0, 90), hours=random.randint(0, 23))
-            status = random.choice(order_statuses)
-
-            order_num = f"ORD{(base_date.year % 100):02d}{order_date.month:02d}{(i+1):04d}"
-
-            order = Order(
-                order_number=order_num,
-                customer_name=customer["name"],
-                customer_email=customer["email"],
-                customer_phone=customer["phone"],
-                shipping_address=customer["address"],
-                order_date=order_date,
-                status=status,
-                notes=f"{'批量採購' if random.random() > 0.7 else '常規訂單'}"
-            )
-            db.add(order)
-            db.flush()
-
-            # 每個訂單添加1-5個商品
-            num_items = random.randint(1, 5)
-            selected_products = random.sample(products_list, num_items)
-            total = 0.0
-
-            for product in selected_products:
-                quantity = random.randint(1, 15)
-                discount = round(random.choice([0, 0, 0, 0.05, 0.1]), 2)  # 80% 沒折扣
-                unit_price = product.price
-                subtotal = round(unit_price * quantity * (1 - discount), 2)
-
-                order_item = OrderItem(
-                    order_id=order.id,
-                    product_id=product.id,
-                    quantity=quantity,
-                    unit_price=unit_price,
-                    subtotal=subtotal,
-                    discount=discount
-                )
-                db.add(order_item)
-                total += subtotal
-
-                # 如果訂單已完成，減少庫存
-                if status == "completed":
-                    product.stock_quantity -= quantity
-
-            order.total_amount = total
-
-        db.commit()
-
-    db.close()
+def schema_pending() -> List[str]:
+    """尚未套用的遷移版本；只讀取 schema_migrations，供 API 啟動時做就緒檢查"""
+    from migrations import pending_versions
+    return pending_versions(engine)
+
+
+def seed_demo_data(db, seed: Optional[int] = None) -> bool:
+    """
+    寫入示範用的產品、客戶與過去三個月的訂單；已有產品或訂單時不做任何事。
+    全部物件先在記憶體建好，最後一次 flush 批量寫入；與 API 下單一致，訂單建立即扣減庫存，且不超過現有庫存
+    """
+    if db.query(Product.id).first() is not None or db.query(Order.id).first() is not None:
+        return False
+    from customers import name_key, rebuild_stats
+    from rollups import rebuild_sales_rollups
+
+    rng = random.Random(seed)
+
+    # 真實的產品數據 - 電腦及辦公用品類別
+    initial_products = [
+        # 筆記本電腦系列
+        Product(
+            name="Dell Latitude 5420 商務筆記本",
+            sku="NB-DELL-5420",
+            category="筆記本電腦",
+            description="14吋 FHD, Intel i5-1135G7, 8GB RAM, 256GB SSD, Windows 11 Pro",
+            price=7299.00,
+            cost=5800.00,
+            stock_quantity=45,
+            min_stock_level=15,
+            supplier="Dell 台灣"
+        ),
+        Product(
+            name="HP EliteBook 840 G8",
+            sku="NB-HP-840G8",
+            category="筆記本電腦",
+            description="14吋 FHD, Intel i7-1165G7, 16GB RAM, 512GB SSD, Windows 11 Pro",
+            price=9899.00,
+            cost=7900.00,
+            stock_quantity=32,
+            min_stock_level=10,
+            supplier="HP 台灣"
+        ),
+        Product(
+            name="Lenovo ThinkPad X1 Carbon Gen 9",
+            sku="NB-LEN-X1C9",
+            category="筆記本電腦",
+            description="14吋 WQHD, Intel i7-1185G7, 16GB RAM, 1TB SSD, 碳纖維機身",
+            price=12999.00,
+            cost=10200.00,
+            stock_quantity=18,
+            min_stock_level=8,
+            supplier="Lenovo 台灣"
+        ),
+        Product(
+            name="ASUS VivoBook 15",
+            sku="NB-ASUS-VB15",
+            category="筆記本電腦",
+            description="15.6吋 FHD, AMD Ryzen 5 5500U, 8GB RAM, 512GB SSD, 輕薄設計",
+            price=5499.00,
+            cost=4200.00,
+            stock_quantity=65,
+            min_stock_level=20,
+            supplier="華碩台灣"
+        ),
+
+        # 台式電腦系列
+        Product(
+            name="Dell OptiPlex 7090 Tower",
+            sku="PC-DELL-7090",
+            category="台式電腦",
+            description="Intel i7-11700, 16GB DDR4, 512GB SSD + 1TB HDD, Windows 11 Pro",
+            price=8599.00,
+            cost=6800.00,
+            stock_quantity=28,
+            min_stock_level=10,
+            supplier="Dell 台灣"
+        ),
+        Product(
+            name="HP ProDesk 600 G6 SFF",
+            sku="PC-HP-600G6",
+            category="台式電腦",
+            description="Intel i5-10500, 8GB DDR4, 256GB SSD, 小機殼設計",
+            price=6299.00,
+            cost=4900.00,
+            stock_quantity=38,
+            min_stock_level=12,
+            supplier="HP 台灣"
+        ),
+        Product(
+            name="Lenovo ThinkCentre M90a AIO",
+            sku="PC-LEN-M90A",
+            category="一體機",
+            description="23.8吋 FHD All-in-One, Intel i5-10500, 8GB RAM, 512GB SSD",
+            price=7899.00,
+            cost=6200.00,
+            stock_quantity=22,
+            min_stock_level=8,
+            supplier="Lenovo 台灣"
+        ),
+
+        # 顯示器系列
+        Product(
+            name="Dell UltraSharp U2722DE",
+            sku="MON-DELL-U27",
+            category="顯示器",
+            description="27吋 QHD IPS, USB-C, 高度可調, 防眩光",
+            price=4599.00,
+            cost=3500.00,
+            stock_quantity=85,
+            min_stock_level=25,
+            supplier="Dell 台灣"
+        ),
+        Product(
+            name="LG 27UP850-W 4K",
+            sku="MON-LG-27UP",
+            category="顯示器",
+            description="27吋 4K UHD IPS, HDR10, USB-C 96W 供電",
+            price=5299.00,
+            cost=4100.00,
+            stock_quantity=72,
+            min_stock_level=20,
+            supplier="LG 台灣"
+        ),
+        Product(
+            name="ASUS ProArt PA247CV",
+            sku="MON-ASUS-PA24",
+            category="顯示器",
+            description="23.8吋 FHD IPS, 100% sRGB, 專業色彩校準",
+            price=3299.00,
+            cost=2500.00,
+            stock_quantity=95,
+            min_stock_level=30,
+            supplier="華碩台灣"
+        ),
+        Product(
+            name="BenQ GW2485TC 護眼螢幕",
+            sku="MON-BENQ-GW24",
+            category="顯示器",
+            description="24吋 FHD IPS, 低藍光不閃屏, 內建喇叭",
+            price=2899.00,
+            cost=2200.00,
+            stock_quantity=110,
+            min_stock_level=35,
+            supplier="明基台灣"
+        ),
+
+        # 鍵盤系列
+        Product(
+            name="Logitech MX Keys 無線鍵盤",
+            sku="KB-LOG-MXK",
+            category="鍵盤",
+            description="背光無線鍵盤, 智能感應, 多設備切換, 可充電",
+            price=2499.00,
+            cost=1800.00,
+            stock_quantity=156,
+            min_stock_level=50,
+            supplier="羅技台灣"
+        ),
+        Product(
+            name="Keychron K2 機械鍵盤",
+            sku="KB-KEY-K2",
+            category="鍵盤",
+            description="無線/有線雙模, 青軸, RGB背光, Mac/Win兼容",
+            price=1899.00,
+            cost=1400.00,
+            stock_quantity=188,
+            min_stock_level=60,
+            supplier="Keychron"
+        ),
+        Product(
+            name="Microsoft 人體工學鍵盤",
+            sku="KB-MS-ERGO",
+            category="鍵盤",
+            description="分離式設計, 掌托, 減輕手腕壓力",
+            price=1599.00,
+            cost=1200.00,
+            stock_quantity=142,
+            min_stock_level=45,
+            supplier="微軟台灣"
+        ),
+        Product(
+            name="Dell KB216 有線鍵盤",
+            sku="KB-DELL-216",
+            category="鍵盤",
+            description="標準薄膜鍵盤, 防潑濺設計, 靜音按鍵",
+            price=399.00,
+            cost=280.00,
+            stock_quantity=245,
+            min_stock_level=80,
+            supplier="Dell 台灣"
+        ),
+
+        # 滑鼠系列
+        Product(
+            name="Logitech MX Master 3S",
+            sku="MS-LOG-MX3S",
+            category="滑鼠",
+            description="無線滑鼠, 8K DPI, 靜音點擊, 快速充電, 多設備",
+            price=1999.00,
+            cost=1500.00,
+            stock_quantity=198,
+            min_stock_level=65,
+            supplier="羅技台灣"
+        ),
+        Product(
+            name="Microsoft Surface 精準滑鼠",
+            sku="MS-MS-SURF",
+            category="滑鼠",
+            description="藍牙無線, 三設備切換, 符合人體工學",
+            price=1299.00,
+            cost=950.00,
+            stock_quantity=175,
+            min_stock_level=55,
+            supplier="微軟台灣"
+        ),
+        Product(
+            name="HP X3000 無線滑鼠",
+            sku="MS-HP-X3000",
+            category="滑鼠",
+            description="2.4GHz 無線, 1200 DPI, 節能設計",
+            price=299.00,
+            cost=200.00,
+            stock_quantity=285,
+            min_stock_level=95,
+            supplier="HP 台灣"
+        ),
+
+        # 打印機系列
+        Product(
+            name="HP LaserJet Pro M404n",
+            sku="PR-HP-M404",
+            category="打印機",
+            description="黑白雷射印表機, 38ppm, 網路列印, 雙面列印",
+            price=6599.00,
+            cost=5100.00,
+            stock_quantity=24,
+            min_stock_level=8,
+            supplier="HP 台灣"
+        ),
+        Product(
+            name="Canon PIXMA G6070",
+            sku="PR-CAN-G6070",
+            category="打印機",
+            description="大供墨多功能事務機, 彩色列印/掃描/影印, WiFi",
+            price=5299.00,
+            cost=4000.00,
+            stock_quantity=18,
+            min_stock_level=6,
+            supplier="Canon 台灣"
+        ),
+        Product(
+            name="Epson WorkForce WF-2950",
+            sku="PR-EP-WF2950",
+            category="打印機",
+            description="四合一彩色噴墨, WiFi Direct, 自動雙面列印",
+            price=3899.00,
+            cost=2900.00,
+            stock_quantity=32,
+            min_stock_level=10,
+            supplier="Epson 台灣"
+        ),
+        Product(
+            name="Brother DCP-L2550DW",
+            sku="PR-BR-L2550",
+            category="打印機",
+            description="黑白雷射多功能複合機, 34ppm, 雙面列印掃描",
+            price=4799.00,
+            cost=3600.00,
+            stock_quantity=21,
+            min_stock_level=7,
+            supplier="Brother 台灣"
+        ),
+
+        # 網路設備
+        Product(
+            name="TP-Link Archer AX73 路由器",
+            sku="NET-TPL-AX73",
+            category="網路設備",
+            description="Wi-Fi 6 雙頻路由器, AX5400, 5 GHz 4804Mbps",
+            price=2599.00,
+            cost=1900.00,
+            stock_quantity=68,
+            min_stock_level=22,
+            supplier="TP-Link 台灣"
+        ),
+        Product(
+            name="ASUS RT-AX86U Pro",
+            sku="NET-ASUS-AX86",
+            category="網路設備",
+            description="Wi-Fi 6 電競路由器, AX5700, AiMesh, 2.5G 網口",
+            price=5299.00,
+            cost=4100.00,
+            stock_quantity=42,
+            min_stock_level=15,
+            supplier="華碩台灣"
+        ),
+
+        # 辦公配件
+        Product(
+            name="WD My Passport 2TB 外接硬碟",
+            sku="ACC-WD-PP2TB",
+            category="儲存設備",
+            description="2.5吋 USB 3.2, 密碼保護, 自動備份軟體",
+            price=1899.00,
+            cost=1400.00,
+            stock_quantity=135,
+            min_stock_level=45,
+            supplier="威騰電子"
+        ),
+        Product(
+            name="Seagate Backup Plus 4TB",
+            sku="ACC-SG-BP4TB",
+            category="儲存設備",
+            description="桌上型外接硬碟, USB 3.0, 200GB 雲端儲存",
+            price=2899.00,
+            cost=2200.00,
+            stock_quantity=98,
+            min_stock_level=32,
+            supplier="希捷科技"
+        ),
+        Product(
+            name="Logitech C920 HD Pro 網路攝影機",
+            sku="ACC-LOG-C920",
+            category="視訊設備",
+            description="1080p Full HD, 自動對焦, 立體聲音訊, 視訊會議",
+            price=1599.00,
+            cost=1200.00,
+            stock_quantity=88,
+            min_stock_level=30,
+            supplier="羅技台灣"
+        ),
+        Product(
+            name="APC BX1000M UPS 不斷電系統",
+            sku="ACC-APC-BX1000",
+            category="電源設備",
+            description="1000VA/600W, 6個插座, AVR穩壓, LCD顯示",
+            price=3299.00,
+            cost=2500.00,
+            stock_quantity=45,
+            min_stock_level=15,
+            supplier="APC 台灣"
+        ),
+    ]
+    db.add_all(initial_products)
+
+    # 創建真實的客戶數據
+    customers = [
+        {
+            "name": "台北科技股份有限公司",
+            "email": "purchasing@taipeitech.com.tw",
+            "phone": "02-2712-3456",
+            "address": "台北市信義區信義路五段7號15樓"
+        },
+        {
+            "name": "新竹軟體科技有限公司",
+            "email": "admin@hcsoftware.com.tw",
+            "phone": "03-5678-9012",
+            "address": "新竹市東區光復路二段101號8樓"
+        },
+        {
+            "name": "台中製造工業股份有限公司",
+            "email": "order@tcmanufacturing.com.tw",
+            "phone": "04-2358-7890",
+            "address": "台中市西屯區工業區一路88號"
+        },
+        {
+            "name": "高雄貿易企業有限公司",
+            "email": "info@khtrade.com.tw",
+            "phone": "07-3456-7890",
+            "address": "高雄市前鎮區中山四路100號3樓"
+        },
+        {
+            "name": "桃園電子科技股份有限公司",
+            "email": "contact@tyelectronics.com.tw",
+            "phone": "03-3345-6789",
+            "address": "桃園市中壢區中山東路四段525號"
+        },
+        {
+            "name": "台南精密工業有限公司",
+            "email": "sales@tnprecision.com.tw",
+            "phone": "06-2789-1234",
+            "address": "台南市永康區中正南路539號"
+        },
+    ]
+    db_customers = [
+        Customer(name=c["name"], name_key=name_key(c["name"]), email=c["email"], phone=c["phone"],
+                 address=c["address"], lifetime_value=0.0, order_count=0)
+        for c in customers
+    ]
+    db.add_all(db_customers)
+
+    # 創建過去三個月的訂單
+    base_date = datetime.now() - timedelta(days=90)
+    order_statuses = ["completed", "completed", "completed", "completed", "processing", "pending"]
+
+    for i in range(25):  # 創建25筆訂單
+        customer = rng.choice(db_customers)
+        order_date = base_date + timedelta(days=rng.randint(0, 90), hours=rng.randint(0, 23))
+        status = rng.choice(order_statuses)
+
+        order_num = f"ORD{(base_date.year % 100):02d}{order_date.month:02d}{(i+1):04d}"
+
+        order = Order(
+            order_number=order_num,
+            customer=customer,
+            customer_name=customer.name,
+            customer_email=customer.email,
+            customer_phone=customer.phone,
+            shipping_address=customer.address,
+            order_date=order_date,
+            status=status,
+            notes=f"{'批量採購' if rng.random() > 0.7 else '常規訂單'}"
+        )
+
+        # 每個訂單添加1-5個有庫存的商品
+        in_stock = [p for p in initial_products if p.stock_quantity > 0]
+        selected_products = rng.sample(in_stock, min(rng.randint(1, 5), len(in_stock)))
+        total = 0.0
+
+        for product in selected_products:
+            quantity = min(rng.randint(1, 15), product.stock_quantity)
+            discount = round(rng.choice([0, 0, 0, 0.05, 0.1]), 2)  # 80% 沒折扣
+            unit_price = product.price
+            subtotal = round(unit_price * quantity * (1 - discount), 2)
+
+            order.items.append(OrderItem(
+                product=product,
+                quantity=quantity,
+                unit_price=unit_price,
+                subtotal=subtotal,
+                discount=discount
+            ))
+            total += subtotal
+            product.stock_quantity -= quantity
+
+        order.total_amount = round(total, 2)
+        db.add(order)
+
+    # 一次寫入，再算客戶統計與銷售彙總
+    db.flush()
+    rebuild_stats(db)
+    rebuild_sales_rollups(db)
+    db.commit()
+    return True
+
+
+def order_number_for(order_id: int, when: Optional[datetime] = None) -> str:
+    """訂單編號：ORD + 年月 + 訂單 id。取自 flush 後的 id 而非訂單數，並發下單或刪除訂單後都不會重複"""
+    when = when or datetime.now()
+    return f"ORD{when.year % 100:02d}{when.month:02d}{order_id:04d}"
+
+
+def upsert_insert(db: Session):
+    """支援 INSERT ... ON CONFLICT 的數據庫返回對應的 insert 構造器，否則返回 None"""
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        return None
+    return insert
+
+
+# ==================== 同步版本 ====================
+
+def next_sync_version(conn) -> int:
+    """
+    遞增並返回同步版本。計數器的行鎖持有到交易提交，寫入交易依版本順序提交，
+    客戶端讀到版本 N 時，所有版本 ≤ N 的寫入都已可見
+    """
+    table = SyncState.__table__
+    conn.execute(update(table).where(table.c.id == 1).values(version=table.c.version + 1))
+    return conn.execute(select(table.c.version).where(table.c.id == 1)).scalar_one()
+
+
+def transaction_sync_version(session) -> int:
+    """本交易的同步版本，第一次取得時遞增；set-based 寫入（不經過 flush）需自行寫入 version 欄位"""
+    version = session.info.get("sync_version")
+    if version is None:
+        session.info["primary"] = True
+        version = session.info["sync_version"] = next_sync_version(session.connection())
+    return version
+
+
+@event.listens_for(SessionLocal, "before_flush")
+def _stamp_sync_versions(session, flush_context, instances):
+    # 同一交易內的多次 flush 共用一個版本
+    touched = [obj for obj in session.new if isinstance(obj, (Product, Order))]
+    touched += [obj for obj in session.dirty
+                if isinstance(obj, (Product, Order)) and session.is_modified(obj, include_collections=False)]
+    deleted = [obj for obj in session.deleted if isinstance(obj, (Product, Order))]
+    if not touched and not deleted:
+        return
+    version = transaction_sync_version(session)
+    now = datetime.utcnow()
+    for obj in touched:
+        obj.version = version
+        obj.updated_at = now
+    for obj in deleted:
+        session.add(SyncTombstone(table_name=obj.__tablename__, row_id=obj.id, version=version, deleted_at=now))
+    _record_stock_movements(session, version, now)
+
+
+def _record_stock_movements(session, version: int, now: datetime):
+    """
+    ORM 寫入的庫存變化記入異動帳，原因取自 session.info["stock_reason"]（見 stock.movement_reason），
+    未標記時記為 adjustment。新產品在 flush 後才有 id，先記下，flush 後一次寫入（見 _write_stock_movements）；
+    set-based 寫入（stock.py）自行寫入異動
+    """
+    reason, order_id, reference = session.info.get("stock_reason") or ("adjustment", None, None)
+    pending = session.info.setdefault("stock_movements", [])
+    for obj in session.new:
+        if isinstance(obj, Product) and obj.stock_quantity:
+            pending.append((obj, obj.stock_quantity, "initial", None, None, version, now))
+    products = Product.__table__
+    for obj in session.dirty:
+        if not isinstance(obj, Product):
+            continue
+        history = inspect(obj).attrs.stock_quantity.history
+        if not history.added:
+            continue
+        # 設定前未載入時沒有舊值，從數據庫讀取
+        old = history.deleted[0] if history.deleted else session.execute(
+            select(products.c.stock_quantity).where(products.c.id == obj.id)).scalar()
+        change = (history.added[0] or 0) - (old or 0)
+        if change:
+            pending.append((obj, change, reason, order_id, reference, version, now))
+    for obj in session.deleted:
+        if isinstance(obj, Product) and obj.stock_quantity:
+            pending.append((obj, -obj.stock_quantity, "product_deleted", None, None, version, now))
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _write_stock_movements(session, flush_context):
+    pending = session.info.pop("stock_movements", None)
+    if pending:
+        session.connection().execute(StockMovement.__table__.insert(), [
+            {"product_id": obj.id, "change": change, "reason": reason, "order_id": order_id,
+             "reference": reference, "version": version, "created_at": now}
+            for obj, change, reason, order_id, reference, version, now in pending
+        ])
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _remember_write(session):
+    writes = _write_tracker.get()
+    version = session.info.get("sync_version")
+    if writes is not None and version is not None and version > writes["version"]:
+        writes["version"] = version
+
+
+@event.listens_for(SessionLocal, "after_commit")
+@event.listens_for(SessionLocal, "after_rollback")
+def _reset_sync_version(session):
+    session.info.pop("sync_version", None)
+    session.info.pop("stock_reason", None)
+    session.info.pop("stock_movements", None)
 
 
 def get_db():
@@ -504,3 +850,99 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+# ==================== 讀寫分離 ====================
+# 副本以同步版本判斷是否已追上：版本 N 提交時，版本 ≤ N 的寫入都已提交（見 next_sync_version），
+# 副本的 sync_state 達到 N 即包含這些寫入。需要讀己之寫時以 min_version 指定，落後的副本改讀主庫；
+# 寫入方以 track_writes() 取得自己提交的版本（API 請求帶回 cookie，AI 助手記在自己的實例上），
+# 其他請求的寫入不影響副本的選擇。
+
+_write_tracker: ContextVar[Optional[Dict[str, int]]] = ContextVar("write_tracker", default=None)
+_replica_turn = itertools.count()
+_replica_versions: Dict[int, tuple] = {}  # 副本序號 -> (同步版本或 None, 查詢時間)
+
+
+@contextmanager
+def track_writes() -> Iterator[Dict[str, int]]:
+    """記錄這段期間（同一個請求、同一次工具調用）內提交的最大同步版本：writes["version"]，沒有寫入時為 0"""
+    writes = {"version": 0}
+    token = _write_tracker.set(writes)
+    try:
+        yield writes
+    finally:
+        _write_tracker.reset(token)
+
+
+def replica_version(replica) -> Optional[int]:
+    """副本的同步版本；無法連接時為 None"""
+    try:
+        with replica.connect() as conn:
+            return conn.execute(select(SyncState.version).where(SyncState.id == 1)).scalar() or 0
+    except SQLAlchemyError as e:
+        logger.warning("唯讀副本 %s 無法使用: %s", replica.url, e)
+        return None
+
+
+def _cached_replica_version(index: int) -> Optional[int]:
+    """副本的同步版本，REPLICA_CHECK_SECONDS 內沿用上次查詢的結果"""
+    now = time.monotonic()
+    cached = _replica_versions.get(index)
+    if cached is None or now - cached[1] >= REPLICA_CHECK_SECONDS:
+        cached = _replica_versions[index] = (replica_version(replica_engines[index]), now)
+    return cached[0]
+
+
+def _replica_failed(index: int):
+    """副本的連接出錯時標記為無法使用，REPLICA_CHECK_SECONDS 之後再重新查詢"""
+    def handle_error(context):
+        if context.is_disconnect or context.connection is None:
+            _replica_versions[index] = (None, time.monotonic())
+    return handle_error
+
+
+for _index, _replica in enumerate(replica_engines):
+    event.listen(_replica, "handle_error", _replica_failed(_index))
+
+
+def _pick_replica(min_version: int):
+    """輪流選擇副本，跳過無法連接或尚未同步到 min_version 的副本；都不符合時使用主庫"""
+    if not replica_engines:
+        return engine
+    turn = next(_replica_turn)
+    for i in range(len(replica_engines)):
+        index = (turn + i) % len(replica_engines)
+        version = _cached_replica_version(index)
+        if version is not None and version >= min_version:
+            return replica_engines[index]
+    return engine
+
+
+def read_session(min_version: int = 0) -> Session:
+    """
+    唯讀查詢用的 Session：有副本時讀取已同步到 min_version 的副本，否則同 SessionLocal。
+    不應用於寫入；真有寫入時會改走主庫，但寫入之前讀到的可能是副本上較舊的數據
+    """
+    return SessionLocal(info={"replica_ok": True, "min_version": min_version})
+
+
+def get_read_db(min_version: int = 0):
+    db = read_session(min_version)
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def replica_status() -> List[Dict]:
+    """各副本的同步版本與落後主庫的版本數（無法連接時為 None）"""
+    if not replica_engines:
+        return []
+    with engine.connect() as conn:
+        head = conn.execute(select(SyncState.version).where(SyncState.id == 1)).scalar() or 0
+    status = []
+    for i, replica in enumerate(replica_engines):
+        version = replica_version(replica)
+        _replica_versions[i] = (version, time.monotonic())
+        status.append({"replica": i, "version": version, "lag": None if version is None else max(head - version, 0)})
+    return status
@@ -0,0 +1,331 @@
+"""
+合成數據產生器
+為性能與負載測試產生大量產品、客戶、訂單與明細：產品熱度與客戶回購服從 Zipf 分佈，
+下單日期帶年度季節性、週末低谷與逐年成長，訂單狀態按設定比例抽樣。
+
+訂單按固定大小分塊，每塊使用由種子派生的獨立隨機序列，在子行程中產生後以 Core executemany 寫入並各自提交。
+同一組參數（種子、數量、結束日期、分塊大小）產生完全相同的數據，與 worker 數無關。
+SQLite 只允許單一寫入者，子行程只負責產生數據，由主行程依序寫入；其他數據庫由子行程各自寫入。
+SQLite 上寫入才是瓶頸，傳回數據的序列化開銷大於平行產生的收益，因此預設只用主行程。
+
+用法：python manage.py generate --orders 1000000 --seed 42 --workers 4
+"""
+import os
+import time
+from datetime import date, datetime, timedelta
+from multiprocessing import get_context
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.engine import Engine
+
+from database import (Customer, Order, OrderItem, Product, SessionLocal, StockMovement, engine as default_engine,
+                      next_sync_version)
+
+# 類別 → (價格中位數, 供應商)
+CATEGORIES = {
+    "筆記本電腦": (42000, ["Lenovo 台灣", "Dell 台灣", "HP 台灣", "華碩台灣"]),
+    "台式電腦": (32000, ["Dell 台灣", "HP 台灣", "華碩台灣"]),
+    "一體機": (38000, ["HP 台灣", "Lenovo 台灣"]),
+    "顯示器": (8500, ["Dell 台灣", "LG 台灣", "明基台灣", "華碩台灣"]),
+    "鍵盤": (2200, ["羅技台灣", "Keychron", "微軟台灣"]),
+    "滑鼠": (1200, ["羅技台灣", "微軟台灣"]),
+    "打印機": (9800, ["HP 台灣", "Epson 台灣", "Canon 台灣", "Brother 台灣"]),
+    "網路設備": (3500, ["TP-Link 台灣", "華碩台灣"]),
+    "儲存設備": (2600, ["威騰電子", "希捷科技"]),
+    "視訊設備": (1800, ["羅技台灣"]),
+    "電源設備": (4200, ["APC 台灣"]),
+}
+CITIES = ["台北", "新北", "桃園", "新竹", "台中", "台南", "高雄", "基隆", "嘉義", "宜蘭"]
+BRANDS = ["宏達", "永豐", "聯合", "大同", "信義", "華新", "中興", "東元", "光明", "金鼎", "長榮", "新世紀"]
+INDUSTRIES = ["科技", "貿易", "設計", "顧問", "電子", "物流", "建設", "醫療", "教育", "餐飲"]
+FORMS = ["股份有限公司", "有限公司", "企業社", "工作室"]
+
+STATUS_MIX = {"completed": 0.72, "processing": 0.08, "pending": 0.08, "cancelled": 0.12}
+DISCOUNTS = np.array([0.0, 0.03, 0.05, 0.10, 0.15, 0.20])
+DISCOUNT_WEIGHTS = np.array([0.70, 0.08, 0.10, 0.07, 0.03, 0.02])
+
+DEFAULT_CHUNK_SIZE = 20_000  # 每塊訂單數；也是每次提交的單位
+
+
+class Plan(NamedTuple):
+    """子行程產生訂單所需的全部輸入（固定後輸出即固定）"""
+    seed: int
+    chunk_size: int
+    n_orders: int
+    first_order_id: int
+    product_ids: np.ndarray   # 按熱度排序
+    product_prices: np.ndarray
+    product_cdf: np.ndarray
+    customers: List[Tuple[int, str, str, str, str]]  # (id, 名稱, email, 電話, 地址)，按活躍度排序
+    customer_cdf: np.ndarray
+    start: date
+    day_cdf: np.ndarray
+    statuses: List[str]
+    status_cdf: np.ndarray
+    max_items: int
+
+
+def zipf_cdf(n: int, exponent: float) -> np.ndarray:
+    """排名 1..n 的 Zipf 累積分佈（有限 n，任何指數都可用）"""
+    weights = 1.0 / np.arange(1, n + 1, dtype=np.float64) ** exponent
+    cdf = np.cumsum(weights)
+    return cdf / cdf[-1]
+
+
+def day_weights(start: date, days: int, amplitude: float = 0.35, growth: float = 0.15) -> np.ndarray:
+    """
+    每天的相對下單量：以 11 月底為高峰、夏季為低谷的年度週期，
+    週末約為平日的一半，並按年成長 growth
+    """
+    offsets = np.arange(days)
+    ordinal = start.toordinal() + offsets
+    day_of_year = (ordinal - date(start.year, 1, 1).toordinal()) % 365.25
+    seasonal = 1.0 + amplitude * np.cos(2 * np.pi * (day_of_year - 330) / 365.25)
+    weekday = (ordinal - 1) % 7  # date.fromordinal(1) 是星期一
+    weekly = np.where(weekday >= 5, 0.5, 1.0)
+    trend = (1.0 + growth) ** (offsets / 365.25)
+    return seasonal * weekly * trend
+
+
+def _sample(rng: np.random.Generator, cdf: np.ndarray, size: int) -> np.ndarray:
+    return np.minimum(np.searchsorted(cdf, rng.random(size), side="right"), len(cdf) - 1)
+
+
+# ==================== 產品與客戶 ====================
+
+def _products(rng: np.random.Generator, n: int, first_id: int) -> List[Dict]:
+    names = list(CATEGORIES)
+    category = rng.integers(0, len(names), n)
+    scale = rng.lognormal(0.0, 0.35, n)
+    stock = rng.integers(0, 500, n)
+    rows = []
+    for i in range(n):
+        pid = first_id + i
+        cat = names[category[i]]
+        median, suppliers = CATEGORIES[cat]
+        supplier = suppliers[(pid * 7) % len(suppliers)]
+        price = round(float(median * scale[i]), 0)
+        rows.append({
+            "id": pid, "name": f"{supplier.split()[0]} {cat} LT-{pid:07d}", "sku": f"LT-{pid:07d}",
+            "category": cat, "description": f"負載測試產品（{cat}）", "price": price,
+            "cost": round(price * float(rng.uniform(0.6, 0.85)), 0), "stock_quantity": int(stock[i]),
+            "min_stock_level": int(10 + stock[i] // 10), "supplier": supplier,
+        })
+    return rows
+
+
+def _customers(rng: np.random.Generator, n: int, first_id: int, created_at: datetime) -> List[Dict]:
+    from customers import name_key
+
+    picks = rng.integers(0, [len(CITIES), len(BRANDS), len(INDUSTRIES), len(FORMS)], (n, 4))
+    rows = []
+    for i in range(n):
+        cid = first_id + i
+        city, brand, industry, form = (CITIES[picks[i, 0]], BRANDS[picks[i, 1]],
+                                       INDUSTRIES[picks[i, 2]], FORMS[picks[i, 3]])
+        name = f"{city}{brand}{industry}{form} {cid:06d}"
+        rows.append({
+            "id": cid, "name": name, "name_key": name_key(name), "email": f"contact{cid:06d}@example.com.tw",
+            "phone": f"09{int(rng.integers(0, 10 ** 8)):08d}", "address": f"{city}市測試路 {cid % 500 + 1} 號",
+            "created_at": created_at, "lifetime_value": 0.0, "order_count": 0,
+        })
+    return rows
+
+
+# ==================== 訂單（子行程） ====================
+
+_PLAN: Optional[Plan] = None
+
+
+def _init_worker(plan: Plan, write: bool):
+    global _PLAN
+    _PLAN = plan
+    if write:
+        # fork 繼承的連接不能跨行程共用
+        default_engine.dispose(close=False)
+
+
+def order_chunk(plan: Plan, index: int) -> Tuple[List[Dict], List[Dict]]:
+    """產生第 index 塊訂單與明細；只依賴 plan 與 index"""
+    rng = np.random.default_rng([plan.seed, 1, index])
+    lo = index * plan.chunk_size
+    n = min(plan.chunk_size, plan.n_orders - lo)
+    order_ids = np.arange(plan.first_order_id + lo, plan.first_order_id + lo + n)
+
+    days = _sample(rng, plan.day_cdf, n)
+    seconds = rng.integers(9 * 3600, 21 * 3600, n)  # 營業時間內下單
+    customer = _sample(rng, plan.customer_cdf, n)
+    status = _sample(rng, plan.status_cdf, n)
+
+    # 每張訂單 1..max_items 個明細，同一訂單內產品不重複（重複的併為一行）
+    counts = np.minimum(1 + rng.poisson(1.6, n), plan.max_items)
+    item_order = np.repeat(np.arange(n), counts)
+    product = _sample(rng, plan.product_cdf, len(item_order))
+    _, first = np.unique(item_order.astype(np.int64) * len(plan.product_ids) + product, return_index=True)
+    item_order, product = item_order[first], product[first]
+    quantity = np.minimum(rng.geometric(0.45, len(item_order)), 50)
+    discount = DISCOUNTS[_sample(rng, np.cumsum(DISCOUNT_WEIGHTS) / DISCOUNT_WEIGHTS.sum(), len(item_order))]
+    unit_price = plan.product_prices[product]
+    subtotal = np.round(unit_price * quantity * (1 - discount), 2)
+    totals = np.round(np.bincount(item_order, weights=subtotal, minlength=n), 2)
+
+    start = datetime.combine(plan.start, datetime.min.time())
+    orders = []
+    for i in range(n):
+        cid, name, email, phone, address = plan.customers[customer[i]]
+        oid = int(order_ids[i])
+        orders.append({
+            "id": oid, "order_number": f"LT{oid:010d}", "customer_id": cid, "customer_name": name,
+            "customer_email": email, "customer_phone": phone, "shipping_address": address,
+            "order_date": start + timedelta(days=int(days[i]), seconds=int(seconds[i])),
+            "status": plan.statuses[status[i]], "total_amount": float(totals[i]), "notes": None,
+        })
+    items = [
+        {"order_id": int(order_ids[o]), "product_id": int(plan.product_ids[p]), "quantity": int(q),
+         "unit_price": float(u), "subtotal": float(s), "discount": float(d)}
+        for o, p, q, u, s, d in zip(item_order, product, quantity, unit_price, subtotal, discount)
+    ]
+    return orders, items
+
+
+def write_chunk(conn, orders: List[Dict], items: List[Dict]):
+    # 每塊是一個交易，取得自己的同步版本，增量同步的客戶端可以看到新訂單
+    version = next_sync_version(conn)
+    for row in orders:
+        row["version"] = version
+    conn.execute(Order.__table__.insert(), orders)
+    conn.execute(OrderItem.__table__.insert(), items)
+
+
+def _generate_task(index: int) -> Tuple[List[Dict], List[Dict]]:
+    return order_chunk(_PLAN, index)
+
+
+def _write_task(index: int) -> Tuple[int, int]:
+    orders, items = order_chunk(_PLAN, index)
+    with default_engine.begin() as conn:
+        write_chunk(conn, orders, items)
+    return len(orders), len(items)
+
+
+# ==================== 入口 ====================
+
+def generate(orders: int, products: int = 2000, customers: int = 20000, seed: int = 42,
+             days: int = 730, end: Optional[date] = None, workers: Optional[int] = None,
+             chunk_size: int = DEFAULT_CHUNK_SIZE, product_skew: float = 1.1, customer_skew: float = 0.9,
+             status_mix: Optional[Dict[str, float]] = None, max_items: int = 6,
+             rebuild: bool = True, engine: Engine = default_engine, progress=None) -> Dict:
+    """
+    在現有數據之後追加合成數據（id 接續現有最大值），返回各表筆數與耗時。
+    rebuild 為 True 時最後重算銷售彙總與客戶統計；寫入不經過 SessionLocal，
+    同一行程內已建立的分析快照會被標記過期，產品搜尋索引需要呼叫端自行 rebuild()
+    """
+    timings: Dict[str, float] = {}
+    started = time.perf_counter()
+    end = end or date.today()
+    start = end - timedelta(days=days - 1)
+    mix = status_mix or STATUS_MIX
+    if workers is None:
+        workers = 1 if engine.dialect.name == "sqlite" else os.cpu_count() or 1
+
+    with engine.connect() as conn:
+        def next_id(model) -> int:
+            return (conn.execute(select(func.max(model.id))).scalar() or 0) + 1
+        first_product, first_customer, first_order = next_id(Product), next_id(Customer), next_id(Order)
+
+    # 產品與客戶數量相對較少，在主行程一次寫入
+    product_rows = _products(np.random.default_rng([seed, 0, 0]), products, first_product)
+    customer_rows = _customers(np.random.default_rng([seed, 0, 1]), customers, first_customer,
+                               datetime.combine(start, datetime.min.time()))
+    with engine.begin() as conn:
+        version = next_sync_version(conn)
+        for row in product_rows:
+            row["version"] = version
+        conn.execute(Product.__table__.insert(), product_rows)
+        # Core 寫入不經過 flush，期初庫存自行記入異動帳
+        conn.execute(StockMovement.__table__.insert(), [
+            {"product_id": row["id"], "change": row["stock_quantity"], "reason": "initial", "version": version}
+            for row in product_rows if row["stock_quantity"]
+        ])
+        conn.execute(Customer.__table__.insert(), customer_rows)
+    timings["products_customers"] = time.perf_counter() - started
+
+    # 熱度與 id 無關：隨機排列後按排名套用 Zipf
+    rng = np.random.default_rng([seed, 0, 2])
+    per_day = day_weights(start, days)
+    product_order = rng.permutation(products)
+    customer_order = rng.permutation(customers)
+    plan = Plan(
+        seed=seed, chunk_size=chunk_size, n_orders=orders, first_order_id=first_order,
+        product_ids=np.array([product_rows[i]["id"] for i in product_order]),
+        product_prices=np.array([product_rows[i]["price"] for i in product_order]),
+        product_cdf=zipf_cdf(products, product_skew),
+        customers=[(c["id"], c["name"], c["email"], c["phone"], c["address"])
+                   for c in (customer_rows[i] for i in customer_order)],
+        customer_cdf=zipf_cdf(customers, customer_skew),
+        start=start, day_cdf=np.cumsum(per_day) / per_day.sum(),
+        statuses=list(mix), status_cdf=np.cumsum(list(mix.values())) / sum(mix.values()),
+        max_items=max_items,
+    )
+
+    phase = time.perf_counter()
+    chunks = (orders + chunk_size - 1) // chunk_size
+    write_in_workers = engine.dialect.name != "sqlite" and engine is default_engine
+    written_orders = written_items = 0
+
+    def report(done: int):
+        if progress:
+            progress(done, chunks, written_orders, written_items)
+
+    if workers <= 1:
+        for index in range(chunks):
+            order_rows, item_rows = order_chunk(plan, index)
+            with engine.begin() as conn:
+                write_chunk(conn, order_rows, item_rows)
+            written_orders += len(order_rows)
+            written_items += len(item_rows)
+            report(index + 1)
+    else:
+        with get_context("spawn").Pool(workers, initializer=_init_worker,
+                                       initargs=(plan, write_in_workers)) as pool:
+            if write_in_workers:
+                for done, (n_orders, n_items) in enumerate(pool.imap_unordered(_write_task, range(chunks)), 1):
+                    written_orders += n_orders
+                    written_items += n_items
+                    report(done)
+            else:
+                # imap 保持分塊順序，明細的自增 id 也因此固定
+                for done, (order_rows, item_rows) in enumerate(pool.imap(_generate_task, range(chunks)), 1):
+                    with engine.begin() as conn:
+                        write_chunk(conn, order_rows, item_rows)
+                    written_orders += len(order_rows)
+                    written_items += len(item_rows)
+                    report(done)
+    timings["orders"] = time.perf_counter() - phase
+
+    if rebuild:
+        phase = time.perf_counter()
+        from customers import rebuild_stats
+        from rollups import rebuild_sales_rollups
+
+        db = SessionLocal(bind=engine)
+        try:
+            rebuild_sales_rollups(db)
+            rebuild_stats(db)
+            db.commit()
+        finally:
+            db.close()
+        timings["rebuild"] = time.perf_counter() - phase
+
+    if engine.dialect.name == "sqlite":
+        with engine.begin() as conn:
+            conn.exec_driver_sql("ANALYZE")
+
+    from analytics import mark_stale
+    mark_stale()
+
+    timings["total"] = time.perf_counter() - started
+    return {"products": products, "customers": customers, "orders": written_orders, "order_items": written_items,
+            "start": start.isoformat(), "end": end.isoformat(), "seconds": {k: round(v, 2) for k, v in timings.items()}}
@@ -5,17 +5,40 @@ LLM-based ERP AI Agent using Ollama
 import json
 import requests
 from typing import List, Dict, Any, Optional
-from database import SessionLocal, Product as DBProduct, Order as DBOrder, OrderItem as DBOrderItem
-from datetime import datetime
+from database import engine, replica_engines, order_number_for, read_session, track_writes, SessionLocal, Product as DBProduct, Order as DBOrder, OrderItem as DBOrderItem
+from llm_scheduler import get_scheduler, PRIORITY_INTERACTIVE, SchedulerBusyError
+from forecast import get_forecast
+from search import get_index
+import archive
+import customers
+import stock
+import telemetry
+
+# 記錄工具執行期間的 SQL 耗時
+for _engine in [engine] + replica_engines:
+    telemetry.instrument_engine(_engine)
+
+
+def _ollama_counters(result: Dict[str, Any]) -> Dict[str, Any]:
+    """從 Ollama 回應的計數器（納秒）整理出 token 數與首 token 時間"""
+    ns = 1_000_000
+    return {
+        "tokens_in": result.get("prompt_eval_count", 0),
+        "tokens_out": result.get("eval_count", 0),
+        "ttft_ms": round((result.get("load_duration", 0) + result.get("prompt_eval_duration", 0)) / ns, 3),
+        "ollama_total_ms": round(result.get("total_duration", 0) / ns, 3),
+    }
 
 
 class ERPAgent:
     """LLM-based ERP Agent with function calling capabilities"""
 
-    def __init__(self, model: str = "qwen3:8b"):
+    def __init__(self, model: str = "qwen3:8b", ollama_url: str = "http://localhost:11434/api/chat"):
         self.model = model
-        self.ollama_url = "http://localhost:11434/api/chat"
+        self.ollama_url = ollama_url
         self.conversation_history = []
+        # 本 agent 寫入工具最近一次提交的同步版本，查詢工具只讀已同步到這個版本的副本
+        self.read_version = 0
 
         # 定義可用的工具函數
         self.tools = [
@@ -35,6 +58,27 @@ class ERPAgent:
                     }
                 }
             },
+            {
+                "type": "function",
+                "function": {
+                    "name": "search_products",
+                    "description": "按名稱、SKU、類別或供應商搜尋產品（容許錯字），用於查出產品ID",
+                    "parameters": {
+                        "type": "object",
+                        "properties": {
+                            "query": {
+                                "type": "string",
+                                "description": "搜尋關鍵字"
+                            },
+                            "limit": {
+                                "type": "integer",
+                                "description": "返回數量（可選，預設5）"
+                            }
+                        },
+                        "required": ["query"]
+                    }
+                }
+            },
             {
                 "type": "function",
                 "function": {
@@ -52,6 +96,23 @@ class ERPAgent:
                     }
                 }
             },
+            {
+                "type": "function",
+                "function": {
+                    "name": "get_customer",
+                    "description": "按客戶名稱（可只給開頭部分）查詢客戶的累計消費、已完成訂單數、最近下單日與最近訂單",
+                    "parameters": {
+                        "type": "object",
+                        "properties": {
+                            "name": {
+                                "type": "string",
+                                "description": "客戶名稱或名稱開頭"
+                            }
+                        },
+                        "required": ["name"]
+                    }
+                }
+            },
             {
                 "type": "function",
                 "function": {
@@ -97,7 +158,7 @@ class ERPAgent:
                 "type": "function",
                 "function": {
                     "name": "update_stock",
-                    "description": "更新產品庫存（補貨）",
+                    "description": "更新產品庫存（補貨）；未指定數量時按需求預測的建議補貨量補貨",
                     "parameters": {
                         "type": "object",
                         "properties": {
@@ -107,10 +168,36 @@ class ERPAgent:
                             },
                             "quantity": {
                                 "type": "integer",
-                                "description": "補貨數量"
+                                "description": "補貨數量（可選，省略時使用建議補貨量）"
+                            }
+                        },
+                        "required": ["product_id"]
+                    }
+                }
+            },
+            {
+                "type": "function",
+                "function": {
+                    "name": "bulk_restock",
+                    "description": "批量補貨（進貨單）：一次為多個產品增加庫存，產品以 SKU 或產品ID 指定",
+                    "parameters": {
+                        "type": "object",
+                        "properties": {
+                            "items": {
+                                "type": "array",
+                                "description": "進貨項目列表",
+                                "items": {
+                                    "type": "object",
+                                    "properties": {
+                                        "sku": {"type": "string"},
+                                        "product_id": {"type": "integer"},
+                                        "quantity": {"type": "integer"}
+                                    },
+                                    "required": ["quantity"]
+                                }
                             }
                         },
-                        "required": ["product_id", "quantity"]
+                        "required": ["items"]
                     }
                 }
             },
@@ -128,10 +215,11 @@ class ERPAgent:
         ]
 
     # ===== 工具函數實現 =====
+    # 查詢工具讀取唯讀副本（有設定時），寫入工具使用主庫；寫入之後的查詢讀主庫或已追上 read_version 的副本
 
     def get_products(self, low_stock_only: bool = False) -> Dict[str, Any]:
         """查詢產品列表"""
-        db = SessionLocal()
+        db = read_session(self.read_version)
         try:
             query = db.query(DBProduct)
             if low_stock_only:
@@ -155,9 +243,36 @@ class ERPAgent:
         finally:
             db.close()
 
+    def search_products(self, query: str, limit: int = 5) -> Dict[str, Any]:
+        """搜尋產品"""
+        hits = get_index().search(query, limit=limit)
+        if not hits:
+            return {"success": True, "products": [], "count": 0}
+
+        db = read_session(self.read_version)
+        try:
+            products = {p.id: p for p in db.query(DBProduct).filter(DBProduct.id.in_([pid for pid, _ in hits])).all()}
+            result = []
+            for pid, score in hits:
+                p = products.get(pid)
+                if p is None:
+                    continue
+                result.append({
+                    "id": p.id,
+                    "name": p.name,
+                    "sku": p.sku,
+                    "price": float(p.price),
+                    "stock_quantity": p.stock_quantity,
+                    "category": p.category,
+                    "score": score
+                })
+            return {"success": True, "products": result, "count": len(result)}
+        finally:
+            db.close()
+
     def get_orders(self, status: Optional[str] = None) -> Dict[str, Any]:
         """查詢訂單列表"""
-        db = SessionLocal()
+        db = read_session(self.read_version)
         try:
             query = db.query(DBOrder)
             if status:
@@ -178,6 +293,36 @@ class ERPAgent:
         finally:
             db.close()
 
+    def get_customer(self, name: str, recent_orders: int = 5) -> Dict[str, Any]:
+        """查詢客戶（名稱完全相符或前綴，走索引）"""
+        db = read_session(self.read_version)
+        try:
+            matches = customers.find(db, name=name, limit=5)
+            result = []
+            for c in matches:
+                orders = db.query(DBOrder).filter(DBOrder.customer_id == c.id) \
+                    .order_by(DBOrder.order_date.desc()).limit(recent_orders).all()
+                result.append({
+                    "id": c.id,
+                    "name": c.name,
+                    "email": c.email,
+                    "phone": c.phone,
+                    "lifetime_value": float(c.lifetime_value or 0),
+                    "order_count": c.order_count,
+                    "last_order_date": c.last_order_date.isoformat() if c.last_order_date else None,
+                    "recent_orders": [{
+                        "order_number": o.order_number,
+                        "total_amount": float(o.total_amount),
+                        "status": o.status,
+                        "order_date": o.order_date.isoformat()
+                    } for o in orders]
+                })
+            if not result:
+                return {"success": False, "error": f"找不到客戶 {name}"}
+            return {"success": True, "customers": result, "count": len(result)}
+        finally:
+            db.close()
+
     def create_order(self, customer_name: str, items: List[Dict],
                      customer_email: Optional[str] = None,
                      customer_phone: Optional[str] = None,
@@ -185,19 +330,17 @@ class ERPAgent:
         """創建新訂單"""
         db = SessionLocal()
         try:
-            # 生成訂單號
-            now = datetime.now()
-            count = db.query(DBOrder).count() + 1
-            order_number = f"ORD{now.year % 100:02d}{now.month:02d}{count:04d}"
-
-            # 計算總金額並檢查庫存
+            # 計算總金額並預檢庫存（寫入前讀取，實際扣減在 stock.take 以條件式 UPDATE 完成）
             total_amount = 0
             order_items_data = []
+            quantities: Dict[int, int] = {}
+            for item in items:
+                quantities[item["product_id"]] = quantities.get(item["product_id"], 0) + item["quantity"]
             for item in items:
                 product = db.query(DBProduct).filter(DBProduct.id == item["product_id"]).first()
                 if not product:
                     return {"success": False, "error": f"產品 ID {item['product_id']} 不存在"}
-                if product.stock_quantity < item["quantity"]:
+                if product.stock_quantity < quantities[product.id]:
                     return {"success": False, "error": f"產品 {product.name} 庫存不足"}
 
                 subtotal = product.price * item["quantity"]
@@ -209,9 +352,10 @@ class ERPAgent:
                     "subtotal": subtotal
                 })
 
-            # 創建訂單
+            # 創建訂單（客戶不存在時寫入客戶主檔）
+            customer = customers.get_or_create(db, customer_name, customer_email, customer_phone, shipping_address)
             db_order = DBOrder(
-                order_number=order_number,
+                customer_id=customer.id,
                 customer_name=customer_name,
                 customer_email=customer_email,
                 customer_phone=customer_phone,
@@ -221,8 +365,9 @@ class ERPAgent:
             )
             db.add(db_order)
             db.flush()
+            order_number = db_order.order_number = order_number_for(db_order.id)
 
-            # 創建訂單項目並扣減庫存
+            # 創建訂單項目
             for item_data in order_items_data:
                 db_item = DBOrderItem(
                     order_id=db_order.id,
@@ -233,9 +378,12 @@ class ERPAgent:
                 )
                 db.add(db_item)
 
-                # 扣減庫存
-                item_data["product"].stock_quantity -= item_data["quantity"]
-
+            # 扣減庫存：預檢之後被其他訂單買走時整筆回滾
+            try:
+                stock.take(db, quantities, db_order.id)
+            except stock.InsufficientStock as e:
+                db.rollback()
+                return {"success": False, "error": f"產品 {e.name} 庫存不足（剩餘 {e.available}）"}
             db.commit()
 
             return {
@@ -254,19 +402,32 @@ class ERPAgent:
         finally:
             db.close()
 
-    def update_stock(self, product_id: int, quantity: int) -> Dict[str, Any]:
-        """更新產品庫存"""
+    def update_stock(self, product_id: int, quantity: Optional[int] = None) -> Dict[str, Any]:
+        """更新產品庫存（未指定數量時使用需求預測的建議補貨量）"""
         db = SessionLocal()
         try:
             product = db.query(DBProduct).filter(DBProduct.id == product_id).first()
             if not product:
                 return {"success": False, "error": f"產品 ID {product_id} 不存在"}
 
+            # 只有未指定數量時才需要預測（可能重建分析快照）
+            advice = None
+            if quantity is None:
+                advice = get_forecast().for_stock(product.id, product.stock_quantity, product.min_stock_level)
+                quantity = advice["suggested_restock"]
+                if quantity <= 0:
+                    return {
+                        "success": True,
+                        "message": f"{product.name} 庫存高於補貨點，暫不需要補貨",
+                        "forecast": advice
+                    }
+
             old_stock = product.stock_quantity
+            stock.movement_reason(db, "restock")
             product.stock_quantity += quantity
             db.commit()
 
-            return {
+            result = {
                 "success": True,
                 "product": {
                     "id": product.id,
@@ -276,6 +437,47 @@ class ERPAgent:
                     "added": quantity
                 }
             }
+            if advice is not None:
+                result["forecast"] = {
+                    "daily_demand": advice["daily_demand"],
+                    "reorder_point": advice["reorder_point"],
+                    "suggested_restock": advice["suggested_restock"]
+                }
+            return result
+        except Exception as e:
+            db.rollback()
+            return {"success": False, "error": str(e)}
+        finally:
+            db.close()
+
+    def bulk_restock(self, items: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """批量補貨；有不存在的產品或數量不正確時整批不執行"""
+        lines = []
+        for item in items or []:
+            quantity = item.get("quantity")
+            sku, product_id = item.get("sku") or None, item.get("product_id")
+            if not isinstance(quantity, int) or quantity <= 0 or (sku is None) == (product_id is None):
+                return {"success": False, "error": f"進貨項目不正確（需 sku 或 product_id 其一，數量大於 0）: {item}"}
+            lines.append(stock.ReceiptLine(sku, product_id, quantity))
+        if not lines:
+            return {"success": False, "error": "沒有進貨項目"}
+
+        db = SessionLocal()
+        try:
+            increments, unknown = stock.resolve(db, lines)
+            if unknown:
+                return {"success": False, "error": f"產品不存在: {', '.join(unknown[:20])}"}
+            adjusted = stock.restock_many(db, increments)
+            db.commit()
+            return {
+                "success": True,
+                "total_quantity": sum(increments.values()),
+                "products": [
+                    {"id": a.product_id, "sku": a.sku, "name": a.name, "old_stock": a.old_stock,
+                     "new_stock": a.new_stock, "added": a.new_stock - a.old_stock}
+                    for a in adjusted
+                ]
+            }
         except Exception as e:
             db.rollback()
             return {"success": False, "error": str(e)}
@@ -284,13 +486,13 @@ class ERPAgent:
 
     def get_sales_report(self) -> Dict[str, Any]:
         """獲取銷售報表"""
-        db = SessionLocal()
+        db = read_session(self.read_version)
         try:
-            orders = db.query(DBOrder).all()
-            total_orders = len(orders)
-            completed_orders = len([o for o in orders if o.status == "completed"])
-            pending_orders = len([o for o in orders if o.status == "pending"])
-            total_revenue = sum(float(o.total_amount) for o in orders if o.status == "completed")
+            # 包括已歸檔的訂單
+            totals = archive.status_totals(db)
+            total_orders = sum(count for count, _ in totals.values())
+            completed_orders, total_revenue = totals.get("completed", (0, 0.0))
+            pending_orders = totals.get("pending", (0, 0.0))[0]
 
             return {
                 "success": True,
@@ -305,22 +507,38 @@ class ERPAgent:
             db.close()
 
     def execute_tool(self, tool_name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
-        """執行工具函數"""
+        """執行工具函數，記下寫入工具提交的同步版本"""
+        with track_writes() as writes:
+            result = self._call_tool(tool_name, arguments)
+        self.read_version = max(self.read_version, writes["version"])
+        return result
+
+    def _call_tool(self, tool_name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
         if tool_name == "get_products":
             return self.get_products(**arguments)
+        elif tool_name == "search_products":
+            return self.search_products(**arguments)
         elif tool_name == "get_orders":
             return self.get_orders(**arguments)
+        elif tool_name == "get_customer":
+            return self.get_customer(**arguments)
         elif tool_name == "create_order":
             return self.create_order(**arguments)
         elif tool_name == "update_stock":
             return self.update_stock(**arguments)
+        elif tool_name == "bulk_restock":
+            return self.bulk_restock(**arguments)
         elif tool_name == "get_sales_report":
             return self.get_sales_report(**arguments)
         else:
             return {"success": False, "error": f"未知的工具: {tool_name}"}
 
-    def chat(self, user_message: str) -> str:
+    def chat(self, user_message: str, priority: int = PRIORITY_INTERACTIVE) -> str:
         """與 LLM 對話並處理工具調用"""
+        with telemetry.trace("agent.chat", model=self.model, priority=priority) as chat_trace:
+            return self._chat(user_message, priority, chat_trace)
+
+    def _chat(self, user_message: str, priority: int, chat_trace: telemetry.Trace) -> str:
         # 添加用戶消息到歷史
         self.conversation_history.append({
             "role": "user",
@@ -332,41 +550,49 @@ class ERPAgent:
 
 【重要】你必須使用繁體中文（台灣用語）回答，不可使用簡體中文。
 
-功能：查詢產品/訂單、創建訂單、補貨、查看報表。
+功能：查詢/搜尋產品、查詢訂單與客戶、創建訂單、補貨（單一產品或整張進貨單）、查看報表。
 
 規則：
 1. 必須用繁體中文簡潔回答（例如：「您」而非「你」，「訂單」而非「订单」）
 2. 需要執行操作時調用工具
 3. 工具返回結果後，用繁體中文簡單總結給用戶
 4. 不要重複用戶的問題
+5. 用戶只提到產品名稱時，先用 search_products 查出產品ID
 
 範例回答格式：
 - 「系統目前有 25 筆訂單」
 - 「已為您查詢庫存狀態」"""
 
-        messages = [{"role": "system", "content": system_prompt}] + self.conversation_history
+        with telemetry.span("prompt_build") as prompt_span:
+            messages = [{"role": "system", "content": system_prompt}] + self.conversation_history
+            prompt_span.set(messages=len(messages))
 
         max_iterations = 5
         iteration = 0
 
         while iteration < max_iterations:
             iteration += 1
+            chat_trace.attributes["iterations"] = iteration
 
             # 調用 Ollama API
             try:
                 print(f"[LLM Agent] 迭代 {iteration}/{max_iterations}，發送請求到 Ollama...")
-                response = requests.post(
-                    self.ollama_url,
-                    json={
-                        "model": self.model,
-                        "messages": messages,
-                        "tools": self.tools,
-                        "stream": False
-                    },
-                    timeout=45  # 減少超時時間到 45 秒
-                )
-                response.raise_for_status()
-                result = response.json()
+                with telemetry.span("ollama.chat", iteration=iteration) as llm_span:
+                    # 經由排程器排隊，避免多位使用者同時搶佔本地模型
+                    response = get_scheduler().post(
+                        self.ollama_url,
+                        {
+                            "model": self.model,
+                            "messages": messages,
+                            "tools": self.tools,
+                            "stream": False
+                        },
+                        priority=priority,
+                        timeout=45  # 減少超時時間到 45 秒
+                    )
+                    response.raise_for_status()
+                    result = response.json()
+                    llm_span.set(**_ollama_counters(result))
                 print(f"[LLM Agent] Ollama 響應成功")
 
                 assistant_message = result["message"]
@@ -381,7 +607,9 @@ class ERPAgent:
 
                         print(f"[LLM Agent] 執行工具: {function_name}，參數: {arguments}")
                         # 執行工具
-                        tool_result = self.execute_tool(function_name, arguments)
+                        with telemetry.span(f"tool.{function_name}") as tool_span:
+                            tool_result = self.execute_tool(function_name, arguments)
+                            tool_span.set(success=bool(tool_result.get("success", False)))
                         print(f"[LLM Agent] 工具執行結果: {tool_result.get('success', False)}")
 
                         # 添加工具結果到消息
@@ -402,6 +630,8 @@ class ERPAgent:
                     })
                     return final_response
 
+            except SchedulerBusyError:
+                return "系統繁忙：目前排隊的請求較多，請稍後再試。"
             except requests.exceptions.ConnectionError:
                 return "錯誤：無法連接到 Ollama 服務。請確保 Ollama 正在運行（執行 'ollama serve'）。"
             except requests.exceptions.Timeout:
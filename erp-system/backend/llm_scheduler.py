@@ -0,0 +1,140 @@
+"""
+Ollama 請求排程器
+多位使用者同時對話時，所有請求先在這裡排隊，依優先級取得生成名額，
+避免同時把本地模型塞滿導致每個請求都等到超時。
+"""
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+import requests
+
+import telemetry
+
+# 數字越小越優先
+PRIORITY_INTERACTIVE = 0   # 使用者即時對話
+PRIORITY_BACKGROUND = 10   # 背景摘要等非即時任務
+
+
+class SchedulerBusyError(Exception):
+    """佇列已滿或排隊超時"""
+
+
+def _percentile(sorted_values, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class LLMScheduler:
+    """以優先級佇列 + 併發上限調度 Ollama 請求"""
+
+    def __init__(self, max_concurrent: int = 1, max_queue: int = 32, queue_timeout: float = 30.0):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.session = requests.Session()
+
+        self._cond = threading.Condition()
+        self._waiting = []  # heap: (priority, seq)
+        self._seq = itertools.count()
+        self._in_flight = 0
+
+        # 統計數據
+        self._wait_samples = deque(maxlen=500)
+        self._submitted = 0
+        self._completed = 0
+        self._rejected = 0
+        self._timed_out = 0
+
+    def _acquire(self, priority: int, timeout: float) -> float:
+        start = time.monotonic()
+        deadline = start + timeout
+        with self._cond:
+            self._submitted += 1
+            if len(self._waiting) >= self.max_queue:
+                self._rejected += 1
+                raise SchedulerBusyError("佇列已滿")
+
+            entry = (priority, next(self._seq))
+            heapq.heappush(self._waiting, entry)
+            while self._in_flight >= self.max_concurrent or self._waiting[0] != entry:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._waiting.remove(entry)
+                    heapq.heapify(self._waiting)
+                    self._timed_out += 1
+                    self._cond.notify_all()
+                    raise SchedulerBusyError("排隊超時")
+                self._cond.wait(remaining)
+
+            heapq.heappop(self._waiting)
+            self._in_flight += 1
+            # 還有空位時讓下一個請求也能繼續
+            self._cond.notify_all()
+
+        wait = time.monotonic() - start
+        self._wait_samples.append(wait)
+        return wait
+
+    def _release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._completed += 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, priority: int = PRIORITY_INTERACTIVE, timeout: Optional[float] = None):
+        """取得一個生成名額，yield 排隊等待秒數"""
+        wait = self._acquire(priority, self.queue_timeout if timeout is None else timeout)
+        try:
+            yield wait
+        finally:
+            self._release()
+
+    def post(self, url: str, payload: Dict[str, Any], priority: int = PRIORITY_INTERACTIVE,
+             timeout: float = 45) -> requests.Response:
+        """排隊後送出請求到 Ollama"""
+        with self.slot(priority) as wait:
+            telemetry.annotate(queue_ms=round(wait * 1000, 3))
+            return self.session.post(url, json=payload, timeout=timeout)
+
+    def metrics(self) -> Dict[str, Any]:
+        """佇列深度與等待時間統計"""
+        with self._cond:
+            waits = sorted(self._wait_samples)
+            return {
+                "queue_depth": len(self._waiting),
+                "in_flight": self._in_flight,
+                "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue,
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "timed_out": self._timed_out,
+                "wait_seconds": {
+                    "p50": round(_percentile(waits, 0.50), 4),
+                    "p95": round(_percentile(waits, 0.95), 4),
+                    "max": round(waits[-1], 4) if waits else 0.0,
+                    "samples": len(waits),
+                },
+            }
+
+
+# 全局排程器實例（所有 agent 共用同一個本地模型）
+scheduler = LLMScheduler(
+    max_concurrent=int(os.getenv("OLLAMA_MAX_CONCURRENCY", "1")),
+    max_queue=int(os.getenv("OLLAMA_MAX_QUEUE", "32")),
+    queue_timeout=float(os.getenv("OLLAMA_QUEUE_TIMEOUT", "30")),
+)
+
+
+def get_scheduler() -> LLMScheduler:
+    """獲取排程器實例"""
+    return scheduler
@@ -1,18 +1,40 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Cookie, Depends, HTTPException, Query, Header, Request, Response, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from pydantic import BaseModel
+from datetime import date, datetime, timedelta
 import os
 
-from database import get_db, init_db, Product as DBProduct, Order as DBOrder, OrderItem as DBOrderItem
+from database import (
+    get_db, get_read_db, replica_engines, replica_status, track_writes, order_number_for, schema_pending, Product as DBProduct, Order as DBOrder, OrderItem as DBOrderItem, Customer as DBCustomer
+)
 from models import (
-    Product, ProductCreate, ProductUpdate,
-    Order, OrderCreate, OrderUpdate,
-    StockAlert, SalesReport, InventoryReport
+    Product, ProductCreate, ProductUpdate, ProductSearchHit,
+    Order, OrderCreate, OrderUpdate, BulkStatusUpdate, BulkStatusResult, Customer,
+    StockAlert, RestockReceipt, RestockResult, StockHistory, StockLevel, StockReconciliation, StockSnapshotResult,
+    SalesReport, InventoryReport, SalesTimeseries,
+    CategoryMargin, CustomerRank, DiscountImpact, ProductForecast, SyncChanges, Dashboard
 )
 from llm_agent import get_agent
+from llm_scheduler import get_scheduler
+import telemetry
+from metrics import MetricsMiddleware, registry as metrics_registry, gauge_lines, profiled
+import rollups
+import analytics
+import forecast
+import search
+import customers
+import migrations
+import changefeed
+import sync
+import dashboard
+import cache
+import stock
+import order_status
+import archive
 
 app = FastAPI(title="ERP System API", version="1.0.0")
 
@@ -25,23 +47,64 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 初始化数据库
+# 请求延迟、状态码与 SQL 统计
+app.add_middleware(MetricsMiddleware)
+
+# ==================== 读写分离 ====================
+# 设定 ERP_REPLICA_URLS 时，只读的列表、报表与预警端点读取副本（read_db），写入端点使用主库（get_db）。
+# 请求有提交写入时以 cookie 带回这次写入的同步版本，之后的读取只使用已同步到该版本的副本（否则读主库），
+# 多个 worker 时客户端也读得到自己刚写入的数据；没有写入的请求不改动 cookie
+READ_VERSION_COOKIE = "erp_read_version"
+
+
+def read_db(min_version: int = Cookie(0, alias=READ_VERSION_COOKIE)):
+    yield from get_read_db(min_version)
+
+
+@app.middleware("http")
+async def remember_write_version(request: Request, call_next):
+    with track_writes() as writes:
+        response = await call_next(request)
+    if replica_engines and writes["version"]:
+        response.set_cookie(READ_VERSION_COOKIE, str(writes["version"]), httponly=True, samesite="lax")
+    return response
+
+
+# 表结构与初始数据由 python manage.py init-db 在启动前建立；每个 worker 启动时只检查迁移版本
 @app.on_event("startup")
 def startup_event():
-    init_db()
+    pending = schema_pending()
+    if pending:
+        raise RuntimeError(
+            f"数据库尚未初始化或版本过旧（待执行迁移：{', '.join(pending)}），请先执行 python manage.py init-db"
+        )
+    search.warm_up()
 
 
 # ==================== 产品管理 API ====================
 
 @app.get("/api/products", response_model=List[Product])
-def get_products(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def get_products(skip: int = 0, limit: int = 100, db: Session = Depends(read_db)):
     """获取产品列表"""
     products = db.query(DBProduct).offset(skip).limit(limit).all()
     return products
 
 
+@app.get("/api/products/search", response_model=List[ProductSearchHit])
+def search_products(q: str, limit: int = Query(10, ge=1, le=100), db: Session = Depends(read_db)):
+    """按名称、SKU、描述、类别、供应商搜索产品（容许拼写错误，按相关度排序）"""
+    hits = search.get_index().search(q, limit=limit)
+    if not hits:
+        return []
+    products = {p.id: p for p in db.query(DBProduct).filter(DBProduct.id.in_([pid for pid, _ in hits])).all()}
+    return [
+        ProductSearchHit(**Product.model_validate(products[pid]).model_dump(), score=score)
+        for pid, score in hits if pid in products
+    ]
+
+
 @app.get("/api/products/{product_id}", response_model=Product)
-def get_product(product_id: int, db: Session = Depends(get_db)):
+def get_product(product_id: int, db: Session = Depends(read_db)):
     """获取单个产品"""
     product = db.query(DBProduct).filter(DBProduct.id == product_id).first()
     if not product:
@@ -94,34 +157,50 @@ def delete_product(product_id: int, db: Session = Depends(get_db)):
 # ==================== 订单管理 API ====================
 
 @app.get("/api/orders", response_model=List[Order])
-def get_orders(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    """获取订单列表"""
-    orders = db.query(DBOrder).offset(skip).limit(limit).all()
-    return orders
+@profiled
+def get_orders(skip: int = 0, limit: int = 100, start: Optional[date] = None, end: Optional[date] = None,
+               db: Session = Depends(read_db)):
+    """获取订单列表；指定下单日期区间时按下单时间排序，区间早于归档水位时一并查询归档订单"""
+    if start is None and end is None:
+        return db.query(DBOrder).offset(skip).limit(limit).all()
+    return archive.list_orders(db, start, end, skip=skip, limit=limit)
 
 
 @app.get("/api/orders/{order_id}", response_model=Order)
-def get_order(order_id: int, db: Session = Depends(get_db)):
-    """获取单个订单"""
-    order = db.query(DBOrder).filter(DBOrder.id == order_id).first()
+@profiled
+def get_order(order_id: int, db: Session = Depends(read_db)):
+    """获取单个订单（包括已归档的订单）"""
+    order = db.query(DBOrder).filter(DBOrder.id == order_id).first() or archive.get(db, order_id)
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
     return order
 
 
 @app.post("/api/orders", response_model=Order)
+@profiled
 def create_order(order: OrderCreate, db: Session = Depends(get_db)):
     """创建新订单"""
-    from datetime import datetime
-
-    # 生成訂單編號
-    now = datetime.now()
-    count = db.query(DBOrder).count() + 1
-    order_number = f"ORD{now.year % 100:02d}{now.month:02d}{count:04d}"
+    # 写入前先读取产品并预检库存：写入交易（SQLite 的写锁、同步版本计数器）只包含写入本身
+    quantities = {}
+    for item in order.items:
+        quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+    products = {p.id: p for p in db.query(DBProduct).filter(DBProduct.id.in_(quantities)).all()}
+    for item in order.items:
+        product = products.get(item.product_id)
+        if not product:
+            raise HTTPException(status_code=404, detail=f"Product {item.product_id} not found")
+        if product.stock_quantity < quantities[product.id]:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Insufficient stock for {product.name}. Available: {product.stock_quantity}"
+            )
 
-    # 创建订单
+    # 创建订单（客户不存在时写入客户主档）
+    customer = customers.get_or_create(
+        db, order.customer_name, order.customer_email, order.customer_phone, order.shipping_address
+    )
     db_order = DBOrder(
-        order_number=order_number,
+        customer_id=customer.id,
         customer_name=order.customer_name,
         customer_email=order.customer_email,
         customer_phone=order.customer_phone,
@@ -130,60 +209,65 @@ def create_order(order: OrderCreate, db: Session = Depends(get_db)):
     )
     db.add(db_order)
     db.flush()
-
-    total_amount = 0.0
+    # 訂單編號取自 id（見 order_number_for）
+    db_order.order_number = order_number_for(db_order.id)
 
     # 添加订单项
+    total_amount = 0.0
     for item in order.items:
-        product = db.query(DBProduct).filter(DBProduct.id == item.product_id).first()
-        if not product:
-            db.rollback()
-            raise HTTPException(status_code=404, detail=f"Product {item.product_id} not found")
-
-        if product.stock_quantity < item.quantity:
-            db.rollback()
-            raise HTTPException(
-                status_code=400,
-                detail=f"Insufficient stock for {product.name}. Available: {product.stock_quantity}"
-            )
-
+        product = products[item.product_id]
         subtotal = product.price * item.quantity
-        db_item = DBOrderItem(
+        db.add(DBOrderItem(
             order_id=db_order.id,
             product_id=item.product_id,
             quantity=item.quantity,
             unit_price=product.price,
             subtotal=subtotal
-        )
-        db.add(db_item)
+        ))
         total_amount += subtotal
-
-        # 更新库存
-        product.stock_quantity -= item.quantity
-
     db_order.total_amount = total_amount
+
+    # 条件式扣减库存：预检之后被其他订单买走时整笔回滚
+    try:
+        stock.take(db, quantities, db_order.id)
+    except stock.InsufficientStock as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
     db.commit()
     db.refresh(db_order)
     return db_order
 
 
+@app.post("/api/orders/bulk-status", response_model=BulkStatusResult)
+@profiled
+def bulk_update_order_status(request: BulkStatusUpdate, db: Session = Depends(get_db)):
+    """批量变更订单状态（同一交易）；取消未完成的订单时以 set-based 语句恢复库存"""
+    missing = order_status.missing(db, request.order_ids)
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Orders not found: {', '.join(map(str, missing[:20]))}")
+    result = order_status.transition(db, request.order_ids, request.status)
+    db.commit()
+    return result
+
+
+def _not_found_or_archived(db: Session, order_id: int):
+    # 已归档的订单只读
+    if archive.get(db, order_id):
+        raise HTTPException(status_code=409, detail=f"Order {order_id} is archived and cannot be modified")
+    raise HTTPException(status_code=404, detail="Order not found")
+
+
 @app.put("/api/orders/{order_id}", response_model=Order)
+@profiled
 def update_order(order_id: int, order: OrderUpdate, db: Session = Depends(get_db)):
     """更新订单状态"""
     db_order = db.query(DBOrder).filter(DBOrder.id == order_id).first()
     if not db_order:
-        raise HTTPException(status_code=404, detail="Order not found")
+        _not_found_or_archived(db, order_id)
 
     if order.status:
-        # 如果訂單被取消，恢復庫存
-        if order.status == "cancelled" and db_order.status not in ["cancelled", "completed"]:
-            for item in db_order.items:
-                item.product.stock_quantity += item.quantity
-
-        # 如果訂單從pending變為processing，不做庫存變動（在創建時已扣除）
-        # 如果訂單完成，也不做庫存變動
-
-        db_order.status = order.status
+        # 取消时恢复库存、进入或离开 completed 时更新销售汇总与客户统计（见 order_status.py）
+        order_status.transition(db, [order_id], order.status)
 
     db.commit()
     db.refresh(db_order)
@@ -191,30 +275,103 @@ def update_order(order_id: int, order: OrderUpdate, db: Session = Depends(get_db
 
 
 @app.delete("/api/orders/{order_id}")
+@profiled
 def delete_order(order_id: int, db: Session = Depends(get_db)):
     """删除订单"""
     db_order = db.query(DBOrder).filter(DBOrder.id == order_id).first()
     if not db_order:
-        raise HTTPException(status_code=404, detail="Order not found")
+        _not_found_or_archived(db, order_id)
 
-    # 如果订单未完成，恢复库存
+    # 如果订单未取消，按明细恢复库存（一条 set-based 语句）
     if db_order.status != "cancelled":
-        for item in db_order.items:
-            item.product.stock_quantity += item.quantity
+        stock.restock_orders(db, [order_id], reason="delete")
+
+    # 已完成订单从销售汇总与客户统计中扣除
+    rollups.on_status_change(db, db_order, db_order.status, None)
 
     db.delete(db_order)
+    customers.on_status_change(db, db_order, db_order.status, None)
     db.commit()
     return {"message": "Order deleted successfully"}
 
 
+# ==================== 客户管理 API ====================
+
+CUSTOMER_SORTS = {
+    "lifetime_value": DBCustomer.lifetime_value.desc(),
+    "last_order": DBCustomer.last_order_date.desc(),
+    "name": DBCustomer.name_key.asc(),
+}
+
+
+@app.get("/api/customers", response_model=List[Customer])
+@profiled
+def get_customers(
+    name: Optional[str] = None,
+    email: Optional[str] = None,
+    sort: str = Query("lifetime_value", pattern="^(lifetime_value|last_order|name)$"),
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(read_db),
+):
+    """获取客户列表；name 按名称完全相符或前缀查找，email 完全相符，均走索引"""
+    if name or email:
+        return customers.find(db, name=name, email=email, limit=limit)
+    return db.query(DBCustomer).order_by(CUSTOMER_SORTS[sort], DBCustomer.id).offset(skip).limit(limit).all()
+
+
+@app.get("/api/customers/{customer_id}", response_model=Customer)
+@profiled
+def get_customer(customer_id: int, db: Session = Depends(read_db)):
+    """获取单个客户及其累计消费、订单数、最近下单日"""
+    customer = db.query(DBCustomer).filter(DBCustomer.id == customer_id).first()
+    if not customer:
+        raise HTTPException(status_code=404, detail="Customer not found")
+    return customer
+
+
+@app.get("/api/customers/{customer_id}/orders", response_model=List[Order])
+@profiled
+def get_customer_orders(customer_id: int, status: Optional[str] = None, skip: int = 0,
+                        limit: int = Query(50, ge=1, le=500), start: Optional[date] = None,
+                        end: Optional[date] = None, db: Session = Depends(read_db)):
+    """获取客户的订单（按下单时间倒序，使用 (customer_id, order_date) 索引；日期区间早于归档水位时包括归档订单）"""
+    if not db.query(DBCustomer.id).filter(DBCustomer.id == customer_id).first():
+        raise HTTPException(status_code=404, detail="Customer not found")
+    if start is not None or end is not None:
+        return archive.list_orders(db, start, end, customer_id=customer_id, status=status, skip=skip, limit=limit,
+                                   newest_first=True)
+    query = db.query(DBOrder).filter(DBOrder.customer_id == customer_id)
+    if status:
+        query = query.filter(DBOrder.status == status)
+    return query.order_by(DBOrder.order_date.desc()).offset(skip).limit(limit).all()
+
+
 # ==================== 库存管理 API ====================
 
 @app.get("/api/inventory/alerts", response_model=List[StockAlert])
-def get_stock_alerts(db: Session = Depends(get_db)):
-    """获取库存预警"""
+def get_stock_alerts(use_forecast: bool = False, db: Session = Depends(read_db)):
+    """获取库存预警（use_forecast=true 时以需求预测得出的补货点判断）"""
     products = db.query(DBProduct).all()
     alerts = []
 
+    if use_forecast:
+        fc = forecast.get_forecast()
+        for product in products:
+            advice = fc.for_stock(product.id, product.stock_quantity, product.min_stock_level)
+            if product.stock_quantity < advice["reorder_point"]:
+                alerts.append(StockAlert(
+                    product_id=product.id,
+                    product_name=product.name,
+                    current_stock=product.stock_quantity,
+                    min_stock_level=product.min_stock_level,
+                    shortage=advice["reorder_point"] - product.stock_quantity,
+                    reorder_point=advice["reorder_point"],
+                    daily_demand=advice["daily_demand"],
+                    suggested_restock=advice["suggested_restock"]
+                ))
+        return alerts
+
     for product in products:
         if product.stock_quantity < product.min_stock_level:
             alerts.append(StockAlert(
@@ -228,6 +385,24 @@ def get_stock_alerts(db: Session = Depends(get_db)):
     return alerts
 
 
+@app.get("/api/inventory/forecast", response_model=List[ProductForecast])
+def get_inventory_forecast(only_reorder: bool = False, limit: int = Query(100, ge=1, le=100000),
+                           db: Session = Depends(read_db)):
+    """各产品的需求预测、动态补货点与建议补货量（按建议补货量排序）"""
+    products = db.query(DBProduct.id, DBProduct.name, DBProduct.stock_quantity, DBProduct.min_stock_level).all()
+    rows = forecast.get_forecast().all_products(
+        stock={p.id: p.stock_quantity for p in products},
+        min_stock={p.id: p.min_stock_level for p in products}
+    )
+    names = {p.id: p.name for p in products}
+    if only_reorder:
+        rows = [r for r in rows if r["suggested_restock"] > 0]
+    rows.sort(key=lambda r: r["suggested_restock"], reverse=True)
+    for r in rows[:limit]:
+        r["product_name"] = names.get(r["product_id"])
+    return rows[:limit]
+
+
 @app.post("/api/inventory/restock/{product_id}")
 def restock_product(product_id: int, quantity: int, db: Session = Depends(get_db)):
     """补货"""
@@ -235,58 +410,131 @@ def restock_product(product_id: int, quantity: int, db: Session = Depends(get_db
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
 
+    stock.movement_reason(db, "restock")
     product.stock_quantity += quantity
     db.commit()
     db.refresh(product)
     return {"message": f"Restocked {quantity} units", "new_stock": product.stock_quantity}
 
 
+def _receive(db: Session, lines: List[stock.ReceiptLine], reference: Optional[str]) -> RestockResult:
+    increments, unknown = stock.resolve(db, lines)
+    if unknown:
+        raise HTTPException(status_code=404, detail=f"Unknown products: {', '.join(unknown[:20])}")
+    adjusted = stock.restock_many(db, increments, reference)
+    db.commit()
+    return RestockResult(
+        reference=reference,
+        total_quantity=sum(increments.values()),
+        products=[{**a._asdict(), "added": a.new_stock - a.old_stock} for a in adjusted],
+    )
+
+
+@app.post("/api/inventory/receipts", response_model=RestockResult)
+@profiled
+def receive_stock(receipt: RestockReceipt, db: Session = Depends(get_db)):
+    """进货（批量补货）：按 SKU 或产品 ID 增加库存；有不存在的产品时整批不执行"""
+    lines = [stock.ReceiptLine(item.sku, item.product_id, item.quantity) for item in receipt.items]
+    return _receive(db, lines, receipt.reference)
+
+
+@app.post("/api/inventory/receipts/csv", response_model=RestockResult)
+@profiled
+def receive_stock_csv(file: UploadFile = File(...), reference: Optional[str] = None, db: Session = Depends(get_db)):
+    """上传进货单 CSV（sku 或 product_id、quantity 栏）"""
+    try:
+        lines = stock.parse_csv(file.file.read())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _receive(db, lines, reference or file.filename)
+
+
+# 库存异动账：时间点库存与异动历史由最近的快照加上之后的异动算出（见 stock.py）
+
+@app.get("/api/inventory/stock", response_model=List[StockLevel])
+@profiled
+def get_stock_at(
+    at: Optional[datetime] = None,
+    product_ids: Optional[str] = Query(None, description="逗号分隔的产品 ID"),
+    db: Session = Depends(read_db),
+):
+    """时间点库存（at 为 UTC，省略时为当前）"""
+    try:
+        ids = [int(x) for x in product_ids.split(",") if x.strip()] if product_ids else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="product_ids must be comma-separated integers")
+    levels = stock.stock_at(db, at, ids)
+    return [StockLevel(product_id=pid, stock_quantity=qty) for pid, qty in sorted(levels.items())]
+
+
+@app.get("/api/products/{product_id}/movements", response_model=StockHistory)
+@profiled
+def get_stock_movements(
+    product_id: int,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: int = Query(200, ge=1, le=5000),
+    db: Session = Depends(read_db),
+):
+    """产品的库存异动与结存（start, end]"""
+    return stock.history(db, product_id, start, end, limit)
+
+
+@app.post("/api/inventory/snapshots", response_model=StockSnapshotResult)
+def take_stock_snapshot(db: Session = Depends(get_db)):
+    """为上次快照后有异动的产品记下结存（通常由 manage.py stock-snapshot 定期执行）"""
+    result = stock.take_snapshot(db)
+    db.commit()
+    return result
+
+
+@app.get("/api/inventory/reconcile", response_model=StockReconciliation)
+@profiled
+def reconcile_stock(db: Session = Depends(read_db)):
+    """对账：产品库存与异动账结存不一致的产品"""
+    return stock.reconcile(db)
+
+
+# ==================== 仪表板 API ====================
+
+@app.get("/api/dashboard", response_model=Dashboard)
+def get_dashboard(
+    recent: int = Query(10, ge=0, le=dashboard.MAX_RECENT),
+    if_none_match: Optional[str] = Header(None),
+):
+    """首页计数与最近订单；短 TTL 缓存，支持 If-None-Match 条件请求"""
+    entry = dashboard.get(recent)
+    headers = {"ETag": entry.etag, "Cache-Control": f"private, max-age={int(dashboard.TTL_SECONDS)}"}
+    if if_none_match and entry.etag in (t.strip() for t in if_none_match.split(",")):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+
 # ==================== 报表 API ====================
+# 全表统计经读取缓存（cache.py）：并发请求共用一次计算，数据变更后先返回旧结果并在后台重新计算
 
-@app.get("/api/reports/sales", response_model=SalesReport)
-def get_sales_report(db: Session = Depends(get_db)):
-    """获取销售报表"""
-    orders = db.query(DBOrder).all()
-
-    total_orders = len(orders)
-    completed_orders = len([o for o in orders if o.status == "completed"])
-    pending_orders = len([o for o in orders if o.status == "pending"])
-    cancelled_orders = len([o for o in orders if o.status == "cancelled"])
-    total_revenue = sum(o.total_amount for o in orders if o.status == "completed")
-
-    # 统计产品销量
-    product_sales = {}
-    for order in orders:
-        if order.status == "completed":
-            for item in order.items:
-                if item.product_id not in product_sales:
-                    product_sales[item.product_id] = {
-                        "product_name": item.product.name,
-                        "quantity": 0,
-                        "revenue": 0.0
-                    }
-                product_sales[item.product_id]["quantity"] += item.quantity
-                product_sales[item.product_id]["revenue"] += item.subtotal
-
-    top_products = sorted(
-        product_sales.values(),
-        key=lambda x: x["revenue"],
-        reverse=True
-    )[:5]
+def _sales_report(db: Session) -> SalesReport:
+    # 按状态与按产品在数据库聚合，热表与归档表各一次（见 archive.py）
+    totals = archive.status_totals(db)
 
     return SalesReport(
-        total_orders=total_orders,
-        total_revenue=total_revenue,
-        completed_orders=completed_orders,
-        pending_orders=pending_orders,
-        cancelled_orders=cancelled_orders,
-        top_products=top_products
+        total_orders=sum(count for count, _ in totals.values()),
+        total_revenue=totals.get("completed", (0, 0.0))[1],
+        completed_orders=totals.get("completed", (0, 0.0))[0],
+        pending_orders=totals.get("pending", (0, 0.0))[0],
+        cancelled_orders=totals.get("cancelled", (0, 0.0))[0],
+        top_products=archive.top_products(db, 5)
     )
 
 
-@app.get("/api/reports/inventory", response_model=InventoryReport)
-def get_inventory_report(db: Session = Depends(get_db)):
-    """获取库存报表"""
+@app.get("/api/reports/sales", response_model=SalesReport)
+@profiled
+def get_sales_report():
+    """获取销售报表"""
+    return cache.get_cache().get("reports.sales", _sales_report)
+
+
+def _inventory_report(db: Session) -> InventoryReport:
     products = db.query(DBProduct).all()
 
     total_products = len(products)
@@ -312,6 +560,90 @@ def get_inventory_report(db: Session = Depends(get_db)):
     )
 
 
+@app.get("/api/reports/inventory", response_model=InventoryReport)
+@profiled
+def get_inventory_report():
+    """获取库存报表"""
+    return cache.get_cache().get("reports.inventory", _inventory_report)
+
+
+@app.get("/api/reports/sales/timeseries", response_model=SalesTimeseries)
+@profiled
+def get_sales_timeseries(
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    granularity: str = Query("month", pattern="^(day|week|month)$"),
+    dimension: str = Query("all", pattern="^(all|product|category|customer)$"),
+    key: Optional[str] = None,
+    db: Session = Depends(read_db)
+):
+    """按日/週/月获取销售趋势（读取预先汇总的数据）"""
+    end = end or date.today()
+    start = start or end - timedelta(days=364)
+    if start > end:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+
+    result = rollups.query_timeseries(db, start, end, granularity, dimension, key)
+    points = result["points"]
+
+    # 产品维度附上产品名称
+    if dimension == "product" and points:
+        ids = {int(p["dimension_key"]) for p in points}
+        names = dict(db.query(DBProduct.id, DBProduct.name).filter(DBProduct.id.in_(ids)).all())
+        for p in points:
+            p["label"] = names.get(int(p["dimension_key"]))
+
+    return SalesTimeseries(
+        start=start,
+        end=end,
+        granularity=granularity,
+        dimension=dimension,
+        points=points,
+        total_revenue=round(sum(p["revenue"] for p in points), 2),
+        total_orders=sum(p["order_count"] for p in points),
+        total_units=sum(p["units_sold"] for p in points),
+        rows_read=result["rows_read"]
+    )
+
+
+# ==================== 分析 API ====================
+# 读取欄式快照（analytics.py），数据变更后下一次查询自动重建
+
+def _parse_statuses(status: str) -> List[str]:
+    return [] if status == "all" else [s for s in status.split(",") if s]
+
+
+@app.get("/api/analytics/margin-by-category", response_model=List[CategoryMargin])
+@profiled
+def get_margin_by_category(start: Optional[date] = None, end: Optional[date] = None, status: str = "completed"):
+    """各类别毛利（status 可用逗号分隔多个状态，all 表示全部）"""
+    snap = analytics.get_analytics().snapshot()
+    return analytics.margin_by_category(snap, start, end, _parse_statuses(status))
+
+
+@app.get("/api/analytics/customers", response_model=List[CustomerRank])
+@profiled
+def get_customer_ranking(start: Optional[date] = None, end: Optional[date] = None,
+                         status: str = "completed", limit: int = Query(20, ge=1, le=1000)):
+    """客户销售额排行"""
+    snap = analytics.get_analytics().snapshot()
+    return analytics.customer_ranking(snap, start, end, _parse_statuses(status), limit)
+
+
+@app.get("/api/analytics/discount-impact", response_model=List[DiscountImpact])
+@profiled
+def get_discount_impact(start: Optional[date] = None, end: Optional[date] = None, status: str = "completed"):
+    """各折扣区间的销量与毛利"""
+    snap = analytics.get_analytics().snapshot()
+    return analytics.discount_impact(snap, start, end, _parse_statuses(status))
+
+
+@app.get("/api/analytics/status")
+def get_analytics_status():
+    """分析快照的版本与大小"""
+    return analytics.get_analytics().status()
+
+
 # ==================== AI Agent API ====================
 
 class ChatMessage(BaseModel):
@@ -338,6 +670,92 @@ def reset_agent():
     return {"message": "對話歷史已重置"}
 
 
+@app.get("/api/agent/scheduler")
+def get_scheduler_metrics():
+    """LLM 排程器佇列深度與等待時間"""
+    return get_scheduler().metrics()
+
+
+@app.get("/api/agent/metrics")
+def get_agent_metrics(recent: int = 10):
+    """Agent 各階段耗時統計與最近的 trace"""
+    return telemetry.recorder.summary(recent=recent)
+
+
+# ==================== 变更推送 ====================
+
+@app.get("/api/events")
+async def event_stream(
+    topics: Optional[str] = Query(None, description="逗号分隔：orders,stock,alerts；不填则全部"),
+    last_event_id: Optional[int] = Header(None),
+):
+    """Server-Sent Events：订单、库存与库存预警的增量事件，断线重连时依 Last-Event-ID 补发"""
+    wanted = {t.strip() for t in topics.split(",") if t.strip()} if topics else None
+    return StreamingResponse(
+        changefeed.stream(wanted, last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/api/events/status")
+def event_stream_status():
+    """最新事件序号、缓冲区大小与在线订阅数"""
+    return changefeed.get_feed().status()
+
+
+# ==================== 增量同步 ====================
+
+@app.get("/api/sync", response_model=SyncChanges)
+@profiled
+def sync_changes(
+    since: int = Query(0, ge=0, description="上次同步返回的 version；0 表示取得完整快照"),
+    tables: str = Query("products,orders", description="逗号分隔：products,orders"),
+    db: Session = Depends(get_db),
+):
+    """版本大于 since 的产品与订单，以及之后删除的 id"""
+    wanted = [t.strip() for t in tables.split(",") if t.strip()]
+    unknown = [t for t in wanted if t not in sync.TABLES]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown tables: {', '.join(unknown)}")
+    return sync.changes_since(db, since, wanted)
+
+
+# ==================== 监控 ====================
+
+def _scheduler_metrics():
+    stats = get_scheduler().metrics()
+    return (
+        gauge_lines("erp_llm_queue_depth", "LLM 排程器排队中的请求数", stats["queue_depth"])
+        + gauge_lines("erp_llm_in_flight", "LLM 排程器生成中的请求数", stats["in_flight"])
+        + gauge_lines("erp_llm_queue_wait_p95_seconds", "LLM 排队等待时间 p95", stats["wait_seconds"]["p95"])
+    )
+
+
+metrics_registry.add_collector(_scheduler_metrics)
+metrics_registry.add_collector(
+    lambda: gauge_lines("erp_changefeed_subscribers", "变更推送在线订阅数", changefeed.get_feed().status()["subscribers"])
+)
+
+
+@app.get("/api/health")
+def health_check():
+    """就绪检查：数据库可连接且迁移已全部套用"""
+    pending = schema_pending()
+    if pending:
+        raise HTTPException(status_code=503, detail=f"Pending migrations: {', '.join(pending)}")
+    result = {"status": "ok", "schema_version": migrations.MIGRATIONS[-1].version}
+    if replica_engines:
+        result["replicas"] = replica_status()
+    return result
+
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def prometheus_metrics():
+    """Prometheus 格式的监控指标"""
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
+
+
 # ==================== 静态文件服务 ====================
 # 注意：必须放在所有API路由之后，这样API路由会优先匹配
 frontend_path = os.path.join(os.path.dirname(__file__), "..", "frontend")
@@ -0,0 +1,224 @@
+"""
+數據庫管理命令
+表結構與初始數據在啟動服務前以這裡的命令建立一次，API 的 worker 啟動時只檢查版本，
+多個 worker 不會同時建表、寫入初始數據。
+
+用法：
+    python manage.py init-db            # 套用遷移並在空數據庫寫入示範數據（可重複執行）
+    python manage.py migrate            # 只套用遷移
+    python manage.py status             # 列出各遷移的套用狀態
+    python manage.py seed --seed 42     # 只寫入示範數據（已有數據時跳過）
+    python manage.py generate --orders 1000000 --seed 42   # 追加負載測試用的合成數據
+    python manage.py check              # 數據庫是否可供 API 使用，否則返回非零
+    python manage.py sync-prune --days 30   # 清除 30 天前的刪除記錄（增量同步用）
+    python manage.py archive-orders --after-days 365   # 一年前的已結束訂單移到歸檔表
+    python manage.py replica-sync --every 5   # 每 5 秒把 SQLite 主庫複製到 ERP_REPLICA_URLS 的副本
+"""
+import argparse
+import sys
+import time
+from datetime import date
+
+from database import SessionLocal, engine, init_db, schema_pending, seed_demo_data
+from datagen import DEFAULT_CHUNK_SIZE
+import migrations
+
+
+def cmd_init_db(args):
+    start = time.perf_counter()
+    init_db(seed=args.seed)
+    print(f"數據庫已就緒（{engine.url.render_as_string(hide_password=True)}），耗時 {time.perf_counter() - start:.2f}s")
+
+
+def cmd_migrate(args):
+    versions = migrations.upgrade(engine)
+    print(f"已套用遷移：{', '.join(versions)}" if versions else "數據庫已是最新版本")
+
+
+def cmd_status(args):
+    for row in migrations.status(engine):
+        print(f"{row['version']}  {'✓' if row['applied'] else ' '}  {row['description']}")
+
+
+def cmd_seed(args):
+    pending = schema_pending()
+    if pending:
+        print(f"❌ 尚有未套用的遷移（{', '.join(pending)}），請先執行 python manage.py migrate")
+        sys.exit(1)
+    db = SessionLocal()
+    try:
+        seeded = seed_demo_data(db, seed=args.seed)
+    finally:
+        db.close()
+    print("已寫入示範數據" if seeded else "數據庫已有數據，跳過")
+
+
+def cmd_generate(args):
+    pending = schema_pending()
+    if pending:
+        print(f"❌ 尚有未套用的遷移（{', '.join(pending)}），請先執行 python manage.py migrate")
+        sys.exit(1)
+    from datagen import generate
+
+    def progress(done, total, orders, items):
+        print(f"\r  {done}/{total} 塊，訂單 {orders:,}，明細 {items:,}", end="", flush=True)
+
+    result = generate(args.orders, products=args.products, customers=args.customers, seed=args.seed,
+                      days=args.days, end=args.end_date, workers=args.workers, chunk_size=args.chunk_size,
+                      rebuild=not args.no_rebuild, progress=progress)
+    print()
+    seconds = result["seconds"]
+    print(f"已產生產品 {result['products']:,}、客戶 {result['customers']:,}、訂單 {result['orders']:,}、"
+          f"明細 {result['order_items']:,}（{result['start']} ~ {result['end']}），耗時 {seconds['total']:.1f}s"
+          f"（訂單 {seconds['orders']:.1f}s，{result['orders'] / max(seconds['orders'], 1e-9):,.0f} 筆/秒）")
+
+
+def cmd_check(args):
+    pending = schema_pending()
+    if pending:
+        print(f"❌ 尚有未套用的遷移：{', '.join(pending)}")
+        sys.exit(1)
+    print("✅ 數據庫已是最新版本")
+
+
+def cmd_sync_prune(args):
+    import sync
+    db = SessionLocal()
+    try:
+        removed = sync.prune_tombstones(db, args.days)
+    finally:
+        db.close()
+    print(f"已清除 {removed} 筆刪除記錄")
+
+
+def cmd_stock_snapshot(args):
+    import stock
+    db = SessionLocal()
+    try:
+        result = stock.take_snapshot(db)
+        db.commit()
+    finally:
+        db.close()
+    if result["products"]:
+        print(f"已為 {result['products']} 個產品記下版本 {result['version']} 的庫存快照")
+    else:
+        print(f"版本 {result['version']} 的快照之後沒有庫存異動，跳過")
+
+
+def cmd_stock_reconcile(args):
+    import stock
+    db = SessionLocal()
+    try:
+        result = stock.reconcile(db)
+    finally:
+        db.close()
+    for row in result["mismatches"][:args.show]:
+        print(f"  #{row['product_id']} {row['sku'] or '（已刪除）'}：庫存 {row['stock_quantity']}，異動帳 {row['ledger']}")
+    if result["mismatches"]:
+        print(f"❌ {len(result['mismatches'])} 個產品的庫存與異動帳不一致（共檢查 {result['checked']} 個）")
+        sys.exit(1)
+    print(f"✅ {result['checked']} 個產品的庫存與異動帳一致")
+
+
+def cmd_archive_orders(args):
+    pending = schema_pending()
+    if pending:
+        print(f"❌ 尚有未套用的遷移（{', '.join(pending)}），請先執行 python manage.py migrate")
+        sys.exit(1)
+    import archive
+
+    def progress(orders, items):
+        print(f"\r  已歸檔訂單 {orders:,}，明細 {items:,}", end="", flush=True)
+
+    if args.before:
+        before = args.before.replace(day=1)
+    else:
+        before = archive.cutoff(archive.AFTER_DAYS if args.after_days is None else args.after_days)
+    started = time.perf_counter()
+    result = archive.run(before=before, batch=args.batch or archive.BATCH, progress=progress)
+    if result["orders"]:
+        print()
+    print(f"已把 {result['before']} 之前已完成或已取消的訂單 {result['orders']:,} 筆（明細 {result['items']:,} 筆）"
+          f"移到歸檔表，耗時 {time.perf_counter() - started:.1f}s")
+
+
+def cmd_replica_sync(args):
+    """以 SQLite 線上備份把主庫複製到副本檔案（本機測試讀寫分離用；Postgres 請使用串流複製）"""
+    import sqlite3
+    from sqlalchemy.engine import make_url
+    from database import REPLICA_URLS
+
+    if engine.dialect.name != "sqlite":
+        print("❌ replica-sync 只適用於 SQLite 主庫；其他數據庫請使用該數據庫的複製功能")
+        sys.exit(1)
+    targets = args.to or [make_url(url).database for url in REPLICA_URLS if url.startswith("sqlite")]
+    if not targets:
+        print("❌ 沒有副本：請以 --to 指定檔案，或設定 ERP_REPLICA_URLS")
+        sys.exit(1)
+
+    while True:
+        started = time.perf_counter()
+        source = engine.raw_connection()
+        try:
+            for path in targets:
+                # 備份在副本上持有寫入鎖，讀取副本的請求看到的是複製前或複製後的完整內容
+                target = sqlite3.connect(path, timeout=30)
+                try:
+                    source.driver_connection.backup(target)
+                finally:
+                    target.close()
+        finally:
+            source.close()
+        print(f"已複製到 {', '.join(targets)}，耗時 {time.perf_counter() - started:.2f}s", flush=True)
+        if not args.every:
+            break
+        time.sleep(args.every)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ERP 數據庫管理")
+    sub = parser.add_subparsers(dest="command", required=True)
+    init = sub.add_parser("init-db", help="套用遷移並寫入示範數據")
+    init.add_argument("--seed", type=int, help="隨機種子（固定後每次產生相同的訂單）")
+    init.set_defaults(func=cmd_init_db)
+    sub.add_parser("migrate", help="套用未執行的遷移").set_defaults(func=cmd_migrate)
+    sub.add_parser("status", help="遷移狀態").set_defaults(func=cmd_status)
+    seed = sub.add_parser("seed", help="在空數據庫寫入示範數據")
+    seed.add_argument("--seed", type=int, help="隨機種子（固定後每次產生相同的訂單）")
+    seed.set_defaults(func=cmd_seed)
+    gen = sub.add_parser("generate", help="產生負載測試用的合成數據（追加在現有數據之後）")
+    gen.add_argument("--orders", type=int, default=100_000)
+    gen.add_argument("--products", type=int, default=2000)
+    gen.add_argument("--customers", type=int, default=20000)
+    gen.add_argument("--seed", type=int, default=42, help="隨機種子；相同參數與種子產生相同數據")
+    gen.add_argument("--days", type=int, default=730, help="訂單日期跨越的天數")
+    gen.add_argument("--end-date", type=date.fromisoformat, help="最後一天（預設今天；固定後數據可重現）")
+    gen.add_argument("--workers", type=int, help="子行程數（預設：SQLite 為 1，其他數據庫為 CPU 核心數）")
+    gen.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="每塊（每次提交）的訂單數")
+    gen.add_argument("--no-rebuild", action="store_true", help="不重算銷售彙總與客戶統計")
+    gen.set_defaults(func=cmd_generate)
+    sub.add_parser("check", help="檢查數據庫是否可供 API 使用").set_defaults(func=cmd_check)
+    prune = sub.add_parser("sync-prune", help="清除舊的刪除記錄（版本更早的客戶端改為完整同步）")
+    prune.add_argument("--days", type=int, default=30, help="保留最近幾天的刪除記錄")
+    prune.set_defaults(func=cmd_sync_prune)
+    sub.add_parser("stock-snapshot", help="為有異動的產品記下庫存快照（建議定期執行）") \
+        .set_defaults(func=cmd_stock_snapshot)
+    reconcile = sub.add_parser("stock-reconcile", help="對帳：產品庫存與異動帳結存比較，不一致時返回非零")
+    reconcile.add_argument("--show", type=int, default=20, help="最多列出幾個不一致的產品")
+    reconcile.set_defaults(func=cmd_stock_reconcile)
+    arch = sub.add_parser("archive-orders", help="把舊的已完成/已取消訂單整月移到歸檔表")
+    arch.add_argument("--after-days", type=int, default=None, help="歸檔早於幾天前所在月份的訂單（預設 ERP_ARCHIVE_AFTER_DAYS）")
+    arch.add_argument("--before", type=date.fromisoformat, help="直接指定日期：歸檔此日所在月份之前的訂單")
+    arch.add_argument("--batch", type=int, default=None, help="每個交易的訂單數（預設 ERP_ARCHIVE_BATCH）")
+    arch.set_defaults(func=cmd_archive_orders)
+    replica = sub.add_parser("replica-sync", help="把 SQLite 主庫複製到副本檔案（本機測試讀寫分離）")
+    replica.add_argument("--to", nargs="+", help="副本檔案路徑（預設為 ERP_REPLICA_URLS 中的 SQLite 檔案）")
+    replica.add_argument("--every", type=float, help="每隔幾秒重複複製（模擬複製延遲）；省略時只複製一次")
+    replica.set_defaults(func=cmd_replica_sync)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+"""
+請求層級監控
+ASGI 中間件記錄每個路由的延遲分佈、狀態碼、進行中請求數，以及每個請求的 SQL 語句數與 SQL 耗時，
+以 Prometheus 文字格式輸出到 /metrics。
+可選的取樣分析：每 N 個報表/訂單請求用 pyinstrument 分析一次，慢請求輸出火焰圖 HTML。
+"""
+import functools
+import itertools
+import os
+import threading
+import time
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import telemetry
+from database import engine, replica_engines
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{str(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: LabelValues = (), amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self, kind: str = "counter") -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {kind}"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    def dec(self, labels: LabelValues = (), amount: float = 1.0):
+        self.inc(labels, -amount)
+
+    def render(self, kind: str = "gauge") -> List[str]:
+        return super().render(kind)
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._counts: Dict[LabelValues, List[int]] = {}
+        self._sums: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: LabelValues, value: float):
+        with self._lock:
+            counts = self._counts.setdefault(labels, [0] * (len(self.buckets) + 1))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            self._sums[labels] = self._sums.get(labels, 0.0) + value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, counts in sorted(self._counts.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else _format_value(bound)
+                    le_label = f'le="{le}"'
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le_label)} {cumulative}")
+                label_str = _format_labels(self.labelnames, labels)
+                lines.append(f"{self.name}_sum{label_str} {_format_value(self._sums[labels])}")
+                lines.append(f"{self.name}_count{label_str} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors: List[Callable[[], List[str]]] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], List[str]]):
+        """登記在輸出時才計算的指標（例如 LLM 排程器佇列深度）"""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            lines.extend(collector())
+        return "\n".join(lines) + "\n"
+
+
+def gauge_lines(name: str, documentation: str, value: float) -> List[str]:
+    """單一數值 gauge 的輸出行，供 collector 使用"""
+    return [f"# HELP {name} {documentation}", f"# TYPE {name} gauge", f"{name} {_format_value(value)}"]
+
+
+registry = Registry()
+
+REQUESTS = registry.register(Counter(
+    "erp_http_requests_total", "HTTP 請求數", ("method", "route", "status")))
+LATENCY = registry.register(Histogram(
+    "erp_http_request_duration_seconds", "HTTP 請求延遲", ("method", "route")))
+IN_PROGRESS = registry.register(Gauge(
+    "erp_http_requests_in_progress", "進行中的 HTTP 請求數", ("method",)))
+SQL_STATEMENTS = registry.register(Histogram(
+    "erp_http_request_sql_statements", "每個請求執行的 SQL 語句數", ("method", "route"),
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)))
+SQL_SECONDS = registry.register(Histogram(
+    "erp_http_request_sql_seconds", "每個請求的 SQL 總耗時", ("method", "route"),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)))
+
+
+# ==================== 取樣分析 ====================
+
+PROFILE_EVERY_N = int(os.getenv("ERP_PROFILE_EVERY_N", "0"))  # 0 表示關閉
+PROFILE_SLOW_MS = float(os.getenv("ERP_PROFILE_SLOW_MS", "200"))
+PROFILE_DIR = os.getenv("ERP_PROFILE_DIR", os.path.join(os.path.dirname(__file__), "profiles"))
+PROFILE_PATHS = tuple(p for p in os.getenv("ERP_PROFILE_PATHS", "/api/reports,/api/orders,/api/analytics").split(",") if p)
+
+_profile_counter = itertools.count(1)
+_profiler_available: Optional[bool] = None
+
+
+class RequestStats:
+    """單一請求的 SQL 統計與分析狀態"""
+
+    def __init__(self, profile: bool = False):
+        self.sql_statements = 0
+        self.sql_seconds = 0.0
+        self.profile = profile
+        self.profiler = None
+
+    def add_sql(self, seconds: float):
+        self.sql_statements += 1
+        self.sql_seconds += seconds
+
+
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+def _should_profile(path: str) -> bool:
+    global _profiler_available
+    if PROFILE_EVERY_N <= 0 or not path.startswith(PROFILE_PATHS):
+        return False
+    if next(_profile_counter) % PROFILE_EVERY_N != 0:
+        return False
+    if _profiler_available is None:
+        try:
+            import pyinstrument  # noqa: F401
+            _profiler_available = True
+        except ImportError:
+            print("[Metrics] 未安裝 pyinstrument，取樣分析已停用")
+            _profiler_available = False
+    return _profiler_available
+
+
+def profiled(func):
+    """標記需要取樣分析的同步端點（分析在執行端點的 worker 執行緒內進行）"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        stats = _request_stats.get()
+        if stats is None or not stats.profile:
+            return func(*args, **kwargs)
+
+        from pyinstrument import Profiler
+
+        profiler = Profiler(async_mode="disabled")
+        profiler.start()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profiler.stop()
+            stats.profiler = profiler
+    return wrapper
+
+
+def _dump_profile(profiler, method: str, route: str, duration: float):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    safe_route = route.strip("/").replace("/", "_").replace("{", "").replace("}", "") or "root"
+    filename = f"{time.strftime('%Y%m%d-%H%M%S')}_{method}_{safe_route}_{int(duration * 1000)}ms.html"
+    with open(os.path.join(PROFILE_DIR, filename), "w", encoding="utf-8") as f:
+        f.write(profiler.output_html())
+
+
+# ==================== 中間件 ====================
+
+class MetricsMiddleware:
+    """記錄每個 HTTP 請求的延遲、狀態碼與 SQL 統計"""
+
+    def __init__(self, app):
+        self.app = app
+        for e in [engine] + replica_engines:
+            telemetry.instrument_engine(e)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status_holder = {"status": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_holder["status"] = message["status"]
+            await send(message)
+
+        stats = RequestStats(profile=_should_profile(scope["path"]))
+        token = _request_stats.set(stats)
+        IN_PROGRESS.inc((method,))
+        start = time.perf_counter()
+        try:
+            with telemetry.collect_sql(stats):
+                await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = time.perf_counter() - start
+            IN_PROGRESS.dec((method,))
+            _request_stats.reset(token)
+
+            route = getattr(scope.get("route"), "path", None) or "__other__"
+            REQUESTS.inc((method, route, str(status_holder["status"])))
+            LATENCY.observe((method, route), duration)
+            SQL_STATEMENTS.observe((method, route), stats.sql_statements)
+            SQL_SECONDS.observe((method, route), stats.sql_seconds)
+
+            if stats.profiler is not None and duration * 1000 >= PROFILE_SLOW_MS:
+                _dump_profile(stats.profiler, method, route, duration)
@@ -0,0 +1,446 @@
+"""
+數據庫遷移
+每個遷移有遞增的版本號，已套用的版本記錄在 schema_migrations 表，啟動時只執行尚未套用的遷移。
+遷移內容寫死當時的 DDL，不引用現行模型，之後改動模型不會影響舊遷移的行為；
+舊數據需要回填的衍生資料（客戶主檔、銷售彙總）也在遷移內以當時的表結構計算，任何升級途徑得到相同的數據。
+透過 manage.py 執行（python manage.py migrate / status）。
+"""
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Callable, List, NamedTuple
+
+from sqlalchemy import (
+    Column, Date, DateTime, Float, ForeignKey, Index, Integer, MetaData, String, Table, Text, UniqueConstraint, inspect,
+    select, text,
+)
+from sqlalchemy.engine import Connection, Engine
+
+_metadata = MetaData()
+schema_migrations = Table(
+    "schema_migrations", _metadata,
+    Column("version", String, primary_key=True),
+    Column("description", String),
+    Column("applied_at", DateTime),
+)
+
+
+class Migration(NamedTuple):
+    version: str
+    description: str
+    upgrade: Callable[[Connection], None]
+
+
+def _columns(conn: Connection, table: str) -> set:
+    return {c["name"] for c in inspect(conn).get_columns(table)}
+
+
+# ==================== 遷移內容 ====================
+
+def _initial_schema(conn: Connection):
+    # 引入遷移之前的表結構：產品、訂單、訂單明細（已存在的表不變）
+    initial_metadata = MetaData()
+    Table("products", initial_metadata,
+          Column("id", Integer, primary_key=True, index=True),
+          Column("name", String, unique=True, index=True),
+          Column("sku", String, unique=True, index=True),
+          Column("category", String, index=True),
+          Column("description", Text),
+          Column("price", Float),
+          Column("cost", Float),
+          Column("stock_quantity", Integer, default=0),
+          Column("min_stock_level", Integer, default=10),
+          Column("supplier", String))
+    Table("orders", initial_metadata,
+          Column("id", Integer, primary_key=True, index=True),
+          Column("order_number", String, unique=True, index=True),
+          Column("customer_name", String, index=True),
+          Column("customer_email", String),
+          Column("customer_phone", String),
+          Column("shipping_address", Text),
+          Column("order_date", DateTime),
+          Column("status", String, default="pending"),
+          Column("total_amount", Float, default=0.0),
+          Column("notes", Text))
+    Table("order_items", initial_metadata,
+          Column("id", Integer, primary_key=True, index=True),
+          Column("order_id", Integer, ForeignKey("orders.id")),
+          Column("product_id", Integer, ForeignKey("products.id")),
+          Column("quantity", Integer),
+          Column("unit_price", Float),
+          Column("subtotal", Float),
+          Column("discount", Float, default=0.0))
+    initial_metadata.create_all(bind=conn)
+
+
+def _order_customer_id(conn: Connection):
+    # 客戶主檔與訂單的 customer_id
+    customer_metadata = MetaData()
+    Table("customers", customer_metadata,
+          Column("id", Integer, primary_key=True, index=True),
+          Column("name", String, nullable=False),
+          Column("name_key", String, unique=True, index=True, nullable=False),
+          Column("email", String, index=True),
+          Column("phone", String),
+          Column("address", Text),
+          Column("created_at", DateTime),
+          Column("lifetime_value", Float, default=0.0, index=True),
+          Column("order_count", Integer, default=0),
+          Column("last_order_date", DateTime, index=True))
+    customer_metadata.create_all(bind=conn)
+    if "customer_id" not in _columns(conn, "orders"):
+        conn.execute(text("ALTER TABLE orders ADD COLUMN customer_id INTEGER REFERENCES customers(id)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_orders_customer_date ON orders (customer_id, order_date)"))
+    _backfill_customers(conn, ("orders",))
+
+
+def _backfill_customers(conn: Connection, order_tables):
+    """
+    尚未關聯客戶的訂單按正規化名稱去重寫入 customers 並回填 customer_id，再重算這些客戶的統計（只計已完成訂單）；
+    同一客戶有多組聯絡資料時取最近一筆訂單上的非空值
+    """
+    from customers import name_key  # 與 API 查找客戶相同的正規化規則
+
+    rows = []
+    for table in order_tables:
+        rows += [(table, row) for row in conn.execute(text(
+            f"SELECT id, customer_name, customer_email, customer_phone, shipping_address, order_date "
+            f"FROM {table} WHERE customer_id IS NULL"))]
+    if not rows:
+        return
+    rows.sort(key=lambda r: (str(r[1].order_date or ""), r[1].id))
+
+    contacts = {}
+    for _, row in rows:
+        contact = contacts.setdefault(name_key(row.customer_name), {
+            "name": None, "email": None, "phone": None, "address": None,
+            "created_at": row.order_date or datetime.utcnow()})
+        # 按下單時間遞增走訪，後出現的非空值覆蓋前面的
+        for field, value in (("name", (row.customer_name or "").strip()), ("email", row.customer_email),
+                             ("phone", row.customer_phone), ("address", row.shipping_address)):
+            if value:
+                contact[field] = value
+
+    existing = dict(conn.execute(text("SELECT name_key, id FROM customers")).all())
+    new = [dict(contact, name=contact["name"] or "未知客戶", name_key=key)
+           for key, contact in contacts.items() if key not in existing]
+    if new:
+        conn.execute(text(
+            "INSERT INTO customers (name, name_key, email, phone, address, created_at, lifetime_value, order_count) "
+            "VALUES (:name, :name_key, :email, :phone, :address, :created_at, 0, 0)"), new)
+        existing = dict(conn.execute(text("SELECT name_key, id FROM customers")).all())
+    for table in order_tables:
+        mappings = [{"id": row.id, "customer_id": existing[name_key(row.customer_name)]}
+                    for source, row in rows if source == table]
+        if mappings:
+            conn.execute(text(f"UPDATE {table} SET customer_id = :customer_id WHERE id = :id"), mappings)
+
+    completed = " UNION ALL ".join(
+        f"SELECT customer_id, total_amount, order_date FROM {table} WHERE status = 'completed'" for table in order_tables)
+    touched = sorted({existing[key] for key in contacts})
+    for lo in range(0, len(touched), 500):
+        conn.execute(text(
+            f"UPDATE customers SET "
+            f"lifetime_value = (SELECT COALESCE(SUM(o.total_amount), 0) FROM ({completed}) o WHERE o.customer_id = customers.id), "
+            f"order_count = (SELECT COUNT(*) FROM ({completed}) o WHERE o.customer_id = customers.id), "
+            f"last_order_date = (SELECT MAX(o.order_date) FROM ({completed}) o WHERE o.customer_id = customers.id) "
+            f"WHERE id IN ({', '.join(str(cid) for cid in touched[lo:lo + 500])})"))
+
+
+def _hot_query_indexes(conn: Connection):
+    # 訂單明細按訂單載入（報表、selectinload）、按產品查銷售；訂單按狀態加日期區間篩選
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_order_items_order ON order_items (order_id)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_order_items_product_order ON order_items (product_id, order_id)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_orders_status_date ON orders (status, order_date)"))
+    # 讓查詢規劃器取得新索引的選擇性統計
+    if conn.dialect.name == "sqlite":
+        conn.execute(text("ANALYZE"))
+
+
+def _sync_versions(conn: Connection):
+    # 產品與訂單的同步版本、刪除記錄與版本計數器；既有的行都算在版本 1
+    for table in ("products", "orders"):
+        columns = _columns(conn, table)
+        if "version" not in columns:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN version INTEGER DEFAULT 0"))
+        if "updated_at" not in columns:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN updated_at TIMESTAMP"))
+        conn.execute(text(f"UPDATE {table} SET version = 1 WHERE version IS NULL OR version = 0"))
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table}_version ON {table} (version)"))
+    sync_metadata = MetaData()
+    Table("sync_state", sync_metadata,
+          Column("id", Integer, primary_key=True),
+          Column("version", Integer, nullable=False, default=0),
+          Column("pruned_version", Integer, nullable=False, default=0))
+    Table("sync_tombstones", sync_metadata,
+          Column("id", Integer, primary_key=True),
+          Column("table_name", String, nullable=False),
+          Column("row_id", Integer, nullable=False),
+          Column("version", Integer, nullable=False),
+          Column("deleted_at", DateTime))
+    sync_metadata.create_all(bind=conn)
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_sync_tombstones_version ON sync_tombstones (version)"))
+    if conn.execute(text("SELECT COUNT(*) FROM sync_state")).scalar() == 0:
+        conn.execute(text("INSERT INTO sync_state (id, version, pruned_version) VALUES (1, 1, 0)"))
+
+
+def _stock_ledger(conn: Connection):
+    # 庫存異動帳與快照；既有產品以目前庫存在目前的同步版本建立第一次快照，之後的異動從這裡累加
+    ledger_metadata = MetaData()
+    Table("stock_movements", ledger_metadata,
+          Column("id", Integer, primary_key=True),
+          Column("product_id", Integer, nullable=False),
+          Column("change", Integer, nullable=False),
+          Column("reason", String, nullable=False),
+          Column("order_id", Integer),
+          Column("reference", String),
+          Column("version", Integer, nullable=False),
+          Column("created_at", DateTime))
+    Table("stock_snapshots", ledger_metadata,
+          Column("id", Integer, primary_key=True),
+          Column("product_id", Integer, nullable=False),
+          Column("quantity", Integer, nullable=False),
+          Column("version", Integer, nullable=False),
+          Column("taken_at", DateTime))
+    ledger_metadata.create_all(bind=conn)
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_stock_movements_version ON stock_movements (version)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_stock_movements_product_version "
+                      "ON stock_movements (product_id, version)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_stock_movements_product_created "
+                      "ON stock_movements (product_id, created_at)"))
+    conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ux_stock_snapshots_version_product "
+                      "ON stock_snapshots (version, product_id)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_stock_snapshots_taken ON stock_snapshots (taken_at, version)"))
+    if conn.execute(text("SELECT COUNT(*) FROM stock_snapshots")).scalar() == 0:
+        conn.execute(text(
+            "INSERT INTO stock_snapshots (product_id, quantity, version, taken_at) "
+            "SELECT id, stock_quantity, (SELECT version FROM sync_state WHERE id = 1), :now FROM products "
+            "WHERE stock_quantity != 0"
+        ), {"now": datetime.utcnow()})
+
+
+def _order_archive(conn: Connection):
+    # 歸檔表與 orders / order_items 欄位相同（保留原 id），另記歸檔時間
+    archive_metadata = MetaData()
+    Table("orders_archive", archive_metadata,
+          Column("id", Integer, primary_key=True),
+          Column("order_number", String),
+          Column("customer_id", Integer),
+          Column("customer_name", String),
+          Column("customer_email", String),
+          Column("customer_phone", String),
+          Column("shipping_address", Text),
+          Column("order_date", DateTime),
+          Column("status", String),
+          Column("total_amount", Float),
+          Column("notes", Text),
+          Column("version", Integer),
+          Column("updated_at", DateTime),
+          Column("archived_at", DateTime))
+    Table("order_items_archive", archive_metadata,
+          Column("id", Integer, primary_key=True),
+          Column("order_id", Integer, ForeignKey("orders_archive.id")),
+          Column("product_id", Integer),
+          Column("quantity", Integer),
+          Column("unit_price", Float),
+          Column("subtotal", Float),
+          Column("discount", Float))
+    archive_metadata.create_all(bind=conn)
+    for name, table, columns in (
+        ("ix_orders_archive_customer_date", "orders_archive", "customer_id, order_date"),
+        ("ix_orders_archive_date", "orders_archive", "order_date"),
+        ("ix_order_items_archive_order", "order_items_archive", "order_id"),
+        ("ix_order_items_archive_product_order", "order_items_archive", "product_id, order_id"),
+    ):
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})"))
+    _autoincrement_order_ids(conn)
+
+
+def _autoincrement_order_ids(conn: Connection):
+    """
+    SQLite 的 orders / order_items 改用 AUTOINCREMENT：預設的整數主鍵在刪除最大 id 的行之後會重用該 id，
+    新訂單或明細可能與歸檔表中保留原 id 的行重複。SQLite 不能修改主鍵定義，只能重建表；其他數據庫的序列本來就不重用
+    """
+    if conn.dialect.name != "sqlite":
+        return
+    definition = conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'orders'")).scalar()
+    if "AUTOINCREMENT" not in definition.upper():
+        rebuild_metadata = MetaData()
+        # 外鍵指向的表已存在，只宣告主鍵供 create_all 解析
+        Table("customers", rebuild_metadata, Column("id", Integer, primary_key=True))
+        Table("products", rebuild_metadata, Column("id", Integer, primary_key=True))
+        Table("orders", rebuild_metadata,
+              Column("id", Integer, primary_key=True, index=True),
+              Column("order_number", String, unique=True, index=True),
+              Column("customer_id", Integer, ForeignKey("customers.id")),
+              Column("customer_name", String, index=True),
+              Column("customer_email", String),
+              Column("customer_phone", String),
+              Column("shipping_address", Text),
+              Column("order_date", DateTime),
+              Column("status", String),
+              Column("total_amount", Float),
+              Column("notes", Text),
+              Column("version", Integer, index=True),
+              Column("updated_at", DateTime),
+              Index("ix_orders_customer_date", "customer_id", "order_date"),
+              Index("ix_orders_status_date", "status", "order_date"),
+              sqlite_autoincrement=True)
+        Table("order_items", rebuild_metadata,
+              Column("id", Integer, primary_key=True, index=True),
+              Column("order_id", Integer, ForeignKey("orders.id")),
+              Column("product_id", Integer, ForeignKey("products.id")),
+              Column("quantity", Integer),
+              Column("unit_price", Float),
+              Column("subtotal", Float),
+              Column("discount", Float),
+              Index("ix_order_items_order", "order_id"),
+              Index("ix_order_items_product_order", "product_id", "order_id"),
+              sqlite_autoincrement=True)
+
+        # 舊表的索引先刪除（名稱與新表相同），改名後建立新表、複製數據，再刪除舊表
+        for (index,) in conn.execute(text(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL "
+                "AND tbl_name IN ('orders', 'order_items')")).all():
+            conn.execute(text(f'DROP INDEX "{index}"'))
+        conn.execute(text("ALTER TABLE order_items RENAME TO _order_items_old"))
+        conn.execute(text("ALTER TABLE orders RENAME TO _orders_old"))
+        rebuild_metadata.create_all(bind=conn)
+        for table in (rebuild_metadata.tables["orders"], rebuild_metadata.tables["order_items"]):
+            columns = ", ".join(c.name for c in table.columns)
+            conn.execute(text(f"INSERT INTO {table.name} ({columns}) SELECT {columns} FROM _{table.name}_old"))
+        conn.execute(text("DROP TABLE _order_items_old"))
+        conn.execute(text("DROP TABLE _orders_old"))
+
+    # 計數器從熱表與歸檔表中最大的 id 開始
+    for table, archive in (("orders", "orders_archive"), ("order_items", "order_items_archive")):
+        top = conn.execute(text(
+            f"SELECT MAX(id) FROM (SELECT MAX(id) AS id FROM {table} UNION ALL SELECT MAX(id) FROM {archive})")).scalar()
+        if top is None:
+            continue
+        if conn.execute(text("SELECT COUNT(*) FROM sqlite_sequence WHERE name = :name"), {"name": table}).scalar():
+            conn.execute(text("UPDATE sqlite_sequence SET seq = MAX(seq, :top) WHERE name = :name"),
+                         {"top": top, "name": table})
+        else:
+            conn.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES (:name, :top)"), {"name": table, "top": top})
+
+
+def _sales_rollups(conn: Connection):
+    # 銷售彙總表（引入遷移之前由 create_all 建立，舊數據庫已存在時不變）
+    rollup_metadata = MetaData()
+    Table("sales_rollups", rollup_metadata,
+          Column("id", Integer, primary_key=True, index=True),
+          Column("granularity", String, nullable=False),
+          Column("bucket_start", Date, nullable=False),
+          Column("dimension", String, nullable=False),
+          Column("dimension_key", String, nullable=False, default=""),
+          Column("revenue", Float, default=0.0),
+          Column("order_count", Integer, default=0),
+          Column("units_sold", Integer, default=0),
+          UniqueConstraint("granularity", "dimension", "dimension_key", "bucket_start", name="uq_sales_rollup_bucket"))
+    rollup_metadata.create_all(bind=conn)
+    if conn.execute(text("SELECT COUNT(*) FROM sales_rollups")).scalar() == 0:
+        _rebuild_sales_rollups(conn, (("orders", "order_items"), ("orders_archive", "order_items_archive")))
+
+
+def _rebuild_sales_rollups(conn: Connection, sources):
+    """已完成訂單按日與維度（全部、客戶、產品、類別）GROUP BY，再把日桶加總成週桶、月桶寫入 sales_rollups"""
+    def day_of(value) -> date:
+        return value if isinstance(value, date) else date.fromisoformat(str(value)[:10])
+
+    daily = defaultdict(lambda: [0.0, 0, 0])
+    for orders, items in sources:
+        completed = f"FROM {orders} o WHERE o.status = 'completed'"
+        joined = f"FROM {orders} o JOIN {items} i ON i.order_id = o.id WHERE o.status = 'completed'"
+        for key, dimension in (("''", "all"), ("COALESCE(o.customer_name, '')", "customer")):
+            for d, k, revenue, count in conn.execute(text(
+                    f"SELECT date(o.order_date), {key}, SUM(o.total_amount), COUNT(o.id) {completed} GROUP BY 1, 2")):
+                totals = daily[(day_of(d), dimension, k)]
+                totals[0] += revenue or 0.0
+                totals[1] += count
+            for d, k, units in conn.execute(text(
+                    f"SELECT date(o.order_date), {key}, SUM(i.quantity) {joined} GROUP BY 1, 2")):
+                daily[(day_of(d), dimension, k)][2] += units or 0
+        category = (f"FROM {orders} o JOIN {items} i ON i.order_id = o.id LEFT JOIN products p ON p.id = i.product_id "
+                    f"WHERE o.status = 'completed'")
+        for key, dimension, source in (("i.product_id", "product", joined),
+                                       ("COALESCE(p.category, '未分類')", "category", category)):
+            for d, k, revenue, count, units in conn.execute(text(
+                    f"SELECT date(o.order_date), {key}, SUM(i.subtotal), COUNT(DISTINCT i.order_id), SUM(i.quantity) "
+                    f"{source} GROUP BY 1, 2")):
+                totals = daily[(day_of(d), dimension, str(k))]
+                totals[0] += revenue or 0.0
+                totals[1] += count
+                totals[2] += units or 0
+
+    buckets = defaultdict(lambda: [0.0, 0, 0])
+    for (d, dimension, key), (revenue, count, units) in daily.items():
+        for granularity, start in (("day", d), ("week", d - timedelta(days=d.weekday())), ("month", d.replace(day=1))):
+            row = buckets[(granularity, start, dimension, key)]
+            row[0] += revenue
+            row[1] += count
+            row[2] += units
+    if buckets:
+        conn.execute(text(
+            "INSERT INTO sales_rollups (granularity, bucket_start, dimension, dimension_key, revenue, order_count, units_sold) "
+            "VALUES (:granularity, :bucket_start, :dimension, :key, :revenue, :order_count, :units)"),
+            [{"granularity": g, "bucket_start": start, "dimension": dimension, "key": key, "revenue": round(revenue, 2),
+              "order_count": count, "units": units}
+             for (g, start, dimension, key), (revenue, count, units) in buckets.items()])
+
+
+def _customer_backfill(conn: Connection):
+    # 以較早版本升級、0002 未回填客戶的數據庫；正常情況下沒有需要回填的訂單
+    _backfill_customers(conn, ("orders", "orders_archive"))
+
+
+MIGRATIONS: List[Migration] = [
+    Migration("0001", "初始表結構", _initial_schema),
+    Migration("0002", "訂單關聯客戶主檔（orders.customer_id）", _order_customer_id),
+    Migration("0003", "熱門查詢的複合索引", _hot_query_indexes),
+    Migration("0004", "產品與訂單的同步版本與刪除記錄", _sync_versions),
+    Migration("0005", "庫存異動帳與快照", _stock_ledger),
+    Migration("0006", "訂單歸檔表", _order_archive),
+    Migration("0007", "銷售彙總表", _sales_rollups),
+    Migration("0008", "回填尚未關聯客戶的訂單", _customer_backfill),
+    # 已以較早版本套用 0006 的數據庫（當時未重建表）
+    Migration("0009", "訂單與明細 id 不重用（AUTOINCREMENT）", _autoincrement_order_ids),
+]
+
+
+# ==================== 執行 ====================
+
+def applied_versions(engine: Engine) -> set:
+    with engine.connect() as conn:
+        if not inspect(conn).has_table("schema_migrations"):
+            return set()
+        return {row[0] for row in conn.execute(select(schema_migrations.c.version))}
+
+
+def pending_versions(engine: Engine) -> List[str]:
+    """尚未套用的遷移版本"""
+    done = applied_versions(engine)
+    return [m.version for m in MIGRATIONS if m.version not in done]
+
+
+def upgrade(engine: Engine) -> List[str]:
+    """依版本順序套用尚未執行的遷移，每個遷移與其記錄在同一個交易內；返回本次套用的版本"""
+    _metadata.create_all(bind=engine)
+    done = applied_versions(engine)
+    applied = []
+    for migration in MIGRATIONS:
+        if migration.version in done:
+            continue
+        with engine.begin() as conn:
+            migration.upgrade(conn)
+            conn.execute(schema_migrations.insert().values(
+                version=migration.version, description=migration.description, applied_at=datetime.utcnow()))
+        applied.append(migration.version)
+    return applied
+
+
+def status(engine: Engine) -> List[dict]:
+    """各遷移的套用狀態"""
+    done = applied_versions(engine)
+    return [{"version": m.version, "description": m.description, "applied": m.version in done}
+            for m in MIGRATIONS]
+
@@ -1,6 +1,6 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 from typing import List, Optional
-from datetime import datetime
+from datetime import date, datetime
 
 
 class ProductBase(BaseModel):
@@ -33,11 +33,17 @@ class ProductUpdate(BaseModel):
 
 class Product(ProductBase):
     id: int
+    version: Optional[int] = None
+    updated_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
 
 
+class ProductSearchHit(Product):
+    score: float
+
+
 class OrderItemBase(BaseModel):
     product_id: int
     quantity: int = Field(gt=0)
@@ -75,24 +81,167 @@ class OrderUpdate(BaseModel):
     status: Optional[str] = None
 
 
+class BulkStatusUpdate(BaseModel):
+    order_ids: List[int] = Field(..., min_length=1, max_length=10000)
+    status: str = Field(..., pattern="^(pending|processing|completed|cancelled)$")
+
+
+class BulkStatusResult(BaseModel):
+    status: str
+    updated: int  # 狀態實際改變的訂單數
+    restocked_orders: int  # 取消時加回庫存的訂單數
+    restocked_products: int
+
+
 class Order(OrderBase):
     id: int
     order_number: Optional[str] = None
+    customer_id: Optional[int] = None
     order_date: datetime
     status: str
     total_amount: float
+    version: Optional[int] = None
+    updated_at: Optional[datetime] = None
     items: List[OrderItem] = []
 
     class Config:
         from_attributes = True
 
 
+class SyncDeleted(BaseModel):
+    products: List[int] = []
+    orders: List[int] = []
+
+
+class SyncChanges(BaseModel):
+    version: int  # 下次以 since=version 同步
+    since: int
+    reset: bool = False  # True 時以本次結果取代本地副本（完整快照）
+    products: List[Product] = []
+    orders: List[Order] = []
+    deleted: SyncDeleted = SyncDeleted()
+
+
+class DashboardOrder(BaseModel):
+    id: int
+    order_number: Optional[str] = None
+    customer_name: str
+    order_date: datetime
+    status: str
+    total_amount: float
+
+
+class Dashboard(BaseModel):
+    month_start: date
+    month_orders: int  # 本月訂單（全部狀態）
+    month_revenue: float  # 本月已完成訂單的營收
+    pending_orders: int
+    stock_alerts: int  # 庫存低於最低庫存的產品數
+    recent_orders: List[DashboardOrder]
+    version: int  # 計算時的同步版本
+
+
+class Customer(BaseModel):
+    id: int
+    name: str
+    email: Optional[str] = None
+    phone: Optional[str] = None
+    address: Optional[str] = None
+    created_at: Optional[datetime] = None
+    # 以下統計只計已完成訂單
+    lifetime_value: float = 0.0
+    order_count: int = 0
+    last_order_date: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+class RestockLine(BaseModel):
+    sku: Optional[str] = None
+    product_id: Optional[int] = None
+    quantity: int = Field(..., gt=0)
+
+    @model_validator(mode="after")
+    def _one_key(self):
+        if (self.sku is None) == (self.product_id is None):
+            raise ValueError("sku 與 product_id 需填且只填一個")
+        return self
+
+
+class RestockReceipt(BaseModel):
+    items: List[RestockLine] = Field(..., min_length=1, max_length=10000)
+    reference: Optional[str] = None  # 進貨單號
+
+
+class RestockedProduct(BaseModel):
+    product_id: int
+    sku: str
+    name: str
+    old_stock: int
+    new_stock: int
+    added: int
+
+
+class RestockResult(BaseModel):
+    reference: Optional[str] = None
+    total_quantity: int
+    products: List[RestockedProduct]
+
+
+class StockMovement(BaseModel):
+    id: int
+    change: int
+    balance: int
+    reason: str
+    order_id: Optional[int] = None
+    reference: Optional[str] = None
+    version: int
+    created_at: datetime
+
+
+class StockHistory(BaseModel):
+    product_id: int
+    start: Optional[datetime] = None
+    end: Optional[datetime] = None
+    opening_balance: int
+    closing_balance: int
+    movements: List[StockMovement]
+    truncated: bool
+
+
+class StockLevel(BaseModel):
+    product_id: int
+    stock_quantity: int
+
+
+class StockMismatch(BaseModel):
+    product_id: int
+    sku: Optional[str] = None
+    stock_quantity: Optional[int] = None
+    ledger: int
+
+
+class StockReconciliation(BaseModel):
+    checked: int
+    mismatches: List[StockMismatch]
+
+
+class StockSnapshotResult(BaseModel):
+    version: int
+    products: int
+
+
 class StockAlert(BaseModel):
     product_id: int
     product_name: str
     current_stock: int
     min_stock_level: int
     shortage: int
+    # 以下欄位僅在 use_forecast=true 時提供
+    reorder_point: Optional[int] = None
+    daily_demand: Optional[float] = None
+    suggested_restock: Optional[int] = None
 
 
 class SalesReport(BaseModel):
@@ -109,3 +258,68 @@ class InventoryReport(BaseModel):
     total_stock_value: float
     low_stock_products: List[StockAlert]
     out_of_stock_count: int
+
+
+class SalesTimeseriesPoint(BaseModel):
+    bucket_start: date
+    dimension_key: str
+    label: Optional[str] = None
+    revenue: float
+    order_count: int
+    units_sold: int
+
+
+class SalesTimeseries(BaseModel):
+    start: date
+    end: date
+    granularity: str
+    dimension: str
+    points: List[SalesTimeseriesPoint]
+    total_revenue: float
+    total_orders: int
+    total_units: int
+    rows_read: int
+
+
+class CategoryMargin(BaseModel):
+    category: str
+    revenue: float
+    cost: float
+    margin: float
+    margin_pct: float
+    units_sold: int
+    order_items: int
+    items_without_cost: int
+
+
+class CustomerRank(BaseModel):
+    rank: int
+    customer_name: str
+    revenue: float
+    order_count: int
+    avg_order_value: float
+    units_sold: int
+    last_order_date: str
+
+
+class DiscountImpact(BaseModel):
+    discount_range: str
+    order_items: int
+    units_sold: int
+    revenue: float
+    discount_amount: float
+    margin: float
+    margin_pct: float
+    avg_units_per_item: float
+
+
+class ProductForecast(BaseModel):
+    product_id: int
+    product_name: Optional[str] = None
+    current_stock: int
+    daily_demand: float
+    safety_stock: float
+    reorder_point: int
+    suggested_restock: int
+    days_of_cover: Optional[float] = None
+    has_history: bool
@@ -0,0 +1,87 @@
+"""
+訂單狀態轉換
+單筆（PUT /api/orders/{id}）與批量（POST /api/orders/bulk-status）共用，同一交易內：
+
+- 取消尚未完成的訂單時加回庫存（stock.restock_orders，一條 set-based 語句）；
+- 進入或離開 completed 的訂單以一次 upsert 更新銷售彙總，再重算相關客戶的統計；
+- 狀態以一條 UPDATE 寫入並帶上同步版本，變更推送補上 order.status_changed（筆數太多時改送 resync）。
+
+每個 IN 列表最多 stock.IN_CHUNK 筆，語句數與訂單數無關（除以分塊大小）。
+"""
+from datetime import datetime
+from typing import Dict, List, Sequence
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session, selectinload
+
+import changefeed
+import customers
+import rollups
+import stock
+from database import Order as DBOrder, OrderItem as DBOrderItem, transaction_sync_version
+
+STATUSES = ("pending", "processing", "completed", "cancelled")
+
+_orders = DBOrder.__table__
+
+
+def missing(db: Session, order_ids: Sequence[int]) -> List[int]:
+    """不存在的訂單 id"""
+    wanted = set(order_ids)
+    found = set()
+    for chunk in stock.chunks(sorted(wanted)):
+        found.update(db.execute(select(_orders.c.id).where(_orders.c.id.in_(chunk))).scalars())
+    return sorted(wanted - found)
+
+
+def transition(db: Session, order_ids: Sequence[int], status: str) -> Dict:
+    """把訂單改為 status（不提交）；已是該狀態的訂單不變"""
+    db.flush()
+    rows = []
+    for chunk in stock.chunks(sorted(set(order_ids))):
+        rows += db.execute(
+            select(_orders.c.id, _orders.c.order_number, _orders.c.customer_id, _orders.c.customer_name,
+                   _orders.c.order_date, _orders.c.status, _orders.c.total_amount)
+            .where(_orders.c.id.in_(chunk), _orders.c.status.is_distinct_from(status))
+        ).all()
+    if not rows:
+        return {"status": status, "updated": 0, "restocked_orders": 0, "restocked_products": 0}
+
+    # 與單筆更新相同：只有取消尚未完成的訂單才加回庫存
+    restock = [r.id for r in rows if status == "cancelled" and r.status not in ("cancelled", "completed")]
+    restocked = stock.restock_orders(db, restock)
+
+    # 銷售彙總需要明細與產品類別，只載入跨越 completed 的訂單
+    crossing = [r for r in rows if (r.status == "completed") != (status == "completed")]
+    if crossing:
+        loaded = []
+        for chunk in stock.chunks([r.id for r in crossing]):
+            loaded += db.query(DBOrder).filter(DBOrder.id.in_(chunk)) \
+                .options(selectinload(DBOrder.items).selectinload(DBOrderItem.product)).all()
+        rollups.apply_orders(db, loaded, 1 if status == "completed" else -1)
+
+    version = transaction_sync_version(db)
+    now = datetime.utcnow()
+    for chunk in stock.chunks([r.id for r in rows]):
+        db.execute(update(_orders).where(_orders.c.id.in_(chunk))
+                   .values(status=status, version=version, updated_at=now))
+    _expire_loaded(db, {r.id for r in rows})
+    customers.refresh_stats(db, [r.customer_id for r in crossing])
+
+    if len(rows) > changefeed.BULK_EVENTS:
+        changefeed.resync(db, "orders")
+    else:
+        for r in rows:
+            changefeed.record(db, "order.status_changed", {
+                "id": r.id, "order_number": r.order_number, "customer_name": r.customer_name,
+                "order_date": r.order_date, "status": status, "total_amount": r.total_amount,
+                "old_status": r.status,
+            })
+    return {"status": status, "updated": len(rows), "restocked_orders": len(restock),
+            "restocked_products": len(restocked)}
+
+
+def _expire_loaded(db: Session, order_ids):
+    for obj in list(db.identity_map.values()):
+        if isinstance(obj, DBOrder) and obj.id in order_ids:
+            db.expire(obj, ["status", "version", "updated_at"])
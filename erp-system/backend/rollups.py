@@ -0,0 +1,267 @@
+"""
+銷售彙總（rollup）
+已完成訂單的營收、訂單數與銷量按日/週/月與維度（全部、產品、類別、客戶）預先累計。
+訂單進入或離開 completed 狀態時增量更新；查詢任意日期區間時，
+完整的粗粒度桶直接讀取，邊緣不完整的部分再用較細的桶補齊。
+"""
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func, tuple_
+from sqlalchemy.orm import Session
+
+from database import (
+    ORDER_SOURCES, Order as DBOrder, Product as DBProduct, SalesRollup, upsert_insert,
+)
+
+GRANULARITIES = ("day", "week", "month")
+DIMENSIONS = ("all", "product", "category", "customer")
+UNCATEGORIZED = "未分類"
+
+Key = Tuple[str, str]  # (dimension, dimension_key)
+
+
+# ==================== 時間桶 ====================
+
+def bucket_start(day: date, granularity: str) -> date:
+    """日期所屬桶的起始日"""
+    if granularity == "day":
+        return day
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+def bucket_end(start: date, granularity: str) -> date:
+    """桶的最後一天（含）"""
+    if granularity == "day":
+        return start
+    if granularity == "week":
+        return start + timedelta(days=6)
+    next_month = (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return next_month - timedelta(days=1)
+
+
+def _cover(start: date, end: date, levels: Tuple[str, ...]) -> List[Tuple[str, date]]:
+    """用盡量粗的桶覆蓋 [start, end]，返回 (粒度, 桶起始日) 列表"""
+    segments = []
+    day = start
+    while day <= end:
+        for granularity in levels:
+            bucket = bucket_start(day, granularity)
+            if bucket == day and bucket_end(bucket, granularity) <= end:
+                segments.append((granularity, bucket))
+                day = bucket_end(bucket, granularity) + timedelta(days=1)
+                break
+    return segments
+
+
+# ==================== 增量更新 ====================
+
+def _order_contributions(order: DBOrder) -> Dict[Key, List[float]]:
+    """一張訂單對各維度的貢獻：[營收, 訂單數, 銷量]"""
+    contributions: Dict[Key, List[float]] = {}
+    units = sum(item.quantity for item in order.items)
+    contributions[("all", "")] = [order.total_amount or 0.0, 1, units]
+    contributions[("customer", order.customer_name or "")] = [order.total_amount or 0.0, 1, units]
+
+    categories = set()
+    for item in order.items:
+        product_key = ("product", str(item.product_id))
+        row = contributions.setdefault(product_key, [0.0, 1, 0])
+        row[0] += item.subtotal or 0.0
+        row[2] += item.quantity
+
+        category = (item.product.category if item.product else None) or UNCATEGORIZED
+        category_key = ("category", category)
+        row = contributions.setdefault(category_key, [0.0, 0, 0])
+        if category not in categories:
+            categories.add(category)
+            row[1] = 1
+        row[0] += item.subtotal or 0.0
+        row[2] += item.quantity
+    return contributions
+
+
+def apply_order(db: Session, order: DBOrder, sign: int = 1):
+    """
+    把訂單計入（sign=1）或移出（sign=-1）銷售彙總。
+    以 upsert 在數據庫內累加，並發完成的訂單落在同一個桶時不會各自插入一行而違反唯一約束
+    """
+    apply_orders(db, [order], sign)
+
+
+def apply_orders(db: Session, orders: List[DBOrder], sign: int = 1):
+    """多張訂單的貢獻先按桶合併，再以一次 upsert 寫入（批量變更狀態時使用，明細與產品需預先載入）"""
+    totals: Dict[Tuple[str, date, str, str], List[float]] = {}
+    for order in orders:
+        day = order.order_date.date()
+        for (dimension, key), contribution in _order_contributions(order).items():
+            for granularity in GRANULARITIES:
+                row = totals.setdefault((granularity, bucket_start(day, granularity), dimension, key), [0.0, 0, 0])
+                for i, value in enumerate(contribution):
+                    row[i] += value
+    if not totals:
+        return
+    deltas = [
+        {"granularity": granularity, "bucket_start": start, "dimension": dimension, "dimension_key": key,
+         "revenue": round(sign * revenue, 2), "order_count": sign * count, "units_sold": sign * units}
+        for (granularity, start, dimension, key), (revenue, count, units) in totals.items()
+    ]
+    insert = upsert_insert(db)
+    if insert is None:
+        _apply_deltas(db, deltas)
+        return
+
+    table = SalesRollup.__table__
+    stmt = insert(table)
+    revenue = table.c.revenue + stmt.excluded.revenue
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["granularity", "dimension", "dimension_key", "bucket_start"],
+        set_={"revenue": func.round(revenue, 2) if db.get_bind().dialect.name == "sqlite" else revenue,
+              "order_count": table.c.order_count + stmt.excluded.order_count,
+              "units_sold": table.c.units_sold + stmt.excluded.units_sold},
+    )
+    db.execute(stmt, deltas)
+
+
+def _apply_deltas(db: Session, deltas: List[Dict]):
+    """不支援 upsert 的數據庫：先查出既有的桶再在 ORM 物件上累加"""
+    keys = {(d["dimension"], d["dimension_key"]) for d in deltas}
+    existing = db.query(SalesRollup).filter(
+        SalesRollup.bucket_start.in_({d["bucket_start"] for d in deltas}),
+        tuple_(SalesRollup.dimension, SalesRollup.dimension_key).in_(list(keys))
+    ).all()
+    rows = {(r.granularity, r.bucket_start, r.dimension, r.dimension_key): r for r in existing}
+    for d in deltas:
+        row = rows.get((d["granularity"], d["bucket_start"], d["dimension"], d["dimension_key"]))
+        if row is None:
+            row = SalesRollup(granularity=d["granularity"], bucket_start=d["bucket_start"], dimension=d["dimension"],
+                              dimension_key=d["dimension_key"], revenue=0.0, order_count=0, units_sold=0)
+            db.add(row)
+        row.revenue = round(row.revenue + d["revenue"], 2)
+        row.order_count += d["order_count"]
+        row.units_sold += d["units_sold"]
+
+
+def on_status_change(db: Session, order: DBOrder, old_status: Optional[str], new_status: Optional[str]):
+    """訂單狀態變化時更新彙總（只有已完成訂單計入營收）"""
+    was_completed = old_status == "completed"
+    is_completed = new_status == "completed"
+    if was_completed != is_completed:
+        apply_order(db, order, 1 if is_completed else -1)
+
+
+def _day(value) -> date:
+    # SQLite 的 date() 返回字串，其他數據庫返回 date
+    return value if isinstance(value, date) else date.fromisoformat(str(value)[:10])
+
+
+def _add_daily(db: Session, daily: Dict[Tuple[date, str, str], List[float]], order_model, item_model):
+    """一個訂單來源（熱表或歸檔）按日與維度的營收、訂單數與銷量，累加到 daily"""
+    day = func.date(order_model.order_date)
+    completed = order_model.status == "completed"
+    customer = func.coalesce(order_model.customer_name, "")
+    category = func.coalesce(DBProduct.category, UNCATEGORIZED)
+
+    # 全部、客戶：營收與訂單數按訂單加總，銷量按明細加總
+    for key_expr, dimension in ((None, "all"), (customer, "customer")):
+        columns = [day] + ([key_expr] if key_expr is not None else [])
+        for row in db.query(*columns, func.sum(order_model.total_amount), func.count(order_model.id)) \
+                .filter(completed).group_by(*columns):
+            totals = daily[(_day(row[0]), dimension, row[1] if key_expr is not None else "")]
+            totals[0] += row[-2] or 0.0
+            totals[1] += row[-1]
+        for row in db.query(*columns, func.sum(item_model.quantity)) \
+                .join(item_model, item_model.order_id == order_model.id).filter(completed).group_by(*columns):
+            daily[(_day(row[0]), dimension, row[1] if key_expr is not None else "")][2] += row[-1] or 0
+
+    # 產品、類別：營收為明細小計，訂單數為含該產品/類別的訂單數
+    for key_expr, dimension in ((item_model.product_id, "product"), (category, "category")):
+        query = db.query(day, key_expr, func.sum(item_model.subtotal),
+                         func.count(func.distinct(item_model.order_id)), func.sum(item_model.quantity)) \
+            .select_from(order_model).join(item_model, item_model.order_id == order_model.id)
+        if dimension == "category":
+            query = query.outerjoin(DBProduct, DBProduct.id == item_model.product_id)
+        for d, key, revenue, orders, units in query.filter(completed).group_by(day, key_expr):
+            totals = daily[(_day(d), dimension, str(key))]
+            totals[0] += revenue or 0.0
+            totals[1] += orders
+            totals[2] += units or 0
+
+
+def rebuild_sales_rollups(db: Session):
+    """
+    由訂單數據重新計算全部彙總：在數據庫按日與維度 GROUP BY，再把日桶加總成週桶、月桶。
+    每張訂單只屬於一天，訂單數在日桶之上可以直接相加
+    """
+    db.flush()
+    db.query(SalesRollup).delete()
+    daily: Dict[Tuple[date, str, str], List[float]] = defaultdict(lambda: [0.0, 0, 0])
+    # 已歸檔的訂單同樣計入（見 archive.py），兩邊分別 GROUP BY 後在日桶相加
+    for order_model, item_model in ORDER_SOURCES:
+        _add_daily(db, daily, order_model, item_model)
+
+    totals: Dict[Tuple[str, date, str, str], List[float]] = defaultdict(lambda: [0.0, 0, 0])
+    for (d, dimension, key), (revenue, orders, units) in daily.items():
+        for granularity in GRANULARITIES:
+            row = totals[(granularity, bucket_start(d, granularity), dimension, key)]
+            row[0] += revenue
+            row[1] += orders
+            row[2] += units
+
+    db.bulk_insert_mappings(SalesRollup, [
+        {"granularity": g, "bucket_start": start, "dimension": dimension, "dimension_key": key,
+         "revenue": round(revenue, 2), "order_count": orders, "units_sold": units}
+        for (g, start, dimension, key), (revenue, orders, units) in totals.items()
+    ])
+
+
+# ==================== 查詢 ====================
+
+def query_timeseries(db: Session, start: date, end: date, granularity: str = "month",
+                     dimension: str = "all", key: Optional[str] = None) -> Dict:
+    """按輸出粒度返回 [start, end] 內的時間序列，以及實際讀取的彙總行數"""
+    finer = GRANULARITIES[:GRANULARITIES.index(granularity) + 1][::-1]
+
+    # 每個輸出桶：完整時直接讀同粒度的桶，被區間截斷時用完全落在區間內的較細桶拼接
+    segments_by_output: Dict[date, List[Tuple[str, date]]] = {}
+    output = bucket_start(start, granularity)
+    while output <= end:
+        clipped_start = max(output, start)
+        clipped_end = min(bucket_end(output, granularity), end)
+        segments_by_output[output] = _cover(clipped_start, clipped_end, finer)
+        output = bucket_end(output, granularity) + timedelta(days=1)
+
+    needed: Dict[str, set] = defaultdict(set)
+    owner: Dict[Tuple[str, date], date] = {}
+    for output, segments in segments_by_output.items():
+        for g, seg_start in segments:
+            needed[g].add(seg_start)
+            owner[(g, seg_start)] = output
+
+    series: Dict[Tuple[date, str], List[float]] = defaultdict(lambda: [0.0, 0, 0])
+    rows_read = 0
+    for g, starts in needed.items():
+        query = db.query(SalesRollup).filter(
+            SalesRollup.granularity == g,
+            SalesRollup.dimension == dimension,
+            SalesRollup.bucket_start.in_(starts)
+        )
+        if key is not None:
+            query = query.filter(SalesRollup.dimension_key == key)
+        for row in query:
+            rows_read += 1
+            bucket = series[(owner[(g, row.bucket_start)], row.dimension_key)]
+            bucket[0] += row.revenue
+            bucket[1] += row.order_count
+            bucket[2] += row.units_sold
+
+    points = [
+        {"bucket_start": bucket, "dimension_key": dim_key, "revenue": round(revenue, 2),
+         "order_count": int(orders), "units_sold": int(units)}
+        for (bucket, dim_key), (revenue, orders, units) in sorted(series.items())
+        if orders or units or revenue
+    ]
+    return {"points": points, "rows_read": rows_read}
@@ -0,0 +1,230 @@
+"""
+產品搜尋索引
+常駐記憶體的倒排索引，涵蓋 Product 的 name、sku、description、category、supplier。
+英數字詞以 trigram 切分（容許拼錯、缺字），中文以單字與雙字切分，兩者可混合查詢。
+索引在啟動時於背景建立（或第一次搜尋時），記下建立時的同步版本；之後每次搜尋前比對 sync.head()，
+版本改變時只讀取版本更新的產品與刪除記錄，其他 worker 或 manage.py 提交的寫入同樣會反映到索引。
+計分時把每個查詢 gram 的倒排列表轉為 NumPy 陣列後以 bincount 累加，
+「sku」這類幾乎每個產品都有的 gram 也不需要逐筆走訪字典。
+"""
+import re
+import threading
+import unicodedata
+from collections import defaultdict
+from functools import lru_cache
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+import sync
+from database import SessionLocal, Product as DBProduct, SyncTombstone
+
+# 欄位權重：名稱與 SKU 最重要
+FIELDS = (("name", 3.0), ("sku", 3.0), ("category", 2.0), ("supplier", 1.5), ("description", 1.0))
+MIN_SCORE = 0.35
+# 名稱/SKU 加分只檢查原始分數最高的 max(limit × 20, 200) 個產品
+BONUS_POOL_FACTOR = 20
+BONUS_POOL_MIN = 200
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+|[㐀-鿿豈-﫿]+")
+
+
+def normalize(text: Optional[str]) -> str:
+    """全形轉半形、轉小寫"""
+    return unicodedata.normalize("NFKC", text or "").lower()
+
+
+def grams(text: Optional[str]) -> Set[str]:
+    """切分為索引單位：英數字詞的 trigram（前後補空白），中文的單字與雙字"""
+    result = set()
+    for token in _TOKEN_RE.findall(normalize(text)):
+        if token[0].isascii():
+            padded = f"  {token} "
+            result.update(padded[i:i + 3] for i in range(len(padded) - 2))
+        else:
+            result.update(token)
+            result.update(token[i:i + 2] for i in range(len(token) - 1))
+    return result
+
+
+@lru_cache(maxsize=8192)
+def _field_grams(text: Optional[str]) -> frozenset:
+    # 類別、供應商等欄位大量重複，快取切分結果可讓重建索引快數倍
+    return frozenset(grams(text))
+
+
+class ProductIndex:
+    """gram → {產品 id: 欄位權重} 的倒排索引"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._build_lock = threading.Lock()
+        self._postings: Dict[str, Dict[int, float]] = defaultdict(dict)
+        self._arrays: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}  # gram → (產品 id, 權重)，查詢時才建立
+        self._docs: Dict[int, Tuple[Dict[str, float], str, str]] = {}  # id → (gram 權重, 名稱, sku)
+        self._skus: Dict[str, int] = {}
+        self.version = 0  # 索引已包含同步版本 ≤ version 的產品寫入
+        self.ready = False
+
+    def _remove(self, product_id: int):
+        doc = self._docs.pop(product_id, None)
+        if doc is None:
+            return
+        if self._skus.get(doc[2]) == product_id:
+            del self._skus[doc[2]]
+        for gram in doc[0]:
+            self._arrays.pop(gram, None)
+            posting = self._postings.get(gram)
+            if posting is not None:
+                posting.pop(product_id, None)
+                if not posting:
+                    del self._postings[gram]
+
+    def upsert(self, product_id: int, fields: Dict[str, Optional[str]]):
+        weights: Dict[str, float] = {}
+        for field, weight in FIELDS:
+            for gram in _field_grams(fields.get(field)):
+                if weight > weights.get(gram, 0.0):
+                    weights[gram] = weight
+        with self._lock:
+            self._remove(product_id)
+            sku = normalize(fields.get("sku"))
+            self._docs[product_id] = (weights, normalize(fields.get("name")), sku)
+            self._skus[sku] = product_id
+            for gram, weight in weights.items():
+                self._postings[gram][product_id] = weight
+                self._arrays.pop(gram, None)
+
+    def delete(self, product_id: int):
+        with self._lock:
+            self._remove(product_id)
+
+    def rebuild(self):
+        """從數據庫重建整個索引"""
+        with self._build_lock:
+            self._load()
+
+    def ensure_ready(self):
+        """索引尚未建立時建立（背景建立中則等待完成）；已建立但同步版本改變時套用之後的產品寫入"""
+        if not self.ready:
+            with self._build_lock:
+                if not self.ready:
+                    self._load()
+                    return
+        if sync.head() != self.version:
+            with self._build_lock:
+                self._catch_up()
+
+    def _load(self):
+        # 先讀版本再讀產品：讀取期間提交的寫入版本較大，下次搜尋時會再套用一次
+        version = sync.head()
+        db = SessionLocal()
+        try:
+            rows = db.query(DBProduct.id, *(getattr(DBProduct, f) for f, _ in FIELDS)).all()
+        finally:
+            db.close()
+        with self._lock:
+            self._postings.clear()
+            self._arrays.clear()
+            self._skus.clear()
+            self._docs.clear()
+            for row in rows:
+                self.upsert(row.id, {f: getattr(row, f) for f, _ in FIELDS})
+            self.version = version
+            self.ready = True
+
+    def _catch_up(self):
+        """套用版本大於 self.version 的產品寫入與刪除；需要的刪除記錄已被清除時整個重建"""
+        db = SessionLocal()
+        try:
+            version, pruned = sync.current_version(db)
+            if version == self.version:
+                return
+            if self.version < pruned:
+                rows = deleted = None
+            else:
+                rows = db.query(DBProduct.id, *(getattr(DBProduct, f) for f, _ in FIELDS)).filter(
+                    DBProduct.version > self.version, DBProduct.version <= version).all()
+                deleted = db.query(SyncTombstone.row_id).filter(
+                    SyncTombstone.table_name == "products", SyncTombstone.version > self.version,
+                    SyncTombstone.version <= version).distinct().all()
+        finally:
+            db.close()
+        if rows is None:
+            self._load()
+            return
+        alive = {row.id for row in rows}
+        with self._lock:
+            for (product_id,) in deleted:
+                if product_id not in alive:
+                    self._remove(product_id)
+            for row in rows:
+                self.upsert(row.id, {f: getattr(row, f) for f, _ in FIELDS})
+            self.version = version
+
+    def _posting_array(self, gram: str) -> Tuple[np.ndarray, np.ndarray]:
+        arrays = self._arrays.get(gram)
+        if arrays is None:
+            posting = self._postings.get(gram, {})
+            arrays = (np.fromiter(posting.keys(), dtype=np.int64, count=len(posting)),
+                      np.fromiter(posting.values(), dtype=np.float64, count=len(posting)))
+            if posting:
+                self._arrays[gram] = arrays
+        return arrays
+
+    def search(self, query: str, limit: int = 10, min_score: float = MIN_SCORE) -> List[Tuple[int, float]]:
+        """返回 [(產品 id, 分數)]；分數為命中的查詢 gram 權重佔比，名稱/SKU 完整包含查詢時加分"""
+        self.ensure_ready()
+        query_grams = grams(query)
+        if not query_grams:
+            return []
+        needle = normalize(query).strip()
+        max_weight = FIELDS[0][1] * len(query_grams)
+
+        with self._lock:
+            arrays = [self._posting_array(gram) for gram in query_grams]
+            ids = np.concatenate([a[0] for a in arrays])
+            if not len(ids):
+                return []
+            scores = np.bincount(ids, weights=np.concatenate([a[1] for a in arrays])) / max_weight
+            candidates = np.flatnonzero(scores >= min_score)
+            # 加分只會調整排序：取原始分數最高的一批（同分取 id 小者）逐筆檢查，另加 SKU 完全相符的產品
+            pool = max(limit * BONUS_POOL_FACTOR, BONUS_POOL_MIN)
+            if len(candidates) > pool:
+                top = scores[candidates]
+                kth = np.partition(top, len(top) - pool)[len(top) - pool]
+                above = candidates[top > kth]
+                candidates = np.concatenate([above, candidates[top == kth][:pool - len(above)]])
+            candidates = set(candidates.tolist())
+            if needle in self._skus:
+                candidates.add(self._skus[needle])
+
+            results = []
+            for product_id in candidates:
+                score = float(scores[product_id]) if product_id < len(scores) else 0.0
+                _, name, sku = self._docs[product_id]
+                if needle and (needle == sku or needle in name):
+                    score += 1.0 if name.startswith(needle) or needle == sku else 0.5
+                if score >= min_score:
+                    results.append((product_id, round(score, 4)))
+
+        results.sort(key=lambda r: (-r[1], r[0]))
+        return results[:limit]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"products": len(self._docs), "grams": len(self._postings)}
+
+
+product_index = ProductIndex()
+
+
+def get_index() -> ProductIndex:
+    """獲取產品索引實例"""
+    return product_index
+
+
+def warm_up():
+    """在背景執行緒建立索引，避免第一次搜尋等待"""
+    threading.Thread(target=product_index.ensure_ready, name="search-index", daemon=True).start()
+
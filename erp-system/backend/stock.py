@@ -0,0 +1,362 @@
+"""
+庫存調整
+下單以條件式 UPDATE 扣減（stock_quantity >= 數量），不先讀後寫：檢查與扣減在同一條語句，
+並發下單同一個熱門產品時不會超賣，也不必在讀取庫存後一直持有產品行的鎖。
+取消或刪除訂單時按明細加回庫存，以一條 UPDATE products ... FROM (按產品加總的明細) 完成，
+不逐筆載入明細與產品；訂單數多時按 IN_CHUNK 筆一條語句。
+進貨（批量補貨）先一次查出全部 SKU 與 id，有不存在的產品時整批不執行；
+各產品的增量以一次 executemany 寫入，再一次讀回調整後的庫存。
+
+這些是 Core 語句，不經過 flush：同步版本直接寫在語句裡，stock.changed 與預警事件以 changefeed.record_stock 補上，
+Session 中已載入的產品庫存標記為過期，異動帳也在同一個交易內自行寫入。
+
+異動帳（stock_movements）只新增不修改，ORM 寫入的庫存變化由 database._record_stock_movements 記錄；
+快照（stock_snapshots）定期記下全部產品在某個同步版本的結存（python manage.py stock-snapshot）。
+時間點庫存、異動歷史與對帳都從最近一次快照加上之後的少量異動算出（按版本索引讀取），不必從頭加總整本帳。
+"""
+import csv
+import io
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from sqlalchemy import bindparam, func, insert, literal, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+import changefeed
+from database import (OrderItem as DBOrderItem, Product as DBProduct, StockMovement, StockSnapshot, SyncState,
+                      transaction_sync_version, upsert_insert)
+
+IN_CHUNK = 500  # 每條語句的 IN 列表長度
+MAX_RECEIPT_LINES = 10000
+
+_products = DBProduct.__table__
+_items = DBOrderItem.__table__
+_movements = StockMovement.__table__
+_snapshots = StockSnapshot.__table__
+
+
+def chunks(ids: Sequence[int], size: int = IN_CHUNK) -> Iterator[List[int]]:
+    ids = list(ids)
+    for i in range(0, len(ids), size):
+        yield ids[i:i + size]
+
+
+def movement_reason(db: Session, reason: str, order_id: Optional[int] = None, reference: Optional[str] = None):
+    """標記本交易之後 ORM 庫存變化的異動原因，提交或回滾後清除"""
+    db.info["stock_reason"] = (reason, order_id, reference)
+
+
+class InsufficientStock(Exception):
+    def __init__(self, product_id: int, name: Optional[str], available: int):
+        super().__init__(f"Insufficient stock for {name}. Available: {available}")
+        self.product_id = product_id
+        self.name = name
+        self.available = available
+
+
+def take(db: Session, quantities: Dict[int, int], order_id: Optional[int] = None) -> List["Adjusted"]:
+    """
+    按 {產品 id: 數量} 扣減庫存並記入異動帳（reason=order），返回調整前後的庫存；
+    任一產品不足時拋出 InsufficientStock，由呼叫者回滾整個交易。
+    按產品 id 順序逐條扣減，多個訂單同時鎖定相同的幾個產品時不會互相死鎖
+    """
+    if not quantities:
+        return []
+    db.flush()
+    version = transaction_sync_version(db)
+    now = datetime.utcnow()
+    for pid in sorted(quantities):
+        quantity = quantities[pid]
+        result = db.execute(
+            update(_products)
+            .where(_products.c.id == pid, _products.c.stock_quantity >= quantity)
+            .values(stock_quantity=_products.c.stock_quantity - quantity, version=version, updated_at=now)
+        )
+        if result.rowcount == 0:
+            row = db.execute(select(_products.c.name, _products.c.stock_quantity).where(_products.c.id == pid)).first()
+            raise InsufficientStock(pid, row.name if row else None, row.stock_quantity if row else 0)
+    db.execute(insert(_movements), [
+        {"product_id": pid, "change": -quantity, "reason": "order", "order_id": order_id, "version": version,
+         "created_at": now}
+        for pid, quantity in quantities.items()
+    ])
+    adjusted = []
+    for row in db.execute(select(_products.c.id, _products.c.sku, _products.c.name, _products.c.stock_quantity,
+                                 _products.c.min_stock_level).where(_products.c.id.in_(sorted(quantities)))):
+        adjusted.append(Adjusted(row.id, row.sku, row.name, row.stock_quantity + quantities[row.id],
+                                 row.stock_quantity, row.min_stock_level))
+    _publish(db, adjusted)
+    return adjusted
+
+
+def restock_orders(db: Session, order_ids: Sequence[int], reason: str = "cancel") -> Dict[int, Tuple[int, int]]:
+    """把訂單明細的數量加回庫存，返回 {產品 id: (調整前, 調整後)}；每張訂單每個產品記一筆異動"""
+    if not order_ids:
+        return {}
+    db.flush()  # Session 中尚未寫入的庫存變更先落地，避免之後的 flush 以舊值覆蓋
+    version = transaction_sync_version(db)
+    now = datetime.utcnow()
+    changed: Dict[int, Tuple[int, int]] = {}
+    rows = {}
+    for chunk in chunks(order_ids):
+        returned = (
+            select(_items.c.product_id, func.sum(_items.c.quantity).label("quantity"))
+            .where(_items.c.order_id.in_(chunk), _items.c.product_id.isnot(None))
+            .group_by(_items.c.product_id)
+            .subquery()
+        )
+        db.execute(
+            update(_products)
+            .where(_products.c.id == returned.c.product_id)
+            .values(stock_quantity=_products.c.stock_quantity + returned.c.quantity, version=version, updated_at=now)
+        )
+        db.execute(insert(_movements).from_select(
+            ["product_id", "change", "reason", "order_id", "version", "created_at"],
+            select(_items.c.product_id, func.sum(_items.c.quantity), literal(reason), _items.c.order_id,
+                   literal(version), literal(now))
+            .join_from(_items, _products, _products.c.id == _items.c.product_id)
+            .where(_items.c.order_id.in_(chunk))
+            .group_by(_items.c.order_id, _items.c.product_id)
+        ))
+        for row in db.execute(
+            select(_products.c.id, _products.c.sku, _products.c.name, _products.c.stock_quantity,
+                   _products.c.min_stock_level, returned.c.quantity)
+            .join_from(_products, returned, _products.c.id == returned.c.product_id)
+        ):
+            first = changed.get(row.id)
+            changed[row.id] = (first[0] if first else row.stock_quantity - row.quantity, row.stock_quantity)
+            rows[row.id] = row
+
+    _publish(db, [Adjusted(pid, rows[pid].sku, rows[pid].name, old, new, rows[pid].min_stock_level)
+                  for pid, (old, new) in changed.items()])
+    return changed
+
+
+# ==================== 進貨 ====================
+
+class ReceiptLine(NamedTuple):
+    sku: Optional[str]
+    product_id: Optional[int]
+    quantity: int
+
+
+class Adjusted(NamedTuple):
+    product_id: int
+    sku: str
+    name: str
+    old_stock: int
+    new_stock: int
+    min_stock_level: int
+
+
+def parse_csv(data: bytes) -> List[ReceiptLine]:
+    """
+    進貨單 CSV：標題列需有 quantity，以及 sku 或 product_id 其中一欄（兩欄都有時每行填一個即可）。
+    格式錯誤時拋出 ValueError，訊息帶行號
+    """
+    reader = csv.DictReader(io.StringIO(data.decode("utf-8-sig")))
+    fields = {(name or "").strip().lower(): name for name in reader.fieldnames or []}
+    if "quantity" not in fields or not ({"sku", "product_id"} & fields.keys()):
+        raise ValueError("CSV 需要 quantity 欄，以及 sku 或 product_id 欄")
+
+    lines = []
+    for row in reader:
+        value = {key: (row.get(name) or "").strip() for key, name in fields.items()}
+        if not any(value.values()):
+            continue
+        line_no = reader.line_num
+        try:
+            quantity = int(value["quantity"])
+            product_id = int(value["product_id"]) if value.get("product_id") else None
+        except ValueError:
+            raise ValueError(f"第 {line_no} 行：quantity 與 product_id 必須是整數")
+        sku = value.get("sku") or None
+        if quantity <= 0:
+            raise ValueError(f"第 {line_no} 行：quantity 必須大於 0")
+        if (sku is None) == (product_id is None):
+            raise ValueError(f"第 {line_no} 行：sku 與 product_id 需填且只填一個")
+        lines.append(ReceiptLine(sku, product_id, quantity))
+        if len(lines) > MAX_RECEIPT_LINES:
+            raise ValueError(f"進貨單最多 {MAX_RECEIPT_LINES} 行")
+    if not lines:
+        raise ValueError("進貨單沒有任何行")
+    return lines
+
+
+def resolve(db: Session, lines: Iterable[ReceiptLine]) -> Tuple[Dict[int, int], List[str]]:
+    """按產品合併數量，返回 ({產品 id: 增量}, 不存在的 SKU 或 #id)"""
+    lines = list(lines)
+    skus = sorted({line.sku for line in lines if line.sku is not None})
+    ids = sorted({line.product_id for line in lines if line.product_id is not None})
+    by_sku: Dict[str, int] = {}
+    for chunk in chunks(skus):
+        by_sku.update(db.execute(select(_products.c.sku, _products.c.id).where(_products.c.sku.in_(chunk))).all())
+    known = set()
+    for chunk in chunks(ids):
+        known.update(db.execute(select(_products.c.id).where(_products.c.id.in_(chunk))).scalars())
+
+    unknown = [sku for sku in skus if sku not in by_sku] + [f"#{pid}" for pid in ids if pid not in known]
+    increments: Dict[int, int] = {}
+    if not unknown:
+        for line in lines:
+            product_id = by_sku[line.sku] if line.sku is not None else line.product_id
+            increments[product_id] = increments.get(product_id, 0) + line.quantity
+    return increments, unknown
+
+
+def restock_many(db: Session, increments: Dict[int, int], reference: Optional[str] = None,
+                 reason: str = "receipt") -> List[Adjusted]:
+    """一次 executemany 加上各產品的增量，返回調整前後的庫存（產品 id 需已確認存在）"""
+    if not increments:
+        return []
+    db.flush()
+    version = transaction_sync_version(db)
+    now = datetime.utcnow()
+    db.execute(
+        update(_products).where(_products.c.id == bindparam("pid"))
+        .values(stock_quantity=_products.c.stock_quantity + bindparam("added"), version=version, updated_at=now),
+        [{"pid": pid, "added": added} for pid, added in increments.items()],
+    )
+    db.execute(insert(_movements), [
+        {"product_id": pid, "change": added, "reason": reason, "reference": reference, "version": version,
+         "created_at": now}
+        for pid, added in increments.items()
+    ])
+    adjusted = []
+    for chunk in chunks(sorted(increments)):
+        for row in db.execute(select(_products.c.id, _products.c.sku, _products.c.name, _products.c.stock_quantity,
+                                     _products.c.min_stock_level).where(_products.c.id.in_(chunk))):
+            adjusted.append(Adjusted(row.id, row.sku, row.name, row.stock_quantity - increments[row.id],
+                                     row.stock_quantity, row.min_stock_level))
+    _publish(db, adjusted)
+    return adjusted
+
+
+def _publish(db: Session, adjusted: List[Adjusted]):
+    _expire_loaded(db, {a.product_id for a in adjusted})
+    if len(adjusted) > changefeed.BULK_EVENTS:
+        changefeed.resync(db, "products")
+        return
+    for a in adjusted:
+        changefeed.record_stock(db, a.product_id, a.sku, a.name, a.old_stock, a.new_stock, a.min_stock_level)
+
+
+def _expire_loaded(db: Session, product_ids):
+    """Core 語句不會更新 Session 中已載入的產品，下次讀取時重新載入"""
+    for obj in list(db.identity_map.values()):
+        if isinstance(obj, DBProduct) and obj.id in product_ids:
+            db.expire(obj, ["stock_quantity", "version", "updated_at"])
+
+
+# ==================== 異動帳與快照 ====================
+
+def _snapshot_version(db: Session, at: Optional[datetime] = None) -> int:
+    """at 之前最近一次快照的同步版本，沒有快照時為 0"""
+    query = select(_snapshots.c.version)
+    if at is not None:
+        query = query.where(_snapshots.c.taken_at <= at)
+    return db.execute(query.order_by(_snapshots.c.taken_at.desc()).limit(1)).scalar() or 0
+
+
+def _balances(db: Session, floor: int, until_version: Optional[int] = None, at: Optional[datetime] = None,
+              product_ids: Optional[Sequence[int]] = None) -> Dict[int, int]:
+    """版本 floor 的快照，加上版本在 (floor, until_version] 且 created_at ≤ at 的異動"""
+    base = select(_snapshots.c.product_id, _snapshots.c.quantity).where(_snapshots.c.version == floor)
+    tail = select(_movements.c.product_id, func.sum(_movements.c.change)).where(_movements.c.version > floor)
+    if until_version is not None:
+        tail = tail.where(_movements.c.version <= until_version)
+    if at is not None:
+        tail = tail.where(_movements.c.created_at <= at)
+    if product_ids is not None:
+        base = base.where(_snapshots.c.product_id.in_(product_ids))
+        tail = tail.where(_movements.c.product_id.in_(product_ids))
+    balances = dict(db.execute(base).all()) if floor else {}
+    for product_id, change in db.execute(tail.group_by(_movements.c.product_id)):
+        balances[product_id] = balances.get(product_id, 0) + change
+    return balances
+
+
+def stock_at(db: Session, at: Optional[datetime] = None,
+             product_ids: Optional[Sequence[int]] = None) -> Dict[int, int]:
+    """
+    時間點庫存 {產品 id: 數量}，at 為 UTC，省略時為目前。
+    不指定 product_ids 時只返回有異動記錄的產品；指定時每個都有值（當時還沒有的產品為 0）
+    """
+    floor = _snapshot_version(db, at)
+    if product_ids is None:
+        return _balances(db, floor, at=at)
+    balances: Dict[int, int] = {}
+    for chunk in chunks(sorted(set(product_ids))):
+        found = _balances(db, floor, at=at, product_ids=chunk)
+        balances.update({pid: found.get(pid, 0) for pid in chunk})
+    return balances
+
+
+def history(db: Session, product_id: int, start: Optional[datetime] = None, end: Optional[datetime] = None,
+            limit: int = 200) -> Dict:
+    """產品在 (start, end] 的異動與每筆之後的結存；期初與期末結存由快照推算，不受 limit 影響"""
+    opening = stock_at(db, start, [product_id])[product_id] if start is not None else 0
+    query = select(_movements).where(_movements.c.product_id == product_id)
+    if start is not None:
+        query = query.where(_movements.c.created_at > start)
+    if end is not None:
+        query = query.where(_movements.c.created_at <= end)
+    rows = db.execute(query.order_by(_movements.c.created_at, _movements.c.id).limit(limit + 1)).all()
+
+    balance = opening
+    movements = []
+    for row in rows[:limit]:
+        balance += row.change
+        movements.append({"id": row.id, "change": row.change, "balance": balance, "reason": row.reason,
+                          "order_id": row.order_id, "reference": row.reference, "version": row.version,
+                          "created_at": row.created_at})
+    return {"product_id": product_id, "start": start, "end": end, "opening_balance": opening,
+            "closing_balance": stock_at(db, end, [product_id])[product_id],
+            "movements": movements, "truncated": len(rows) > limit}
+
+
+def take_snapshot(db: Session) -> Dict:
+    """
+    以上次快照加上之後的異動，記下目前全部結存非零的產品（不提交），返回 {version, products}；
+    上次快照後沒有異動時不寫入。只計入已提交的同步版本：版本計數器的行鎖持有到提交，
+    讀到版本 V 時 ≤ V 的異動都已可見。同一版本的快照內容相同，並發建立同一版本時後寫入的略過
+    """
+    version = db.execute(select(SyncState.version).where(SyncState.id == 1)).scalar() or 0
+    floor = _snapshot_version(db)
+    changed = db.execute(select(_movements.c.id).where(_movements.c.version > floor,
+                                                       _movements.c.version <= version).limit(1)).first()
+    if version <= floor or changed is None:
+        return {"version": floor, "products": 0}
+    now = datetime.utcnow()
+    rows = [{"product_id": pid, "quantity": quantity, "version": version, "taken_at": now}
+            for pid, quantity in sorted(_balances(db, floor, until_version=version).items()) if quantity]
+    if rows:
+        upsert = upsert_insert(db)
+        if upsert is not None:
+            db.execute(upsert(_snapshots).on_conflict_do_nothing(index_elements=["version", "product_id"]), rows)
+        else:
+            try:
+                with db.begin_nested():
+                    db.execute(insert(_snapshots), rows)
+            except IntegrityError:
+                pass
+    return {"version": version, "products": len(rows)}
+
+
+def reconcile(db: Session) -> Dict:
+    """
+    對帳：各產品的 stock_quantity 與異動帳結存（最近的快照加上之後的異動）比較，返回不一致的產品；
+    已刪除的產品結存應為 0
+    """
+    ledger = _balances(db, _snapshot_version(db))
+    products = db.execute(select(_products.c.id, _products.c.sku, _products.c.stock_quantity)).all()
+    mismatches = []
+    for row in products:
+        balance = ledger.pop(row.id, 0)
+        if balance != row.stock_quantity:
+            mismatches.append({"product_id": row.id, "sku": row.sku, "stock_quantity": row.stock_quantity,
+                               "ledger": balance})
+    mismatches += [{"product_id": pid, "sku": None, "stock_quantity": None, "ledger": balance}
+                   for pid, balance in sorted(ledger.items()) if balance]
+    return {"checked": len(products), "mismatches": mismatches}
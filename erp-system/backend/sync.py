@@ -0,0 +1,74 @@
+"""
+增量同步
+每個寫入產品或訂單的交易從 sync_state 取得遞增的版本號，寫在該交易改動的行上（version、updated_at），
+刪除的行記錄在 sync_tombstones（見 database.py 的 before_flush 事件）。
+客戶端保存上次同步的版本，之後只取版本更新的行與刪除記錄，傳輸量與變更數成正比而非表的大小。
+
+刪除記錄可以定期清除（python manage.py sync-prune --days 30）；
+客戶端的版本早於已清除的範圍時，返回完整快照（reset=True），客戶端以此取代本地副本。
+"""
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session, selectinload
+
+from database import (
+    engine, Order as DBOrder, OrderItem as DBOrderItem, Product as DBProduct, SyncState, SyncTombstone
+)
+
+TABLES = {"products": DBProduct, "orders": DBOrder}
+
+
+def current_version(db: Session) -> Tuple[int, int]:
+    """(目前版本, 已清除刪除記錄的版本)"""
+    state = db.query(SyncState.version, SyncState.pruned_version).filter(SyncState.id == 1).one()
+    return state.version, state.pruned_version
+
+
+def head() -> int:
+    """目前版本，不需要 Session；產品或訂單有提交的寫入時改變（供快取重新驗證）"""
+    with engine.connect() as conn:
+        return conn.execute(select(SyncState.version).where(SyncState.id == 1)).scalar() or 0
+
+
+def changes_since(db: Session, since: int = 0, tables: Iterable[str] = TABLES) -> Dict:
+    """
+    版本大於 since 的產品與訂單，以及之後刪除的 id。
+    先讀取目前版本再以 version <= 目前版本 篩選，查詢期間新提交的寫入留到下次同步
+    """
+    version, pruned = current_version(db)
+    reset = since <= 0 or since < pruned or since > version
+    if reset:
+        since = 0
+
+    result: Dict = {"version": version, "since": since, "reset": reset, "deleted": {}}
+    for name in tables:
+        model = TABLES[name]
+        query = db.query(model).filter(model.version > since, model.version <= version).order_by(model.id)
+        if model is DBOrder:
+            query = query.options(selectinload(DBOrder.items).selectinload(DBOrderItem.product))
+        rows = query.all()
+        result[name] = rows
+        if reset:
+            continue
+        # 刪除後又以相同 id 建立的行（SQLite 會重用最大的 id）以現存的行為準
+        alive = {row.id for row in rows}
+        deleted = db.query(SyncTombstone.row_id).filter(
+            SyncTombstone.table_name == name, SyncTombstone.version > since, SyncTombstone.version <= version
+        ).distinct()
+        result["deleted"][name] = sorted(row_id for (row_id,) in deleted if row_id not in alive)
+    return result
+
+
+def prune_tombstones(db: Session, older_than_days: int) -> int:
+    """清除超過指定天數的刪除記錄，返回清除的筆數；版本早於清除範圍的客戶端下次同步會取得完整快照"""
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    horizon = db.query(func.max(SyncTombstone.version)).filter(SyncTombstone.deleted_at < cutoff).scalar()
+    if horizon is None:
+        return 0
+    removed = db.query(SyncTombstone).filter(SyncTombstone.version <= horizon).delete(synchronize_session=False)
+    state = db.query(SyncState).filter(SyncState.id == 1).one()
+    state.pruned_version = max(state.pruned_version, horizon)
+    db.commit()
+    return removed
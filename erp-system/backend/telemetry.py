@@ -0,0 +1,267 @@
+"""
+Agent 流程計時（trace / span）
+記錄 prompt 構建、每次 Ollama 呼叫、每次工具執行及其中的 SQL 耗時，
+保留最近的 trace 與各階段統計供 /api/agent/metrics 查詢，
+設定 OTEL_EXPORTER_OTLP_ENDPOINT 時另匯出到 OpenTelemetry collector。
+"""
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import event
+
+_current_trace: ContextVar[Optional["Trace"]] = ContextVar("agent_trace", default=None)
+_current_span: ContextVar[Optional["Span"]] = ContextVar("agent_span", default=None)
+# 接收 SQL 耗時的對象（span、請求統計等），需實作 add_sql(seconds)
+_sql_sinks: ContextVar[tuple] = ContextVar("sql_sinks", default=())
+
+
+def _percentile(sorted_values, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class Span:
+    """單一階段的計時"""
+
+    def __init__(self, name: str, attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.attributes = dict(attributes or {})
+        self.start_ns = time.time_ns()
+        self._start = time.perf_counter()
+        self.duration = 0.0
+        self.db_seconds = 0.0
+        self.db_statements = 0
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def add_sql(self, seconds: float):
+        self.db_seconds += seconds
+        self.db_statements += 1
+
+    def finish(self):
+        self.duration = time.perf_counter() - self._start
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "duration_ms": round(self.duration * 1000, 3),
+            "db_ms": round(self.db_seconds * 1000, 3),
+            "db_statements": self.db_statements,
+            **self.attributes,
+        }
+
+
+class Trace:
+    """一次完整的 agent 對話"""
+
+    def __init__(self, name: str, attributes: Optional[Dict[str, Any]] = None):
+        self.id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.attributes = dict(attributes or {})
+        self.start_ns = time.time_ns()
+        self._start = time.perf_counter()
+        self.duration = 0.0
+        self.spans: List[Span] = []
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.id,
+            "name": self.name,
+            "duration_ms": round(self.duration * 1000, 3),
+            **self.attributes,
+            "spans": [s.to_dict() for s in self.spans],
+        }
+
+
+class Recorder:
+    """保存最近 trace 與各 span 的統計"""
+
+    def __init__(self, max_traces: int = 50, max_samples: int = 500):
+        self._lock = threading.Lock()
+        self.traces = deque(maxlen=max_traces)
+        self._samples = defaultdict(lambda: deque(maxlen=max_samples))
+        self._counts = defaultdict(int)
+        self._totals = defaultdict(float)
+        self._db_totals = defaultdict(float)
+        self.tokens = {"prompt": 0, "completion": 0}
+
+    def record_span(self, span: Span):
+        with self._lock:
+            self._samples[span.name].append(span.duration)
+            self._counts[span.name] += 1
+            self._totals[span.name] += span.duration
+            self._db_totals[span.name] += span.db_seconds
+            self.tokens["prompt"] += span.attributes.get("tokens_in", 0) or 0
+            self.tokens["completion"] += span.attributes.get("tokens_out", 0) or 0
+
+    def record_trace(self, trace: Trace):
+        with self._lock:
+            self.traces.append(trace)
+
+    def summary(self, recent: int = 10) -> Dict[str, Any]:
+        with self._lock:
+            spans = {}
+            for name, samples in self._samples.items():
+                ordered = sorted(samples)
+                count = self._counts[name]
+                spans[name] = {
+                    "count": count,
+                    "avg_ms": round(self._totals[name] / count * 1000, 3),
+                    "p50_ms": round(_percentile(ordered, 0.50) * 1000, 3),
+                    "p95_ms": round(_percentile(ordered, 0.95) * 1000, 3),
+                    "max_ms": round(ordered[-1] * 1000, 3),
+                    "db_ms_total": round(self._db_totals[name] * 1000, 3),
+                }
+            return {
+                "spans": spans,
+                "tokens": dict(self.tokens),
+                "recent_traces": [t.to_dict() for t in list(self.traces)[-recent:]],
+            }
+
+    def reset(self):
+        with self._lock:
+            self.traces.clear()
+            self._samples.clear()
+            self._counts.clear()
+            self._totals.clear()
+            self._db_totals.clear()
+            self.tokens = {"prompt": 0, "completion": 0}
+
+
+recorder = Recorder()
+
+
+# ==================== OpenTelemetry（可選） ====================
+
+_otel_tracer = None
+_otel_checked = False
+
+
+def _get_otel_tracer():
+    """設定了 OTEL_EXPORTER_OTLP_ENDPOINT 且已安裝 opentelemetry 時才啟用"""
+    global _otel_tracer, _otel_checked
+    if _otel_checked:
+        return _otel_tracer
+    _otel_checked = True
+    if not os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT"):
+        return None
+    try:
+        from opentelemetry import trace as otel_trace
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    except ImportError:
+        print("[Telemetry] 未安裝 opentelemetry-sdk / opentelemetry-exporter-otlp，略過匯出")
+        return None
+
+    provider = TracerProvider(resource=Resource.create({"service.name": "erp-agent"}))
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    otel_trace.set_tracer_provider(provider)
+    _otel_tracer = otel_trace.get_tracer("erp.agent")
+    return _otel_tracer
+
+
+def _export_otel(trace: Trace):
+    tracer = _get_otel_tracer()
+    if tracer is None:
+        return
+    from opentelemetry import trace as otel_trace
+
+    root = tracer.start_span(trace.name, start_time=trace.start_ns, attributes=trace.attributes)
+    context = otel_trace.set_span_in_context(root)
+    for s in trace.spans:
+        child = tracer.start_span(s.name, context=context, start_time=s.start_ns, attributes={
+            **{k: v for k, v in s.attributes.items() if v is not None},
+            "db.duration_ms": s.db_seconds * 1000,
+            "db.statements": s.db_statements,
+        })
+        child.end(end_time=s.start_ns + int(s.duration * 1e9))
+    root.end(end_time=trace.start_ns + int(trace.duration * 1e9))
+
+
+# ==================== 計時 API ====================
+
+@contextmanager
+def trace(name: str, **attributes):
+    """開始一次 trace，期間的 span 都歸屬於它"""
+    t = Trace(name, attributes)
+    token = _current_trace.set(t)
+    try:
+        yield t
+    finally:
+        t.duration = time.perf_counter() - t._start
+        _current_trace.reset(token)
+        recorder.record_trace(t)
+        _export_otel(t)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """記錄一個階段；期間執行的 SQL 耗時會累加到此 span"""
+    s = Span(name, attributes)
+    span_token = _current_span.set(s)
+    sink_token = _sql_sinks.set(_sql_sinks.get() + (s,))
+    try:
+        yield s
+    finally:
+        s.finish()
+        _sql_sinks.reset(sink_token)
+        _current_span.reset(span_token)
+        current = _current_trace.get()
+        if current is not None:
+            current.spans.append(s)
+        recorder.record_span(s)
+
+
+def annotate(**attributes):
+    """為目前的 span 補充屬性（不在 span 內時忽略）"""
+    s = _current_span.get()
+    if s is not None:
+        s.set(**attributes)
+
+
+@contextmanager
+def collect_sql(sink):
+    """讓 sink.add_sql(seconds) 在此區塊內接收 SQL 耗時"""
+    token = _sql_sinks.set(_sql_sinks.get() + (sink,))
+    try:
+        yield sink
+    finally:
+        _sql_sinks.reset(token)
+
+
+# ==================== SQL 事件 ====================
+
+_instrumented_engines = set()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("telemetry_query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("telemetry_query_start")
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    for sink in _sql_sinks.get():
+        sink.add_sql(elapsed)
+
+
+def instrument_engine(engine):
+    """為 engine 註冊 SQL 計時事件（重複呼叫無影響）"""
+    if id(engine) in _instrumented_engines:
+        return
+    _instrumented_engines.add(id(engine))
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
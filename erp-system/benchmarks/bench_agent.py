@@ -0,0 +1,181 @@
+"""
+Agent 迴圈性能測試
+以 Mock Ollama 重播腳本，量測後端 ERPAgent 與 CLI LLMAgent 在每個情境下的
+端到端延遲、LLM 迭代次數、工具耗時與 SQL 耗時，並可設定 agent 自身開銷門檻。
+
+用法：
+    python bench_agent.py --repeat 10 --latency-ms 50
+    python bench_agent.py --json agent_bench.json --max-overhead-ms 30
+"""
+import argparse
+import contextlib
+import io
+import json
+import sys
+import time
+from typing import Dict, List
+
+from harness import ApiServer, SQLTimer, load_cli_agent_module, summarize, use_temp_database
+from mock_ollama import MockOllamaServer
+from scenarios import SCENARIOS
+
+
+@contextlib.contextmanager
+def timed(obj, attr: str, timings: Dict[str, float], key: str):
+    """暫時包裝物件方法，把耗時累加到 timings[key]"""
+    original = getattr(obj, attr)
+    had_own = attr in vars(obj)
+
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return original(*args, **kwargs)
+        finally:
+            timings[key] += time.perf_counter() - start
+
+    setattr(obj, attr, wrapper)
+    try:
+        yield
+    finally:
+        if had_own:
+            setattr(obj, attr, original)
+        else:
+            delattr(obj, attr)
+
+
+def _row(agent_name: str, scenario: str, samples: Dict[str, List[float]], sql_counts: List[int],
+         iterations: List[int], prompt_chars: List[int]) -> Dict:
+    overhead = [t - l for t, l in zip(samples["total"], samples["llm"])]
+    return {
+        "agent": agent_name,
+        "scenario": scenario,
+        "iterations": round(sum(iterations) / len(iterations), 2),
+        "total_ms": summarize(samples["total"]),
+        "llm_ms": summarize(samples["llm"]),
+        "tool_ms": summarize(samples["tool"]),
+        "db_ms": summarize(samples["db"]),
+        "overhead_ms": summarize(overhead),
+        "sql_statements": round(sum(sql_counts) / len(sql_counts), 1),
+        "prompt_kb": round(sum(prompt_chars) / len(prompt_chars) / 1024, 2),
+    }
+
+
+def bench_erp_agent(mock: MockOllamaServer, sql: SQLTimer, repeat: int) -> List[Dict]:
+    """後端 ERPAgent（/api/chat + tool_calls）"""
+    from llm_agent import ERPAgent
+    from llm_scheduler import get_scheduler
+
+    agent = ERPAgent(ollama_url=f"{mock.base_url}/api/chat")
+    rows = []
+    for scenario in SCENARIOS:
+        samples = {"total": [], "llm": [], "tool": [], "db": []}
+        sql_counts, iterations, prompt_chars = [], [], []
+        for _ in range(repeat):
+            agent.reset_conversation()
+            mock.load(chat=scenario["chat"])
+            sql.reset()
+            timings = {"llm": 0.0, "tool": 0.0}
+            with timed(agent, "execute_tool", timings, "tool"), \
+                    timed(get_scheduler(), "post", timings, "llm"), \
+                    contextlib.redirect_stdout(io.StringIO()):
+                start = time.perf_counter()
+                agent.chat(scenario["message"])
+                samples["total"].append(time.perf_counter() - start)
+            samples["llm"].append(timings["llm"])
+            samples["tool"].append(timings["tool"])
+            samples["db"].append(sql.seconds)
+            sql_counts.append(sql.count)
+            iterations.append(mock.stats["chat_requests"])
+            prompt_chars.append(mock.stats["prompt_chars"])
+        rows.append(_row("erp_agent", scenario["name"], samples, sql_counts, iterations, prompt_chars))
+    return rows
+
+
+def bench_cli_agent(mock: MockOllamaServer, sql: SQLTimer, api: ApiServer, repeat: int,
+                    native: bool, stream: bool = False) -> List[Dict]:
+    """CLI LLMAgent（經由 ERP HTTP API 執行工具）；native 為原生工具模式，否則為舊 JSON 模式"""
+    cli = load_cli_agent_module()
+    script_key = "cli_chat" if native else "generate"
+    llm_method = "chat_with_tools" if native else "chat_with_llm"
+    name = ("cli_stream" if stream else "cli_native") if native else "cli_legacy"
+    rows = []
+    for scenario in SCENARIOS:
+        if not scenario.get(script_key):
+            continue
+        samples = {"total": [], "llm": [], "tool": [], "db": []}
+        sql_counts, iterations, prompt_chars = [], [], []
+        for _ in range(repeat):
+            # 每次使用新的 agent，避免快取與對話歷史影響結果
+            agent = cli.LLMAgent(api_base_url=f"{api.base_url}/api", ollama_base_url=mock.base_url,
+                                 use_native_tools=native, stream=stream)
+            mock.load(**{"chat" if native else "generate": scenario[script_key]})
+            sql.reset()
+            timings = {"llm": 0.0, "tool": 0.0}
+            with timed(agent, "execute_tool", timings, "tool"), \
+                    timed(agent, llm_method, timings, "llm"), \
+                    contextlib.redirect_stdout(io.StringIO()):
+                start = time.perf_counter()
+                agent.execute_command(scenario["message"])
+                samples["total"].append(time.perf_counter() - start)
+            samples["llm"].append(timings["llm"])
+            samples["tool"].append(timings["tool"])
+            samples["db"].append(sql.seconds)
+            sql_counts.append(sql.count)
+            iterations.append(mock.stats["chat_requests"] + mock.stats["generate_requests"])
+            prompt_chars.append(mock.stats["prompt_chars"])
+        rows.append(_row(name, scenario["name"], samples, sql_counts, iterations, prompt_chars))
+    return rows
+
+
+def print_table(rows: List[Dict]):
+    header = f"{'agent':<10} {'scenario':<18} {'iter':>5} {'prompt KB':>9} {'total p50':>10} {'llm p50':>9} " \
+             f"{'tool p50':>9} {'db p50':>8} {'sql':>6} {'overhead p50':>13}"
+    print(header)
+    print("-" * len(header))
+    for r in rows:
+        print(f"{r['agent']:<10} {r['scenario']:<18} {r['iterations']:>5} {r['prompt_kb']:>9.2f} {r['total_ms']['p50']:>10.2f} "
+              f"{r['llm_ms']['p50']:>9.2f} {r['tool_ms']['p50']:>9.2f} {r['db_ms']['p50']:>8.2f} "
+              f"{r['sql_statements']:>6} {r['overhead_ms']['p50']:>13.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Agent 迴圈性能測試（Mock Ollama）")
+    parser.add_argument("--repeat", type=int, default=10, help="每個情境重複次數")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="Mock Ollama 每次回應延遲")
+    parser.add_argument("--json", help="輸出結果到 JSON 檔案")
+    parser.add_argument("--max-overhead-ms", type=float,
+                        help="agent 自身開銷（總延遲扣除 LLM 時間）p50 上限，超過則返回非零")
+    parser.add_argument("--skip-cli", action="store_true", help="不測試 CLI agent")
+    args = parser.parse_args()
+
+    use_temp_database()
+    import database
+
+    database.init_db()
+    sql = SQLTimer(database.engine)
+
+    with MockOllamaServer(latency_ms=args.latency_ms) as mock:
+        rows = bench_erp_agent(mock, sql, args.repeat)
+        if not args.skip_cli:
+            with ApiServer() as api:
+                rows += bench_cli_agent(mock, sql, api, args.repeat, native=False)
+                rows += bench_cli_agent(mock, sql, api, args.repeat, native=True)
+                rows += bench_cli_agent(mock, sql, api, args.repeat, native=True, stream=True)
+
+    print_table(rows)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"latency_ms": args.latency_ms, "repeat": args.repeat, "results": rows},
+                      f, ensure_ascii=False, indent=2)
+
+    if args.max_overhead_ms is not None:
+        failed = [r for r in rows if r["overhead_ms"]["p50"] > args.max_overhead_ms]
+        for r in failed:
+            print(f"❌ {r['agent']}/{r['scenario']} 開銷 {r['overhead_ms']['p50']:.2f}ms "
+                  f"超過門檻 {args.max_overhead_ms}ms")
+        if failed:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
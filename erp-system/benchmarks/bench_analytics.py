@@ -0,0 +1,188 @@
+"""
+分析報表性能測試
+產生大量訂單明細（預設 1000 萬筆）到臨時 SQLite 數據庫，
+比較 SQL GROUP BY 與 NumPy 欄式快照計算類別毛利、客戶排行、折扣影響的耗時，並核對結果一致。
+
+用法：
+    python bench_analytics.py
+    python bench_analytics.py --items 1000000 --repeat 5 --json analytics_bench.json
+"""
+import argparse
+import json
+import sqlite3
+import time
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from harness import summarize, use_temp_database
+
+CATEGORIES = ["筆記本電腦", "桌上型電腦", "顯示器", "鍵盤滑鼠", "網路設備", "儲存設備", "印表機", "配件", "軟體", "耳機音響"]
+STATUSES = np.array(["completed", "completed", "completed", "processing", "pending", "cancelled"])
+DISCOUNTS = np.array([0.0, 0.0, 0.0, 0.0, 0.03, 0.05, 0.1, 0.15, 0.25])
+
+SQL_MARGIN = """
+    SELECT COALESCE(p.category, '未分類'), SUM(oi.subtotal), SUM(oi.quantity * COALESCE(p.cost, 0)), SUM(oi.quantity)
+    FROM order_items oi
+    JOIN orders o ON o.id = oi.order_id
+    JOIN products p ON p.id = oi.product_id
+    WHERE o.status = 'completed'
+    GROUP BY 1
+"""
+SQL_CUSTOMERS = """
+    WITH ranked AS (
+        SELECT customer_name, SUM(total_amount) AS revenue, COUNT(*) AS orders, MAX(order_date) AS last_order
+        FROM orders
+        WHERE status = 'completed'
+        GROUP BY customer_name
+        ORDER BY revenue DESC
+        LIMIT 20
+    )
+    SELECT r.customer_name, r.revenue, r.orders, r.last_order,
+           (SELECT SUM(oi.quantity) FROM orders o JOIN order_items oi ON oi.order_id = o.id
+            WHERE o.customer_name = r.customer_name AND o.status = 'completed')
+    FROM ranked r
+    ORDER BY r.revenue DESC
+"""
+SQL_DISCOUNT = """
+    SELECT CASE WHEN oi.discount <= 0 THEN 0 WHEN oi.discount <= 0.05 THEN 1 WHEN oi.discount <= 0.10 THEN 2
+                WHEN oi.discount <= 0.20 THEN 3 ELSE 4 END AS bucket,
+           COUNT(*), SUM(oi.quantity), SUM(oi.subtotal), SUM(oi.unit_price * oi.quantity - oi.subtotal)
+    FROM order_items oi
+    JOIN orders o ON o.id = oi.order_id
+    WHERE o.status = 'completed'
+    GROUP BY bucket
+"""
+
+
+def generate(path: str, items: int, products: int, customers: int, seed: int = 42):
+    """以 NumPy 產生數據後用 executemany 寫入"""
+    rng = np.random.default_rng(seed)
+    n_orders = max(1, items // 3)
+
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+
+    price = np.round(rng.uniform(100, 50000, products), 2)
+    cost = np.round(price * rng.uniform(0.55, 0.9, products), 2)
+    category = rng.integers(0, len(CATEGORIES), products)
+    conn.executemany(
+        "INSERT INTO products (id, name, sku, category, price, cost, stock_quantity, min_stock_level) "
+        "VALUES (?, ?, ?, ?, ?, ?, 100, 10)",
+        ((i + 1, f"產品 {i + 1}", f"SKU-{i + 1:06d}", CATEGORIES[category[i]], float(price[i]), float(cost[i]))
+         for i in range(products)))
+
+    item_order = np.sort(rng.integers(1, n_orders + 1, items))
+    item_product = rng.integers(1, products + 1, items)
+    quantity = rng.integers(1, 16, items)
+    discount = rng.choice(DISCOUNTS, items)
+    unit_price = price[item_product - 1]
+    subtotal = np.round(unit_price * quantity * (1 - discount), 2)
+    totals = np.bincount(item_order, weights=subtotal, minlength=n_orders + 1)[1:]
+
+    start = np.datetime64("2024-01-01T00:00:00")
+    order_dates = (start + rng.integers(0, 730 * 86400, n_orders).astype("timedelta64[s]")).astype(str)
+    status = rng.choice(STATUSES, n_orders)
+    customer = rng.zipf(1.3, n_orders) % customers
+
+    chunk = 500_000
+    for lo in range(0, n_orders, chunk):
+        hi = min(lo + chunk, n_orders)
+        conn.executemany(
+            "INSERT INTO orders (id, order_number, customer_name, order_date, status, total_amount) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            zip(range(lo + 1, hi + 1), (f"B{i:09d}" for i in range(lo + 1, hi + 1)),
+                (f"客戶 {c:05d}" for c in customer[lo:hi].tolist()),
+                (d.replace("T", " ") for d in order_dates[lo:hi].tolist()),
+                status[lo:hi].tolist(), np.round(totals[lo:hi], 2).tolist()))
+    for lo in range(0, items, chunk):
+        hi = min(lo + chunk, items)
+        conn.executemany(
+            "INSERT INTO order_items (order_id, product_id, quantity, unit_price, subtotal, discount) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            zip(item_order[lo:hi].tolist(), item_product[lo:hi].tolist(), quantity[lo:hi].tolist(),
+                unit_price[lo:hi].tolist(), subtotal[lo:hi].tolist(), discount[lo:hi].tolist()))
+    conn.commit()
+    conn.close()
+
+
+def measure(fn: Callable, repeat: int):
+    samples = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - start)
+    return result, samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description="分析報表性能測試（SQL vs NumPy 快照）")
+    parser.add_argument("--items", type=int, default=10_000_000, help="訂單明細筆數")
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--customers", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5, help="每個查詢重複次數")
+    parser.add_argument("--sql-repeat", type=int, default=2, help="SQL 查詢重複次數")
+    parser.add_argument("--json", help="輸出結果到 JSON 檔案")
+    args = parser.parse_args()
+
+    path = use_temp_database()
+    import database
+
+    database.Base.metadata.create_all(bind=database.engine)
+    import analytics
+
+    start = time.perf_counter()
+    generate(path, args.items, args.products, args.customers)
+    print(f"產生 {args.items:,} 筆明細耗時 {time.perf_counter() - start:.1f}s")
+
+    with database.engine.connect() as conn:
+        def run_sql(sql):
+            return lambda: conn.exec_driver_sql(sql).fetchall()
+
+        sql_results = {}
+        rows: List[Dict] = []
+        for name, sql in (("margin_by_category", SQL_MARGIN), ("customer_ranking", SQL_CUSTOMERS),
+                          ("discount_impact", SQL_DISCOUNT)):
+            sql_results[name], samples = measure(run_sql(sql), args.sql_repeat)
+            rows.append({"query": name, "path": "sql", "ms": summarize(samples)})
+
+    analytics.mark_stale()
+    engine = analytics.AnalyticsEngine()
+    _, build = measure(engine.snapshot, 1)
+    snap = engine.snapshot()
+    rows.append({"query": "snapshot_build", "path": "numpy", "ms": summarize(build)})
+
+    numpy_results = {}
+    for name, fn in (("margin_by_category", lambda: analytics.margin_by_category(snap)),
+                     ("customer_ranking", lambda: analytics.customer_ranking(snap, limit=20)),
+                     ("discount_impact", lambda: analytics.discount_impact(snap))):
+        numpy_results[name], samples = measure(fn, args.repeat)
+        rows.append({"query": name, "path": "numpy", "ms": summarize(samples)})
+
+    # 核對結果
+    sql_revenue = sum(r[1] for r in sql_results["margin_by_category"])
+    np_revenue = sum(r["revenue"] for r in numpy_results["margin_by_category"])
+    top_sql = [r[0] for r in sql_results["customer_ranking"][:5]]
+    top_np = [r["customer_name"] for r in numpy_results["customer_ranking"][:5]]
+    discount_sql = sum(r[4] for r in sql_results["discount_impact"])
+    discount_np = sum(r["discount_amount"] for r in numpy_results["discount_impact"])
+    consistent = (abs(sql_revenue - np_revenue) <= max(1.0, sql_revenue * 1e-9)
+                  and top_sql == top_np and abs(discount_sql - discount_np) <= max(1.0, discount_sql * 1e-9))
+
+    header = f"{'query':<20} {'path':<6} {'p50 ms':>10} {'p95 ms':>10}"
+    print(header)
+    print("-" * len(header))
+    for r in rows:
+        print(f"{r['query']:<20} {r['path']:<6} {r['ms']['p50']:>10.2f} {r['ms']['p95']:>10.2f}")
+    print(f"結果一致：{'是' if consistent else '否'}（營收 SQL {sql_revenue:,.2f} / NumPy {np_revenue:,.2f}）")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"items": args.items, "snapshot": snap.info(), "consistent": consistent, "results": rows},
+                      f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,367 @@
+"""
+API 端到端性能測試
+每種數據規模各準備一個數據庫（示範數據 + datagen 合成訂單），在獨立行程中以 uvicorn 啟動 API，
+依序以不同並發數壓測 main.py 的每個路由（產品 CRUD、訂單建立/列表/更新/刪除、補貨、預警、報表、
+分析、agent 對話等），記錄吞吐量與 p50/p95/p99。agent 對話使用 Mock Ollama。
+
+結果可寫成 JSON 作為基準；之後以 --baseline 比較，p95 變慢或吞吐量下降超過門檻時返回非零。
+基準與當前結果需在同一台機器、同樣參數下產生才有可比性。
+
+用法：
+    python bench_api.py --json api_baseline.json
+    python bench_api.py --scales 0,20000 --concurrency 1,8 --requests 100
+    python bench_api.py --baseline api_baseline.json --threshold 0.25
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple, Union
+
+import requests
+
+from harness import ApiProcess, prepare_database, summarize
+from mock_ollama import MockOllamaServer
+from scenarios import SCENARIOS
+
+# 只統計、不壓測的路由（/api/events 是長連接，由 bench_changefeed.py 測試）
+SKIPPED_ROUTES = {"/", "/docs", "/redoc", "/openapi.json", "/docs/oauth2-redirect", "/api/events"}
+
+
+class Upload(NamedTuple):
+    """以 multipart 上傳的檔案（代替 JSON 請求體）"""
+    filename: str
+    content: bytes
+
+
+Request = Tuple[str, str, Optional[Union[dict, Upload]]]  # (method, url, json 或上傳檔案)
+BULK_ORDERS = 20  # 批量變更狀態每個請求的訂單數
+RECEIPT_LINES = 20  # 進貨單每個請求的行數
+
+
+class Operation:
+    """一個被壓測的路由；build(i, ctx) 產生第 i 個請求，ctx 在同一數據規模的各階段間共用"""
+
+    def __init__(self, route: str, build: Callable[[int, Dict], Request], serial: bool = False,
+                 before: Optional[Callable[[Dict], None]] = None):
+        self.route = route
+        self.build = build
+        self.serial = serial  # 只以並發 1 執行（例如共用對話歷史的 agent）
+        self.before = before
+
+
+def _get(url: str) -> Callable[[int, Dict], Request]:
+    return lambda i, ctx: ("GET", url.format(**ctx["samples"]), None)
+
+
+def _new_product(i: int, ctx: Dict) -> Request:
+    n = next(ctx["counter"])
+    return ("POST", "/api/products", {"name": f"壓測產品 {ctx['run']}-{n}", "sku": f"BENCH-{ctx['run']}-{n}",
+                                      "category": "配件", "price": 990.0, "cost": 600.0,
+                                      "stock_quantity": 100, "min_stock_level": 10, "supplier": "壓測"})
+
+
+def _pop(ctx: Dict, key: str) -> int:
+    with ctx["lock"]:
+        return ctx[key].pop()
+
+
+def _pick(values: List[int], i: int) -> int:
+    return values[i % len(values)]
+
+
+def _new_order(i: int, ctx: Dict) -> Request:
+    products = ctx["samples"]["order_products"]
+    return ("POST", "/api/orders", {
+        "customer_name": f"壓測客戶 {i % 50:02d}",
+        "items": [{"product_id": _pick(products, i + k), "quantity": 1} for k in range(2)],
+    })
+
+
+def _bulk_status(i: int, ctx: Dict) -> Request:
+    # 每次改變 BULK_ORDERS 張前一階段建立的訂單，狀態與單筆更新一樣輪替
+    orders = ctx["created_orders"]
+    batch = [_pick(orders, i * BULK_ORDERS + k) for k in range(min(BULK_ORDERS, len(orders)))]
+    return ("POST", "/api/orders/bulk-status",
+            {"order_ids": batch, "status": ("processing", "completed", "cancelled")[i % 3]})
+
+
+def _receipt(i: int, ctx: Dict) -> Request:
+    products = ctx["samples"]["order_products"]
+    items = [{"product_id": _pick(products, i + k), "quantity": 5} for k in range(RECEIPT_LINES)]
+    return ("POST", "/api/inventory/receipts", {"items": items, "reference": f"BENCH-{ctx['run']}-{i}"})
+
+
+def _receipt_csv(i: int, ctx: Dict) -> Request:
+    skus = ctx["samples"]["skus"]
+    rows = "".join(f"{_pick(skus, i + k)},5\n" for k in range(RECEIPT_LINES))
+    return ("POST", f"/api/inventory/receipts/csv?reference=BENCH-{ctx['run']}-{i}",
+            Upload("receipt.csv", ("sku,quantity\n" + rows).encode()))
+
+
+def _agent_chat(i: int, ctx: Dict) -> Request:
+    return ("POST", "/api/agent/chat", {"message": ctx["scenario"]["message"]})
+
+
+def _load_agent_script(ctx: Dict):
+    # 每個請求前重置對話並載入腳本；只能以並發 1 執行
+    scenario = next(s for s in SCENARIOS if s["name"] == "low_stock_lookup")
+    ctx["scenario"] = scenario
+    ctx["before_request"] = lambda: (ctx["mock"].load(chat=scenario["chat"]),
+                                     ctx["http"].post(f"{ctx['base_url']}/api/agent/reset"))
+
+
+def _sync_head(ctx: Dict):
+    # 客戶端已同步到目前版本，壓測的是沒有變更時的輪詢
+    head = ctx["http"].get(f"{ctx['base_url']}/api/sync", params={"tables": ""}).json()
+    ctx["samples"]["sync_version"] = head["version"]
+
+
+# 依序執行；寫入類路由按 建立 → 更新 → 刪除 排列，後面的階段使用前面建立的產品與訂單
+OPERATIONS: List[Operation] = [
+    Operation("GET /api/health", _get("/api/health")),
+    Operation("GET /api/products", _get("/api/products")),
+    Operation("GET /api/products/{product_id}", _get("/api/products/{product_id}")),
+    Operation("GET /api/products/search", _get("/api/products/search?q=thinkpad")),
+    Operation("POST /api/products", _new_product),
+    Operation("PUT /api/products/{product_id}",
+              lambda i, ctx: ("PUT", f"/api/products/{_pick(ctx['created_products'], i)}",
+                              {"price": 900.0 + i % 100})),
+    Operation("DELETE /api/products/{product_id}",
+              lambda i, ctx: ("DELETE", f"/api/products/{_pop(ctx, 'created_products')}", None)),
+    Operation("POST /api/inventory/restock/{product_id}",
+              lambda i, ctx: ("POST", f"/api/inventory/restock/{_pick(ctx['samples']['order_products'], i)}"
+                                      f"?quantity=5", None)),
+    Operation("POST /api/inventory/receipts", _receipt),
+    Operation("POST /api/inventory/receipts/csv", _receipt_csv),
+    Operation("POST /api/inventory/snapshots", lambda i, ctx: ("POST", "/api/inventory/snapshots", None)),
+    Operation("GET /api/inventory/stock", _get("/api/inventory/stock?at={stock_at}")),
+    Operation("GET /api/products/{product_id}/movements", _get("/api/products/{product_id}/movements")),
+    Operation("GET /api/inventory/reconcile", _get("/api/inventory/reconcile")),
+    Operation("POST /api/orders", _new_order),
+    Operation("GET /api/orders", _get("/api/orders")),
+    Operation("GET /api/orders/{order_id}", _get("/api/orders/{order_id}")),
+    Operation("PUT /api/orders/{order_id}",
+              lambda i, ctx: ("PUT", f"/api/orders/{_pick(ctx['created_orders'], i)}",
+                              {"status": ("processing", "completed", "cancelled")[i % 3]})),
+    Operation("POST /api/orders/bulk-status", _bulk_status),
+    Operation("DELETE /api/orders/{order_id}",
+              lambda i, ctx: ("DELETE", f"/api/orders/{_pop(ctx, 'created_orders')}", None)),
+    Operation("GET /api/sync", _get("/api/sync?since={sync_version}"), before=_sync_head),
+    Operation("GET /api/dashboard", _get("/api/dashboard")),
+    Operation("GET /api/customers", _get("/api/customers")),
+    Operation("GET /api/customers/{customer_id}", _get("/api/customers/{customer_id}")),
+    Operation("GET /api/customers/{customer_id}/orders", _get("/api/customers/{customer_id}/orders")),
+    Operation("GET /api/inventory/alerts", _get("/api/inventory/alerts")),
+    Operation("GET /api/inventory/forecast", _get("/api/inventory/forecast")),
+    Operation("GET /api/reports/sales", _get("/api/reports/sales")),
+    Operation("GET /api/reports/inventory", _get("/api/reports/inventory")),
+    Operation("GET /api/reports/sales/timeseries", _get("/api/reports/sales/timeseries?granularity=week")),
+    Operation("GET /api/analytics/margin-by-category", _get("/api/analytics/margin-by-category")),
+    Operation("GET /api/analytics/customers", _get("/api/analytics/customers")),
+    Operation("GET /api/analytics/discount-impact", _get("/api/analytics/discount-impact")),
+    Operation("GET /api/analytics/status", _get("/api/analytics/status")),
+    Operation("GET /api/events/status", _get("/api/events/status")),
+    Operation("POST /api/agent/chat", _agent_chat, serial=True, before=_load_agent_script),
+    Operation("POST /api/agent/reset", lambda i, ctx: ("POST", "/api/agent/reset", None), serial=True),
+    Operation("GET /api/agent/scheduler", _get("/api/agent/scheduler")),
+    Operation("GET /api/agent/metrics", _get("/api/agent/metrics")),
+    Operation("GET /metrics", _get("/metrics")),
+]
+
+
+# ==================== 準備 ====================
+
+def sample_ids(base_url: str) -> Dict:
+    http = requests.Session()
+    products = http.get(f"{base_url}/api/products", params={"limit": 1000}).json()
+    in_stock = [p["id"] for p in products if p["stock_quantity"] >= 50] or [p["id"] for p in products]
+    order = http.get(f"{base_url}/api/orders", params={"limit": 1}).json()
+    customer = http.get(f"{base_url}/api/customers", params={"limit": 1}).json()
+    return {
+        "product_id": products[0]["id"],
+        "order_id": order[0]["id"] if order else 1,
+        "customer_id": customer[0]["id"] if customer else 1,
+        "order_products": in_stock[:20],
+        "skus": [p["sku"] for p in products[:RECEIPT_LINES]],
+        "stock_at": (datetime.utcnow() - timedelta(days=1)).isoformat(timespec="seconds"),  # 一天前的時間點庫存
+    }
+
+
+def uncovered_routes(base_url: str) -> List[str]:
+    """openapi 中有、但 OPERATIONS 沒有壓測的路由（新增路由時提醒補上）"""
+    spec = requests.get(f"{base_url}/openapi.json").json()
+    routes = {f"{method.upper()} {path}" for path, methods in spec["paths"].items() for method in methods
+              if path not in SKIPPED_ROUTES}
+    return sorted(routes - {op.route for op in OPERATIONS})
+
+
+# ==================== 壓測 ====================
+
+def run_operation(op: Operation, ctx: Dict, n: int, concurrency: int) -> Dict:
+    local = threading.local()
+
+    def one(i: int) -> Tuple[float, bool]:
+        http = getattr(local, "http", None)
+        if http is None:
+            http = local.http = requests.Session()
+        if ctx.get("before_request"):
+            ctx["before_request"]()
+        try:
+            method, url, body = op.build(i, ctx)
+        except (IndexError, ZeroDivisionError):
+            return 0.0, False  # 前一階段沒有產生可用的 id
+        start = time.perf_counter()
+        try:
+            if isinstance(body, Upload):
+                response = http.request(method, ctx["base_url"] + url, files={"file": body}, timeout=60)
+            else:
+                response = http.request(method, ctx["base_url"] + url, json=body, timeout=60)
+            ok = response.status_code < 400
+            if ok and op.route == "POST /api/products":
+                with ctx["lock"]:
+                    ctx["created_products"].append(response.json()["id"])
+            elif ok and op.route == "POST /api/orders":
+                with ctx["lock"]:
+                    ctx["created_orders"].append(response.json()["id"])
+        except requests.RequestException:
+            ok = False
+        return time.perf_counter() - start, ok
+
+    ctx["before_request"] = None
+    if op.before:
+        op.before(ctx)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(one, range(n)))
+    wall = time.perf_counter() - started
+    ctx["before_request"] = None
+
+    ok = [seconds for seconds, success in results if success]
+    row = {"route": op.route, "concurrency": concurrency, "requests": n, "errors": n - len(ok),
+           "throughput": round(len(ok) / wall, 2) if wall > 0 else 0.0}
+    row.update(summarize(ok) if ok else {"mean": 0.0, "p50": 0.0, "p95": 0.0, "p99": 0.0})
+    return row
+
+
+def bench_scale(orders: int, args, mock: MockOllamaServer, workdir: str) -> Tuple[List[Dict], List[str], float]:
+    path = os.path.join(workdir, f"scale-{orders}.db")
+    prepare_seconds = prepare_database(path, orders, args.seed)
+    server = ApiProcess(path, f"{mock.base_url}/api/chat").wait()
+    rows = []
+    try:
+        ctx = {"base_url": server.base_url, "samples": sample_ids(server.base_url), "mock": mock,
+               "http": requests.Session(), "lock": threading.Lock(), "created_products": [],
+               "created_orders": [], "run": f"{orders}-{int(time.time())}"}
+        ctx["counter"] = iter(range(10 ** 9))
+        missing = uncovered_routes(server.base_url)
+        for concurrency in args.concurrency:
+            for op in OPERATIONS:
+                if op.serial and concurrency > 1:
+                    continue
+                n = args.agent_requests if op.serial else args.requests
+                row = run_operation(op, ctx, n, concurrency)
+                row["scale"] = orders
+                rows.append(row)
+                print_row(row)
+    finally:
+        server.stop()
+    return rows, missing, prepare_seconds
+
+
+# ==================== 比較與輸出 ====================
+
+def _key(row: Dict) -> Tuple[int, int, str]:
+    return row["scale"], row["concurrency"], row["route"]
+
+
+def compare(rows: List[Dict], baseline: List[Dict], threshold: float, min_delta_ms: float) -> List[str]:
+    """p95 變慢或吞吐量下降超過 threshold（比例）即視為回歸；p95 差距小於 min_delta_ms 的視為雜訊"""
+    previous = {_key(r): r for r in baseline}
+    regressions = []
+    for row in rows:
+        base = previous.get(_key(row))
+        if base is None:
+            continue
+        label = f"{row['route']}（規模 {row['scale']:,}，並發 {row['concurrency']}）"
+        if row["p95"] > base["p95"] * (1 + threshold) and row["p95"] - base["p95"] > min_delta_ms:
+            regressions.append(f"{label} p95 {base['p95']:.2f}ms → {row['p95']:.2f}ms")
+        if base["throughput"] and row["throughput"] < base["throughput"] * (1 - threshold) \
+                and row["p95"] - base["p95"] > min_delta_ms:
+            regressions.append(f"{label} 吞吐量 {base['throughput']:.1f} → {row['throughput']:.1f} req/s")
+        if row["errors"] > base["errors"]:
+            regressions.append(f"{label} 錯誤數 {base['errors']} → {row['errors']}")
+    return regressions
+
+
+HEADER = (f"{'scale':>8} {'conc':>4} {'route':<44} {'ok':>9} {'req/s':>9} "
+          f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+
+
+def print_row(row: Dict):
+    ok = f"{row['requests'] - row['errors']}/{row['requests']}"
+    print(f"{row['scale']:>8,} {row['concurrency']:>4} {row['route']:<44} {ok:>9} {row['throughput']:>9.1f} "
+          f"{row['p50']:>9.2f} {row['p95']:>9.2f} {row['p99']:>9.2f}")
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API 端到端性能測試")
+    parser.add_argument("--scales", type=_int_list, default=[0, 20000],
+                        help="合成訂單數，逗號分隔（0 表示只有示範數據）")
+    parser.add_argument("--concurrency", type=_int_list, default=[1, 8], help="並發數，逗號分隔")
+    parser.add_argument("--requests", type=int, default=100, help="每個路由、每個並發數的請求數")
+    parser.add_argument("--agent-requests", type=int, default=10, help="agent 對話請求數（只以並發 1 執行）")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="Mock Ollama 每次回應延遲")
+    parser.add_argument("--seed", type=int, default=42, help="數據產生的隨機種子")
+    parser.add_argument("--json", help="輸出結果到 JSON 檔案（可作為之後的基準）")
+    parser.add_argument("--baseline", help="基準 JSON；出現回歸時返回非零")
+    parser.add_argument("--threshold", type=float, default=0.2, help="回歸門檻（比例，預設 0.2 即 20%%）")
+    parser.add_argument("--min-delta-ms", type=float, default=5.0, help="p95 差距小於此值不視為回歸")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="erp-api-bench-")
+    rows: List[Dict] = []
+    prepared: Dict[int, float] = {}
+    missing: List[str] = []
+    print(HEADER)
+    print("-" * len(HEADER))
+    with MockOllamaServer(latency_ms=args.latency_ms) as mock:
+        for orders in args.scales:
+            scale_rows, missing, prepared[orders] = bench_scale(orders, args, mock, workdir)
+            rows += scale_rows
+
+    for route in missing:
+        print(f"⚠️  未壓測的路由：{route}")
+    failed = [r for r in rows if r["errors"]]
+    for r in failed:
+        print(f"⚠️  {r['route']}（規模 {r['scale']:,}，並發 {r['concurrency']}）失敗 {r['errors']}/{r['requests']}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"scales": args.scales, "concurrency": args.concurrency, "requests": args.requests,
+                       "latency_ms": args.latency_ms, "seed": args.seed,
+                       "prepare_seconds": {str(k): round(v, 2) for k, v in prepared.items()},
+                       "results": rows}, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(rows, baseline, args.threshold, args.min_delta_ms)
+        for line in regressions:
+            print(f"❌ {line}")
+        if regressions:
+            sys.exit(1)
+        print(f"✅ 與基準相比沒有超過 {args.threshold:.0%} 的回歸")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+讀取快取驚群測試
+以合成數據（預設 5000 筆訂單）在子行程中啟動 API，分別在關閉與開啟讀取快取（ERP_READ_CACHE=off/on）下，
+讓一群客戶端同時請求同一個昂貴報表（預設 /api/reports/sales），分三個階段量測：
+
+- cold：快取為空時同時到達，開啟快取時應只計算一次，其餘請求等待並共用結果；
+- warm：結果仍在 TTL 內；
+- stale：補貨一次並等待 TTL 過後再同時到達，開啟快取時先返回舊結果，由背景計算一次。
+
+每個階段記錄延遲分佈、總耗時，以及伺服器實際計算的次數（/metrics 的 miss + refresh + bypass）。
+
+用法：
+    python bench_cache.py
+    python bench_cache.py --path /api/reports/inventory --clients 64 --max-p95-ms 100
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List
+
+import requests
+
+from harness import ApiProcess, prepare_database, summarize
+
+COMPUTE_RESULTS = ("miss", "refresh", "bypass")
+PHASES = ("cold", "warm", "stale")
+
+
+def computes(base_url: str) -> int:
+    """伺服器累計的計算次數"""
+    total = 0
+    for line in requests.get(f"{base_url}/metrics").text.splitlines():
+        if line.startswith("erp_read_cache_requests_total{") and any(f'result="{r}"' in line for r in COMPUTE_RESULTS):
+            total += int(float(line.rsplit(" ", 1)[1]))
+    return total
+
+
+def herd(base_url: str, path: str, clients: int) -> Dict:
+    """clients 個執行緒同時發出同一個請求"""
+    sessions = [requests.Session() for _ in range(clients)]
+    for s in sessions:
+        s.get(f"{base_url}/api/health").raise_for_status()  # 預先建立連接
+    barrier = threading.Barrier(clients + 1)
+    latencies: List[float] = []
+    errors: List[str] = []
+    lock = threading.Lock()
+
+    def worker(session: requests.Session):
+        barrier.wait()
+        t0 = time.perf_counter()
+        try:
+            session.get(f"{base_url}{path}").raise_for_status()
+        except requests.RequestException as e:
+            with lock:
+                errors.append(str(e))
+            return
+        with lock:
+            latencies.append(time.perf_counter() - t0)
+
+    threads = [threading.Thread(target=worker, args=(s,)) for s in sessions]
+    for t in threads:
+        t.start()
+    before = computes(base_url)
+    barrier.wait()
+    started = time.perf_counter()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - started
+    time.sleep(0.2)  # 等待背景重新計算登記
+    for s in sessions:
+        s.close()
+    stats = summarize(latencies)
+    return {"requests": clients, "errors": len(errors), "computes": computes(base_url) - before,
+            "wall_s": round(wall, 3), **stats, "max_ms": round(max(latencies) * 1000, 3) if latencies else 0.0}
+
+
+def run_mode(path: str, mode: str, args) -> Dict[str, Dict]:
+    env = {"ERP_READ_CACHE": mode, "ERP_READ_CACHE_TTL": str(args.ttl)}
+    with ApiProcess(path, env=env) as server:
+        base_url = server.base_url
+        product_id = requests.get(f"{base_url}/api/products", params={"limit": 1}).json()[0]["id"]
+        rows = {"cold": herd(base_url, args.path, args.clients),
+                "warm": herd(base_url, args.path, args.clients)}
+        requests.post(f"{base_url}/api/inventory/restock/{product_id}", params={"quantity": 1}).raise_for_status()
+        time.sleep(args.ttl + 0.1)
+        rows["stale"] = herd(base_url, args.path, args.clients)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="讀取快取驚群測試")
+    parser.add_argument("--path", default="/api/reports/sales", help="測試的 API 路徑")
+    parser.add_argument("--orders", type=int, default=5000, help="合成訂單數")
+    parser.add_argument("--clients", type=int, default=12,
+                        help="同時到達的請求數（關閉快取時超過連接池 15 條容易逾時）")
+    parser.add_argument("--ttl", type=float, default=1.0, help="伺服器的 ERP_READ_CACHE_TTL（秒）")
+    parser.add_argument("--modes", default="off,on", help="依序測試的快取模式")
+    parser.add_argument("--json", help="輸出結果到 JSON 檔案")
+    parser.add_argument("--max-p95-ms", type=float,
+                        help="開啟快取時 warm/stale 的 p95 上限；超過、或 cold/stale 計算超過一次時返回非零")
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(prefix="erp-cache-"), "cache.db")
+    print(f"準備數據庫（{args.orders} 筆訂單）...")
+    prepare_database(path, orders=args.orders)
+
+    results = {}
+    for mode in [m.strip() for m in args.modes.split(",") if m.strip()]:
+        results[mode] = run_mode(path, mode, args)
+
+    print(f"\n{args.path}，每階段 {args.clients} 個同時到達的請求")
+    print(f"{'mode':<5} {'phase':<6} {'computes':>8} {'errors':>6} {'wall s':>8} {'p50':>9} {'p95':>9} {'max':>9}")
+    for mode, rows in results.items():
+        for phase in PHASES:
+            r = rows[phase]
+            print(f"{mode:<5} {phase:<6} {r['computes']:>8} {r['errors']:>6} {r['wall_s']:>8.2f} "
+                  f"{r['p50']:>9.2f} {r['p95']:>9.2f} {r['max_ms']:>9.2f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"path": args.path, "orders": args.orders, "clients": args.clients, "results": results},
+                      f, ensure_ascii=False, indent=2)
+
+    if args.max_p95_ms is not None and "on" in results:
+        rows = results["on"]
+        failed = [p for p in PHASES if rows[p]["errors"]]
+        failed += [p for p in ("warm", "stale") if rows[p]["p95"] > args.max_p95_ms]
+        failed += [p for p in ("cold", "stale") if rows[p]["computes"] > 1]
+        if failed:
+            print(f"❌ 開啟快取時 {', '.join(sorted(set(failed)))} 階段超過門檻（p95 {args.max_p95_ms}ms 或計算超過一次）")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+變更推送扇出性能測試
+在子行程中以 uvicorn 啟動 API，由多個客戶端行程建立大量 /api/events 訂閱（預設 1000 條 SSE 連接），
+全部連上後依固定間隔呼叫補貨 API，記錄每個事件從提交到各訂閱者收到的延遲、送達率與連接耗時。
+
+延遲以伺服器事件的時間戳與客戶端收到的時間相減（同一台機器），包含客戶端解析的時間；
+訂閱者分散到多個客戶端行程，避免單一事件迴圈成為瓶頸。
+
+用法：
+    python bench_changefeed.py
+    python bench_changefeed.py --subscribers 2000 --events 50 --interval-ms 20 --max-p95-ms 200
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import queue
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import httpx
+import requests
+
+from harness import ApiProcess, prepare_database, summarize
+
+
+# ==================== 客戶端 ====================
+
+async def _subscriber(client: httpx.AsyncClient, url: str, expected: int, connected: asyncio.Queue,
+                      latencies: List[float]) -> int:
+    received = 0
+    start = time.perf_counter()
+    async with client.stream("GET", url) as resp:
+        await connected.put(time.perf_counter() - start)
+        async for line in resp.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            now = time.time()
+            event = json.loads(line[5:])
+            if event["type"] != "stock.changed":
+                continue
+            latencies.append(now - event["ts"])
+            received += 1
+            if received >= expected:
+                break
+    return received
+
+
+async def _client_main(base_url: str, subscribers: int, expected: int, ready, stop, results):
+    url = f"{base_url}/api/events?topics=stock"
+    limits = httpx.Limits(max_connections=subscribers + 10, max_keepalive_connections=0)
+    latencies: List[float] = []
+    connected: asyncio.Queue = asyncio.Queue()
+    async with httpx.AsyncClient(limits=limits, timeout=httpx.Timeout(None, connect=30)) as client:
+        tasks = [asyncio.create_task(_subscriber(client, url, expected, connected, latencies))
+                 for _ in range(subscribers)]
+        connect_times = [await connected.get() for _ in range(subscribers)]
+        ready.put(connect_times)
+        pending = set(tasks)
+        while pending and not stop.is_set():
+            _, pending = await asyncio.wait(pending, timeout=0.1)
+        for task in pending:
+            task.cancel()
+        done = await asyncio.gather(*tasks, return_exceptions=True)
+    results.put({"received": sum(r for r in done if isinstance(r, int)), "latencies": latencies,
+                 "errors": sum(1 for r in done if isinstance(r, BaseException)
+                               and not isinstance(r, asyncio.CancelledError))})
+
+
+def run_client(base_url: str, subscribers: int, expected: int, ready, stop, results):
+    asyncio.run(_client_main(base_url, subscribers, expected, ready, stop, results))
+
+
+# ==================== 測試流程 ====================
+
+def bench(args, base_url: str) -> Dict:
+    ctx = multiprocessing.get_context("spawn")
+    ready, results, stop = ctx.Queue(), ctx.Queue(), ctx.Event()
+    shares = [args.subscribers // args.clients + (1 if i < args.subscribers % args.clients else 0)
+              for i in range(args.clients)]
+    procs = [ctx.Process(target=run_client, args=(base_url, n, args.events, ready, stop, results), daemon=True)
+             for n in shares if n]
+
+    started = time.perf_counter()
+    for proc in procs:
+        proc.start()
+    connect_times: List[float] = []
+    for _ in procs:
+        connect_times += ready.get(timeout=args.timeout)
+    connect_wall = time.perf_counter() - started
+    online = requests.get(f"{base_url}/api/events/status").json()["subscribers"]
+
+    # 依序補貨：每次提交產生一個 stock.changed 事件
+    http = requests.Session()
+    product_id = http.get(f"{base_url}/api/products", params={"limit": 1}).json()[0]["id"]
+    write_latencies = []
+    writes_started = time.perf_counter()
+    for _ in range(args.events):
+        t0 = time.perf_counter()
+        http.post(f"{base_url}/api/inventory/restock/{product_id}", params={"quantity": 1}).raise_for_status()
+        write_latencies.append(time.perf_counter() - t0)
+        time.sleep(args.interval_ms / 1000)
+
+    collected = []
+    deadline = time.time() + args.timeout
+    while len(collected) < len(procs):
+        try:
+            collected.append(results.get(timeout=max(0.1, deadline - time.time())))
+        except queue.Empty:
+            if stop.is_set():
+                break
+            stop.set()  # 逾時：讓客戶端停止並回報已收到的事件
+            deadline = time.time() + 10
+    delivered_wall = time.perf_counter() - writes_started
+    stop.set()
+    for proc in procs:
+        proc.join(timeout=10)
+
+    latencies = [l for r in collected for l in r["latencies"]]
+    delivered = sum(r["received"] for r in collected)
+    expected = args.subscribers * args.events
+    return {
+        "subscribers": args.subscribers, "online": online, "events": args.events,
+        "delivered": delivered, "expected": expected,
+        "errors": sum(r["errors"] for r in collected),
+        "connect_wall_s": round(connect_wall, 3), "connect": summarize(connect_times),
+        "write": summarize(write_latencies), "delivery": summarize(latencies),
+        "delivery_max_ms": round(max(latencies) * 1000, 3) if latencies else 0.0,
+        "deliveries_per_s": round(delivered / delivered_wall, 1) if delivered_wall > 0 else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="變更推送扇出性能測試")
+    parser.add_argument("--subscribers", type=int, default=1000, help="同時在線的 SSE 訂閱數")
+    parser.add_argument("--events", type=int, default=20, help="補貨（事件）次數")
+    parser.add_argument("--interval-ms", type=float, default=50, help="兩次補貨之間的間隔")
+    parser.add_argument("--clients", type=int, default=min(4, os.cpu_count() or 1), help="客戶端行程數")
+    parser.add_argument("--timeout", type=float, default=60, help="連接與等待送達的逾時（秒）")
+    parser.add_argument("--json", help="輸出結果到 JSON 檔案")
+    parser.add_argument("--max-p95-ms", type=float, help="送達延遲 p95 上限，超過或有事件未送達則返回非零")
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(prefix="erp-changefeed-"), "changefeed.db")
+    prepare_database(path)
+    with ApiProcess(path) as server:
+        row = bench(args, server.base_url)
+
+    print(f"訂閱數 {row['subscribers']}（伺服器在線 {row['online']}），事件 {row['events']}，"
+          f"送達 {row['delivered']}/{row['expected']}，錯誤 {row['errors']}")
+    print(f"{'':<10} {'mean':>9} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for name in ("connect", "write", "delivery"):
+        stats = row[name]
+        print(f"{name:<10} {stats['mean']:>9.2f} {stats['p50']:>9.2f} {stats['p95']:>9.2f} {stats['p99']:>9.2f}")
+    print(f"全部連上耗時 {row['connect_wall_s']:.2f}s，送達最大延遲 {row['delivery_max_ms']:.1f}ms，"
+          f"{row['deliveries_per_s']:,.0f} 次送達/秒")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(row, f, ensure_ascii=False, indent=2)
+
+    if args.max_p95_ms is not None:
+        if row["delivered"] < row["expected"] or row["delivery"]["p95"] > args.max_p95_ms:
+            print(f"❌ 未全部送達或送達 p95 超過門檻 {args.max_p95_ms}ms")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
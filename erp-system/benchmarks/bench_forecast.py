@@ -0,0 +1,74 @@
+"""
+需求預測性能測試
+以合成的間歇性需求（預設 10 萬個 SKU × 730 天、1000 萬筆銷售明細）量測
+forecast.smooth_demand 與 reorder_points 的耗時。
+
+用法：
+    python bench_forecast.py
+    python bench_forecast.py --skus 100000 --days 730 --events 10000000 --max-seconds 10
+"""
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+
+from harness import use_temp_database
+
+
+def synthetic_sales(skus: int, days: int, events: int, seed: int = 42):
+    """熱門程度服從長尾分佈的銷售明細：(產品索引, 日索引, 數量)"""
+    rng = np.random.default_rng(seed)
+    popularity = 1.0 / np.arange(1, skus + 1) ** 0.8
+    popularity /= popularity.sum()
+    product_idx = rng.choice(skus, size=events, p=popularity)
+    # 帶每週季節性的銷售日
+    weekday_weight = np.array([1.2, 1.1, 1.0, 1.0, 1.1, 0.7, 0.5])
+    day_weight = weekday_weight[np.arange(days) % 7]
+    day_idx = rng.choice(days, size=events, p=day_weight / day_weight.sum())
+    quantity = rng.integers(1, 11, events).astype(np.float64)
+    stock = rng.integers(0, 500, skus).astype(np.float64)
+    return product_idx, day_idx, quantity, stock
+
+
+def main():
+    parser = argparse.ArgumentParser(description="需求預測性能測試")
+    parser.add_argument("--skus", type=int, default=100_000)
+    parser.add_argument("--days", type=int, default=730)
+    parser.add_argument("--events", type=int, default=10_000_000, help="銷售明細筆數")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max-seconds", type=float, help="預測耗時上限，超過則返回非零")
+    parser.add_argument("--json", help="輸出結果到 JSON 檔案")
+    args = parser.parse_args()
+
+    use_temp_database()
+    import forecast
+
+    product_idx, day_idx, quantity, stock = synthetic_sales(args.skus, args.days, args.events)
+
+    samples = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        daily, std, seen = forecast.smooth_demand(product_idx, day_idx, quantity, args.skus, args.days)
+        _, reorder_point, suggested = forecast.reorder_points(daily, std, stock)
+        samples.append(time.perf_counter() - start)
+
+    best, worst = min(samples), max(samples)
+    print(f"SKU {args.skus:,} × {args.days} 天，銷售明細 {args.events:,} 筆")
+    print(f"預測耗時：最佳 {best:.2f}s / 最差 {worst:.2f}s（{args.repeat} 次）")
+    print(f"有銷售記錄 {int(seen.sum()):,} 個 SKU，需要補貨 {int((suggested > 0).sum()):,} 個，"
+          f"平均每日需求 {daily[seen].mean():.3f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"skus": args.skus, "days": args.days, "events": args.events,
+                       "seconds": samples}, f, ensure_ascii=False, indent=2)
+
+    if args.max_seconds is not None and best > args.max_seconds:
+        print(f"❌ 預測耗時 {best:.2f}s 超過門檻 {args.max_seconds}s")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+熱門產品下單測試
+以合成數據在子行程中啟動 API，讓一群客戶端在固定時間內持續下單，比較三種情況：
+
+- spread：每個客戶端各買不同的產品，作為沒有熱點時的基準；
+- hot：全部客戶端都買同一個產品（促銷時的熱門 SKU）；
+- sellout：同一個產品只剩少量庫存，全部客戶端搶購，驗證不會超賣。
+
+每種情況記錄成功下單數與每秒訂單數、延遲分佈、庫存不足（400）與其他錯誤數，
+並在結束後核對庫存：售出件數必須等於庫存減少量、不得為負，異動帳對帳（/api/inventory/reconcile）必須一致。
+
+用法：
+    python bench_hot_sku.py
+    python bench_hot_sku.py --clients 16 --seconds 10 --min-hot-ratio 0.8
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List
+
+import requests
+
+from harness import ApiProcess, prepare_database, summarize
+
+SCENARIOS = ("spread", "hot", "sellout")
+
+
+def set_stock(base_url: str, product_id: int, quantity: int):
+    requests.put(f"{base_url}/api/products/{product_id}", json={"stock_quantity": quantity}).raise_for_status()
+
+
+def stock_of(base_url: str, product_id: int) -> int:
+    return requests.get(f"{base_url}/api/products/{product_id}").json()["stock_quantity"]
+
+
+def place_orders(base_url: str, products: List[int], seconds: float, quantity: int) -> Dict:
+    """每個客戶端（products 中的一項）持續下單 seconds 秒"""
+    barrier = threading.Barrier(len(products) + 1)
+    latencies: List[float] = []
+    sold: Dict[int, int] = {}
+    counts = {"rejected": 0, "errors": 0}
+    lock = threading.Lock()
+    deadline: List[float] = []
+
+    def worker(client: int, product_id: int):
+        session = requests.Session()
+        body = {"customer_name": f"熱門測試客戶 {client:03d}",
+                "items": [{"product_id": product_id, "quantity": quantity}]}
+        barrier.wait()
+        while time.perf_counter() < deadline[0]:
+            t0 = time.perf_counter()
+            try:
+                response = session.post(f"{base_url}/api/orders", json=body)
+            except requests.RequestException:
+                with lock:
+                    counts["errors"] += 1
+                continue
+            elapsed = time.perf_counter() - t0
+            with lock:
+                if response.status_code == 200:
+                    latencies.append(elapsed)
+                    sold[product_id] = sold.get(product_id, 0) + quantity
+                elif response.status_code == 400:
+                    counts["rejected"] += 1
+                else:
+                    counts["errors"] += 1
+        session.close()
+
+    threads = [threading.Thread(target=worker, args=(i, pid)) for i, pid in enumerate(products)]
+    for t in threads:
+        t.start()
+    deadline.append(time.perf_counter() + seconds)
+    barrier.wait()
+    started = time.perf_counter()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - started
+    return {"orders": len(latencies), "orders_per_s": round(len(latencies) / wall, 1), **counts,
+            "sold": sold, **summarize(latencies)}
+
+
+def run_scenario(base_url: str, scenario: str, ids: List[int], args) -> Dict:
+    clients = args.clients
+    if scenario == "spread":
+        products = ids[:clients]
+        initial = 10 ** 6
+    elif scenario == "hot":
+        products = [ids[0]] * clients
+        initial = 10 ** 6
+    else:
+        products = [ids[1]] * clients
+        initial = args.sellout_stock
+    for pid in set(products):
+        set_stock(base_url, pid, initial)
+
+    result = place_orders(base_url, products, args.seconds, args.quantity)
+    sold = result.pop("sold")
+    oversold = []
+    for pid in set(products):
+        left = stock_of(base_url, pid)
+        if left < 0 or initial - left != sold.get(pid, 0):
+            oversold.append({"product_id": pid, "initial": initial, "sold": sold.get(pid, 0), "left": left})
+    mismatches = requests.get(f"{base_url}/api/inventory/reconcile").json()["mismatches"]
+    return {**result, "products": len(set(products)), "stock_errors": len(oversold),
+            "ledger_mismatches": len(mismatches), "details": oversold}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="熱門產品下單測試")
+    parser.add_argument("--orders", type=int, default=5000, help="合成訂單數")
+    parser.add_argument("--clients", type=int, default=8, help="同時下單的客戶端數（不超過連接池 15 條）")
+    parser.add_argument("--seconds", type=float, default=5.0, help="每種情況持續下單的秒數")
+    parser.add_argument("--quantity", type=int, default=1, help="每張訂單的件數")
+    parser.add_argument("--sellout-stock", type=int, default=50, help="sellout 情況的初始庫存")
+    parser.add_argument("--json", help="輸出結果到 JSON 檔案")
+    parser.add_argument("--min-hot-ratio", type=float,
+                        help="hot 的每秒訂單數至少為 spread 的幾倍；低於此值、超賣或對帳不一致時返回非零")
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(prefix="erp-hot-"), "hot.db")
+    print(f"準備數據庫（{args.orders} 筆訂單）...")
+    prepare_database(path, orders=args.orders)
+
+    results = {}
+    with ApiProcess(path) as server:
+        ids = [p["id"] for p in requests.get(f"{server.base_url}/api/products",
+                                             params={"limit": args.clients + 1}).json()]
+        if len(ids) < args.clients + 1:
+            sys.exit(f"需要至少 {args.clients + 1} 個產品")
+        for scenario in SCENARIOS:
+            results[scenario] = run_scenario(server.base_url, scenario, ids, args)
+
+    print(f"\n{args.clients} 個客戶端，每種情況 {args.seconds:g} 秒，每張訂單 {args.quantity} 件")
+    print(f"{'scenario':<8} {'products':>8} {'orders':>7} {'orders/s':>9} {'400':>5} {'errors':>6} "
+          f"{'p50':>8} {'p95':>8} {'stock':>5} {'ledger':>6}")
+    for scenario, r in results.items():
+        print(f"{scenario:<8} {r['products']:>8} {r['orders']:>7} {r['orders_per_s']:>9.1f} {r['rejected']:>5} "
+              f"{r['errors']:>6} {r['p50']:>8.2f} {r['p95']:>8.2f} {r['stock_errors']:>5} {r['ledger_mismatches']:>6}")
+    sellout = results["sellout"]
+    print(f"sellout：初始庫存 {args.sellout_stock}，成功 {sellout['orders']} 筆，庫存不足 {sellout['rejected']} 筆")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"orders": args.orders, "clients": args.clients, "seconds": args.seconds,
+                       "results": results}, f, ensure_ascii=False, indent=2)
+
+    failed = [s for s, r in results.items() if r["errors"] or r["stock_errors"] or r["ledger_mismatches"]]
+    if args.min_hot_ratio is not None and \
+            results["hot"]["orders_per_s"] < args.min_hot_ratio * results["spread"]["orders_per_s"]:
+        failed.append("hot")
+    if failed:
+        print(f"❌ {', '.join(sorted(set(failed)))} 未通過（錯誤、超賣、對帳不一致或 hot/spread 低於 {args.min_hot_ratio}）")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
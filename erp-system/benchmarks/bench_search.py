@@ -0,0 +1,111 @@
+"""
+產品搜尋性能測試
+產生大量合成產品（預設 10 萬個）到臨時 SQLite 數據庫，
+比較 LIKE '%關鍵字%' 掃描與 search.py 倒排索引的查詢延遲，並統計索引建立耗時。
+
+用法：
+    python bench_search.py
+    python bench_search.py --products 100000 --repeat 20 --max-p95-ms 20
+"""
+import argparse
+import json
+import sqlite3
+import sys
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from harness import summarize, use_temp_database
+
+BRANDS = ["Dell", "HP", "Lenovo", "ASUS", "Acer", "Apple", "Logitech", "Samsung", "LG", "TP-Link"]
+KINDS = [("筆記本電腦", "ThinkPad"), ("顯示器", "UltraSharp"), ("鍵盤滑鼠", "Keyboard"),
+         ("網路設備", "Router"), ("儲存設備", "SSD"), ("印表機", "LaserJet"), ("耳機音響", "Headset")]
+# (查詢, 說明)：包含拼錯與中英混合
+QUERIES = [("thinkpad", "精確"), ("thnkpad", "拼錯"), ("keybord", "拼錯"), ("筆記本", "中文"),
+           ("dell 顯示器", "混合"), ("SKU-004242", "SKU")]
+
+
+def generate(path: str, products: int, seed: int = 42):
+    rng = np.random.default_rng(seed)
+    brand = rng.integers(0, len(BRANDS), products)
+    kind = rng.integers(0, len(KINDS), products)
+    model = rng.integers(100, 9999, products)
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        "INSERT INTO products (id, name, sku, description, category, price, cost, stock_quantity, "
+        "min_stock_level, supplier) VALUES (?, ?, ?, ?, ?, 1000, 800, 100, 10, ?)",
+        ((i + 1, f"{BRANDS[brand[i]]} {KINDS[kind[i]][1]} {model[i]}-{i + 1}", f"SKU-{i + 1:06d}",
+          f"{BRANDS[brand[i]]} {KINDS[kind[i]][0]}", KINDS[kind[i]][0], f"{BRANDS[brand[i]]} 代理商")
+         for i in range(products)))
+    conn.commit()
+    conn.close()
+
+
+def like_scan(conn, query: str, limit: int):
+    pattern = f"%{query}%"
+    return conn.execute(
+        "SELECT id FROM products WHERE name LIKE ? OR sku LIKE ? OR category LIKE ? OR description LIKE ? "
+        "LIMIT ?", (pattern, pattern, pattern, pattern, limit)).fetchall()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="產品搜尋性能測試（LIKE vs 倒排索引）")
+    parser.add_argument("--products", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=20, help="每個查詢重複次數")
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--max-p95-ms", type=float, help="索引查詢 p95 上限，超過則返回非零")
+    parser.add_argument("--json", help="輸出結果到 JSON 檔案")
+    args = parser.parse_args()
+
+    path = use_temp_database()
+    import database
+
+    database.Base.metadata.create_all(bind=database.engine)
+    import search
+
+    generate(path, args.products)
+    index = search.ProductIndex()
+    start = time.perf_counter()
+    index.rebuild()
+    build_seconds = time.perf_counter() - start
+    stats = index.stats()
+    print(f"產品 {args.products:,} 個，索引建立 {build_seconds:.2f}s（{stats['grams']:,} 個 gram）")
+
+    conn = sqlite3.connect(path)
+    rows: List[Dict] = []
+    worst_p95 = 0.0
+    for query, kind in QUERIES:
+        like_samples, index_samples = [], []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            like_hits = like_scan(conn, query, args.limit)
+            like_samples.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            hits = index.search(query, args.limit)
+            index_samples.append(time.perf_counter() - start)
+        index_ms = summarize(index_samples)
+        worst_p95 = max(worst_p95, index_ms["p95"])
+        rows.append({"query": query, "kind": kind, "like_hits": len(like_hits), "index_hits": len(hits),
+                     "like_ms": summarize(like_samples), "index_ms": index_ms})
+    conn.close()
+
+    header = f"{'query':<14} {'kind':<4} {'LIKE hits':>9} {'LIKE p50':>10} {'index hits':>10} {'p50 ms':>8} {'p95 ms':>8}"
+    print(header)
+    print("-" * len(header))
+    for r in rows:
+        print(f"{r['query']:<14} {r['kind']:<4} {r['like_hits']:>9} {r['like_ms']['p50']:>10.2f} "
+              f"{r['index_hits']:>10} {r['index_ms']['p50']:>8.2f} {r['index_ms']['p95']:>8.2f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"products": args.products, "build_seconds": build_seconds, "index": stats,
+                       "results": rows}, f, ensure_ascii=False, indent=2)
+
+    if args.max_p95_ms is not None and worst_p95 > args.max_p95_ms:
+        print(f"❌ 索引查詢 p95 {worst_p95:.2f}ms 超過門檻 {args.max_p95_ms}ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
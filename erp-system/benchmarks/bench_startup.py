@@ -0,0 +1,127 @@
+"""
+API 冷啟動性能測試
+每次以新的 Python 行程模擬一個 uvicorn worker 啟動：import main、執行 startup hook、完成第一個請求，
+分別記錄各階段耗時。比較目前的就緒檢查與舊做法（每個 worker 在 startup 執行 init_db），
+並以多個 worker 同時啟動的方式檢查舊做法在空數據庫上的競爭。
+
+用法：
+    python bench_startup.py
+    python bench_startup.py --repeat 10 --workers 4 --max-startup-ms 300
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from harness import BACKEND_DIR, summarize
+
+# 子行程：模擬一個 worker 啟動，輸出各階段耗時（秒）
+CHILD = r"""
+import json, sys, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+if sys.argv[1] == "legacy":
+    import database
+    database.init_db()
+from fastapi.testclient import TestClient
+with TestClient(main.app) as client:
+    started = time.perf_counter()
+    status = client.get("/api/health").status_code
+    first = time.perf_counter()
+print(json.dumps({"import": imported - start, "startup": started - imported,
+                  "first_request": first - started, "status": status}))
+"""
+
+
+def run_worker(mode: str, database_url: str, timeout: float = 120) -> Dict:
+    env = dict(os.environ, ERP_DATABASE_URL=database_url)
+    spawned = time.perf_counter()
+    try:
+        proc = subprocess.run([sys.executable, "-c", CHILD, mode], cwd=BACKEND_DIR, env=env,
+                              capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return {"ok": False, "wall": timeout, "error": f"{timeout:.0f}s 內未完成啟動"}
+    wall = time.perf_counter() - spawned
+    if proc.returncode != 0:
+        lines = [l for l in proc.stderr.strip().splitlines() if not l.startswith("(Background")]
+        return {"ok": False, "wall": wall, "error": (lines or ["?"])[-1]}
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result.update(ok=result["status"] == 200, wall=wall)
+    return result
+
+
+def prepare(path: str):
+    """以 manage.py init-db 建立數據庫（部署時在啟動 worker 之前執行一次）"""
+    subprocess.run([sys.executable, "manage.py", "init-db"], cwd=BACKEND_DIR, check=True,
+                   env=dict(os.environ, ERP_DATABASE_URL=f"sqlite:///{path}"), capture_output=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API 冷啟動性能測試")
+    parser.add_argument("--repeat", type=int, default=5, help="每種模式依序啟動的次數")
+    parser.add_argument("--workers", type=int, default=4, help="同時啟動的 worker 數")
+    parser.add_argument("--max-startup-ms", type=float, help="就緒檢查模式 startup 階段 p50 上限，超過則返回非零")
+    parser.add_argument("--json", help="輸出結果到 JSON 檔案")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="erp-startup-")
+    ready_db = os.path.join(tmp, "ready.db")
+    prepare(ready_db)
+
+    scenarios = []
+    # 依序啟動：已初始化的數據庫上，目前做法 vs 舊做法
+    for mode in ("ready", "legacy"):
+        samples = [run_worker(mode, f"sqlite:///{ready_db}") for _ in range(args.repeat)]
+        scenarios.append({"scenario": f"{mode}（已初始化）", "mode": mode, "samples": samples})
+
+    # 舊做法：每次都是空數據庫，worker 需要建表並寫入初始數據
+    samples = []
+    for i in range(args.repeat):
+        samples.append(run_worker("legacy", f"sqlite:///{os.path.join(tmp, f'fresh-{i}.db')}"))
+    scenarios.append({"scenario": "legacy（空數據庫）", "mode": "legacy", "samples": samples})
+
+    # 多個 worker 同時啟動
+    with ThreadPoolExecutor(args.workers) as pool:
+        concurrent_ready = list(pool.map(lambda _: run_worker("ready", f"sqlite:///{ready_db}"),
+                                         range(args.workers)))
+        race_db = f"sqlite:///{os.path.join(tmp, 'race.db')}"
+        concurrent_legacy = list(pool.map(lambda _: run_worker("legacy", race_db), range(args.workers)))
+    scenarios.append({"scenario": f"ready × {args.workers} 同時", "mode": "ready", "samples": concurrent_ready})
+    scenarios.append({"scenario": f"legacy × {args.workers} 同時（空數據庫）", "mode": "legacy",
+                      "samples": concurrent_legacy})
+
+    header = f"{'scenario':<28} {'ok':>5} {'import p50':>11} {'startup p50':>12} {'first req':>10} {'wall p50':>9}"
+    print(header)
+    print("-" * len(header))
+    rows: List[Dict] = []
+    for s in scenarios:
+        ok = [r for r in s["samples"] if r["ok"]]
+        row = {"scenario": s["scenario"], "ok": len(ok), "total": len(s["samples"]),
+               "errors": sorted({r["error"] for r in s["samples"] if not r["ok"] and "error" in r})}
+        for phase in ("import", "startup", "first_request", "wall"):
+            row[phase] = summarize([r[phase] for r in ok]) if ok else None
+        rows.append(row)
+        fmt = lambda phase: f"{row[phase]['p50']:.1f}" if row[phase] else "-"
+        print(f"{s['scenario']:<28} {len(ok):>2}/{len(s['samples']):<2} {fmt('import'):>11} {fmt('startup'):>12} "
+              f"{fmt('first_request'):>10} {fmt('wall'):>9}")
+        for error in row["errors"]:
+            print(f"    ❌ {error[:120]}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+
+    startup = rows[0]["startup"]
+    if args.max_startup_ms is not None and (startup is None or startup["p50"] > args.max_startup_ms):
+        print(f"❌ startup p50 超過門檻 {args.max_startup_ms}ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+查詢計劃檢查
+依序呼叫所有 GET API 與後端 agent 的查詢工具，擷取實際執行的 SELECT 語句，
+逐一執行 EXPLAIN QUERY PLAN（SQLite），標出全表掃描與臨時排序。
+不在 EXPECTED_SCANS 名單內的全表掃描視為問題，--strict 時返回非零。
+
+用法：
+    python explain_queries.py
+    python explain_queries.py --verbose --strict
+    python explain_queries.py --database ../backend/erp_demo.db --json plans.json
+"""
+import argparse
+import json
+import os
+import re
+import sys
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from harness import use_temp_database
+
+# 預期的全表掃描：(API, 表) → 原因
+EXPECTED_SCANS = {
+    ("GET /api/products", "products"): "分頁列表",
+    ("GET /api/orders", "orders"): "分頁列表",
+    ("GET /api/inventory/alerts", "products"): "比較 stock_quantity 與 min_stock_level 兩欄，無法走索引",
+    ("GET /api/inventory/forecast", "products"): "所有產品的補貨建議",
+    ("GET /api/dashboard", "products"): "庫存預警計數，比較兩欄無法走索引",
+    ("GET /api/dashboard", "orders"): "最近訂單按主鍵倒序 LIMIT N，只讀取 N 行",
+    ("GET /api/reports/inventory", "products"): "全部產品的庫存統計",
+    ("GET /api/inventory/reconcile", "products"): "對帳比較全部產品的庫存",
+    ("GET /api/reports/sales", "orders"): "全部訂單的狀態統計",
+    ("GET /api/reports/sales", "orders_archive"): "全部已歸檔訂單的狀態統計",
+    ("agent.get_orders", "orders"): "未指定狀態時列出全部訂單",
+    ("agent.get_products", "products"): "產品列表",
+    ("agent.get_sales_report", "orders"): "全部訂單的狀態統計",
+    ("agent.get_sales_report", "orders_archive"): "全部已歸檔訂單的狀態統計",
+}
+
+# 需要查詢參數或特定參數組合的請求（路徑參數會自動以樣本值替換）
+EXTRA_REQUESTS = [
+    "/api/products/search?q=dell",
+    "/api/customers?name=台北",
+    "/api/customers?email=info@khtrade.com.tw",
+    "/api/customers?sort=last_order",
+    "/api/customers?sort=name",
+    "/api/customers/{customer_id}/orders?status=completed",
+    "/api/customers/{customer_id}/orders?start=2020-01-01",
+    "/api/orders?start=2020-01-01&end=2030-12-31",
+    "/api/inventory/alerts?use_forecast=true",
+    "/api/sync?since={sync_version}",
+    "/api/reports/sales/timeseries?granularity=day&dimension=product&key={product_id}",
+    "/api/reports/sales/timeseries?granularity=week&dimension=customer&key=台北科技股份有限公司",
+]
+
+# 長連接的串流端點，不會自行結束
+STREAMING_ROUTES = {"/api/events"}
+
+_SCAN_RE = re.compile(r"^SCAN (?:TABLE )?(\w+)(?: AS \w+)?(.*)$")
+
+
+def classify(detail: str) -> Tuple[str, Optional[str]]:
+    """把一行查詢計劃分類為 full_scan / index_scan / temp_sort / ok，並返回涉及的表"""
+    if detail == "SCAN CONSTANT ROW":  # 沒有 FROM 的 SELECT（例如只有純量子查詢）
+        return "ok", None
+    match = _SCAN_RE.match(detail)
+    if match:
+        table, rest = match.groups()
+        if "USING" in rest:
+            return "index_scan", table
+        return "full_scan", table
+    if "USE TEMP B-TREE" in detail:
+        return "temp_sort", None
+    return "ok", None
+
+
+class Capture:
+    """以 before_cursor_execute 事件記錄目前標籤下執行的 SELECT"""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+
+        self.label = None
+        self.statements: "OrderedDict[Tuple[str, str], tuple]" = OrderedDict()
+        event.listen(engine, "before_cursor_execute", self._record)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        if self.label is None or executemany:
+            return
+        if statement.lstrip().upper().startswith(("SELECT", "WITH")):
+            self.statements.setdefault((self.label, statement), tuple(parameters or ()))
+
+
+def route_requests(app, samples: Dict[str, int]) -> List[Tuple[str, str]]:
+    """所有不需要查詢參數的 GET API，加上 EXTRA_REQUESTS；返回 (標籤, URL)"""
+    from fastapi.routing import APIRoute
+
+    requests = []
+    for route in app.routes:
+        if not isinstance(route, APIRoute) or "GET" not in route.methods:
+            continue
+        if not route.path.startswith("/api/") or route.path.startswith("/api/agent") or route.path in STREAMING_ROUTES:
+            continue
+        if any(p.required for p in route.dependant.query_params):
+            continue
+        requests.append((f"GET {route.path}", route.path.format(**samples)))
+    for url in EXTRA_REQUESTS:
+        requests.append((f"GET {url.split('?')[0]}", url.format(**samples)))
+    return requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description="以 EXPLAIN QUERY PLAN 檢查 API 與 agent 的查詢")
+    parser.add_argument("--database", help="使用既有的 SQLite 數據庫（預設建立臨時數據庫並寫入初始數據）")
+    parser.add_argument("--verbose", action="store_true", help="列出每個語句的完整查詢計劃")
+    parser.add_argument("--strict", action="store_true", help="有非預期的全表掃描時返回非零")
+    parser.add_argument("--json", help="輸出結果到 JSON 檔案")
+    args = parser.parse_args()
+
+    use_temp_database(os.path.abspath(args.database) if args.database else None)
+    from fastapi.testclient import TestClient
+
+    import database
+    import main as app_module
+    import search
+    from llm_agent import ERPAgent
+
+    if database.engine.dialect.name != "sqlite":
+        print("目前只支援 SQLite 的 EXPLAIN QUERY PLAN")
+        sys.exit(2)
+
+    database.init_db()
+    capture = Capture(database.engine)
+    client = TestClient(app_module.app, raise_server_exceptions=False)
+    with client:
+        search.get_index().ensure_ready()
+        db = database.SessionLocal()
+        try:
+            samples = {
+                "product_id": db.query(database.Product.id).order_by(database.Product.id).limit(1).scalar() or 1,
+                "order_id": db.query(database.Order.id).order_by(database.Order.id).limit(1).scalar() or 1,
+                "customer_id": db.query(database.Customer.id).order_by(database.Customer.id).limit(1).scalar() or 1,
+                "sync_version": db.query(database.SyncState.version).scalar() or 0,
+            }
+        finally:
+            db.close()
+
+        for label, url in route_requests(app_module.app, samples):
+            capture.label = label
+            response = client.get(url)
+            if response.status_code >= 400:
+                print(f"⚠️  {url} 返回 {response.status_code}")
+
+        agent = ERPAgent()  # 只呼叫工具函數，建構時不連接 LLM
+        for label, call in (("agent.get_products", lambda: agent.get_products(low_stock_only=True)),
+                            ("agent.get_orders", lambda: agent.get_orders()),
+                            ("agent.get_orders(status)", lambda: agent.get_orders(status="pending")),
+                            ("agent.get_customer", lambda: agent.get_customer("台北")),
+                            ("agent.search_products", lambda: agent.search_products("thinkpad")),
+                            ("agent.get_sales_report", lambda: agent.get_sales_report())):
+            capture.label = label
+            call()
+        capture.label = None
+
+    raw = database.engine.raw_connection()
+    results = []
+    try:
+        cursor = raw.cursor()
+        for (label, statement), params in capture.statements.items():
+            cursor.execute("EXPLAIN QUERY PLAN " + statement, params)
+            plan = [row[3] for row in cursor.fetchall()]
+            findings = []
+            for detail in plan:
+                kind, table = classify(detail)
+                if kind == "ok":
+                    continue
+                expected = EXPECTED_SCANS.get((label, table)) if kind == "full_scan" else None
+                findings.append({"kind": kind, "table": table, "detail": detail, "expected": expected})
+            results.append({"source": label, "sql": " ".join(statement.split()), "plan": plan,
+                            "findings": findings})
+    finally:
+        raw.close()
+
+    unexpected = 0
+    for r in results:
+        flagged = [f for f in r["findings"] if f["kind"] == "full_scan" and not f["expected"]]
+        unexpected += len(flagged)
+        if not (flagged or args.verbose):
+            continue
+        print(f"{'❌' if flagged else '  '} {r['source']}")
+        print(f"     {r['sql'][:160]}")
+        for detail in r["plan"] if args.verbose else [f["detail"] for f in flagged]:
+            print(f"       {detail}")
+
+    full = sum(1 for r in results for f in r["findings"] if f["kind"] == "full_scan")
+    sorts = sum(1 for r in results for f in r["findings"] if f["kind"] == "temp_sort")
+    print(f"\n檢查 {len(results)} 個語句：全表掃描 {full} 個（非預期 {unexpected} 個），臨時排序 {sorts} 個")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+    if args.strict and unexpected:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""
+性能測試共用工具
+負責準備臨時數據庫、在背景執行緒或子行程中執行 ERP API、載入 CLI agent 以及統計延遲分佈。
+"""
+import importlib.util
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from typing import Dict, List, Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ERP_DIR = os.path.dirname(BENCH_DIR)
+BACKEND_DIR = os.path.join(ERP_DIR, "backend")
+AGENT_DIR = os.path.join(os.path.dirname(ERP_DIR), "agent")
+
+
+def use_temp_database(path: Optional[str] = None) -> str:
+    """指向臨時 SQLite 數據庫；必須在 import 後端模組之前呼叫"""
+    if path is None:
+        path = os.path.join(tempfile.mkdtemp(prefix="erp-bench-"), "erp_bench.db")
+    os.environ["ERP_DATABASE_URL"] = f"sqlite:///{path}"
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+    return path
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def load_cli_agent_module():
+    """載入 agent/llm_agent.py（與後端同名模組區分開）"""
+    spec = importlib.util.spec_from_file_location("cli_llm_agent", os.path.join(AGENT_DIR, "llm_agent.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class ApiServer:
+    """在背景執行緒中啟動 FastAPI 應用"""
+
+    def __init__(self, port: Optional[int] = None):
+        import uvicorn
+        import main
+
+        self.port = port or free_port()
+        config = uvicorn.Config(main.app, host="127.0.0.1", port=self.port, log_level="warning")
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self) -> "ApiServer":
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return self
+
+    def stop(self):
+        self.server.should_exit = True
+        self.thread.join(timeout=5)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+# 子行程：可選擇讓 agent 指向 Mock Ollama，然後啟動 API
+API_PROCESS = r"""
+import sys
+import uvicorn
+import llm_agent
+import main
+if sys.argv[2]:
+    llm_agent.get_agent().ollama_url = sys.argv[2]
+uvicorn.run(main.app, host="127.0.0.1", port=int(sys.argv[1]), log_level="warning")
+"""
+
+
+def prepare_database(path: str, orders: int = 0, seed: int = 42) -> float:
+    """以 manage.py 建立 SQLite 數據庫並追加合成訂單，返回耗時（秒）"""
+    start = time.perf_counter()
+    env = dict(os.environ, ERP_DATABASE_URL=f"sqlite:///{path}")
+    subprocess.run([sys.executable, "manage.py", "init-db", "--seed", str(seed)], cwd=BACKEND_DIR, env=env,
+                   check=True, capture_output=True)
+    if orders:
+        subprocess.run([sys.executable, "manage.py", "generate", "--orders", str(orders), "--seed", str(seed),
+                        "--products", str(max(200, orders // 100)), "--customers", str(max(500, orders // 10))],
+                       cwd=BACKEND_DIR, env=env, check=True, capture_output=True)
+    return time.perf_counter() - start
+
+
+class ApiProcess:
+    """在子行程中執行 API，與壓測客戶端不共用 GIL"""
+
+    def __init__(self, path: str, ollama_url: Optional[str] = None, port: Optional[int] = None,
+                 env: Optional[Dict[str, str]] = None):
+        self.port = port or free_port()
+        env = dict(os.environ, **(env or {}), ERP_DATABASE_URL=f"sqlite:///{path}")
+        self.proc = subprocess.Popen([sys.executable, "-c", API_PROCESS, str(self.port), ollama_url or ""],
+                                     cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL)
+        self.base_url = f"http://127.0.0.1:{self.port}"
+
+    def wait(self, timeout: float = 60.0) -> "ApiProcess":
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.proc.poll() is not None:
+                raise RuntimeError(f"API 行程結束（返回 {self.proc.returncode}）")
+            try:
+                with urllib.request.urlopen(f"{self.base_url}/api/health", timeout=1) as resp:
+                    if resp.status == 200:
+                        return self
+            except (urllib.error.URLError, OSError):
+                pass
+            time.sleep(0.1)
+        raise RuntimeError("API 啟動逾時")
+
+    def stop(self):
+        self.proc.terminate()
+        try:
+            self.proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+
+    def __enter__(self):
+        return self.wait()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class SQLTimer:
+    """透過 SQLAlchemy 事件累計 SQL 語句數與耗時"""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+
+        self.engine = engine
+        self.count = 0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+        event.listen(engine, "before_cursor_execute", self._before)
+        event.listen(engine, "after_cursor_execute", self._after)
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("bench_query_start", []).append(time.perf_counter())
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["bench_query_start"].pop()
+        with self._lock:
+            self.count += 1
+            self.seconds += elapsed
+
+    def reset(self):
+        with self._lock:
+            self.count = 0
+            self.seconds = 0.0
+
+    def close(self):
+        from sqlalchemy import event
+
+        event.remove(self.engine, "before_cursor_execute", self._before)
+        event.remove(self.engine, "after_cursor_execute", self._after)
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    """延遲分佈（毫秒）"""
+    ms = [v * 1000 for v in values]
+    return {
+        "mean": round(sum(ms) / len(ms), 3) if ms else 0.0,
+        "p50": round(percentile(ms, 0.50), 3),
+        "p95": round(percentile(ms, 0.95), 3),
+        "p99": round(percentile(ms, 0.99), 3),
+    }
@@ -0,0 +1,225 @@
+"""
+Mock Ollama 服務
+按腳本重播 /api/chat 與 /api/generate 的回應（含 tool_calls），並模擬可設定的延遲，
+讓 agent 的性能測試不依賴真實模型。
+
+用法：
+    python mock_ollama.py --port 11435 --latency-ms 300
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+
+def _estimate_tokens(text: str) -> int:
+    """粗略估算 token 數（約 4 個字元一個 token）"""
+    return max(1, len(text) // 4)
+
+
+class MockOllamaServer:
+    """可重播腳本的 Mock Ollama 服務"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency_ms: float = 0.0,
+                 models: Optional[List[str]] = None):
+        self.latency_ms = latency_ms
+        self.models = models or ["qwen3:8b", "qwen2.5:7b"]
+        self._lock = threading.Lock()
+        self._chat_script: List[Dict[str, Any]] = []
+        self._generate_script: List[Dict[str, Any]] = []
+        self._chat_cursor = 0
+        self._generate_cursor = 0
+        self.stats = {"chat_requests": 0, "generate_requests": 0, "prompt_chars": 0}
+
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def load(self, chat: Optional[List[Dict[str, Any]]] = None,
+             generate: Optional[List[Dict[str, Any]]] = None,
+             latency_ms: Optional[float] = None):
+        """載入新的回應腳本並重置游標與統計"""
+        with self._lock:
+            self._chat_script = list(chat or [])
+            self._generate_script = list(generate or [])
+            self._chat_cursor = 0
+            self._generate_cursor = 0
+            self.stats = {"chat_requests": 0, "generate_requests": 0, "prompt_chars": 0}
+            if latency_ms is not None:
+                self.latency_ms = latency_ms
+
+    def _next(self, kind: str, prompt_chars: int) -> Dict[str, Any]:
+        with self._lock:
+            self.stats[f"{kind}_requests"] += 1
+            self.stats["prompt_chars"] += prompt_chars
+            if kind == "chat":
+                script, cursor = self._chat_script, self._chat_cursor
+                self._chat_cursor += 1
+            else:
+                script, cursor = self._generate_script, self._generate_cursor
+                self._generate_cursor += 1
+        if not script:
+            return {}
+        # 腳本用完時重複最後一個回應
+        return script[min(cursor, len(script) - 1)]
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, payload: Dict[str, Any], status: int = 200):
+                body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _send_stream(self, chunks: List[Dict[str, Any]], delay: float):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for chunk in chunks:
+                    if delay:
+                        time.sleep(delay)
+                    line = (json.dumps(chunk, ensure_ascii=False) + "\n").encode("utf-8")
+                    self.wfile.write(f"{len(line):X}\r\n".encode() + line + b"\r\n")
+                self.wfile.write(b"0\r\n\r\n")
+
+            def do_GET(self):
+                if self.path == "/api/tags":
+                    self._send_json({"models": [{"name": m} for m in server.models]})
+                else:
+                    self._send_json({"error": "not found"}, 404)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                raw = self.rfile.read(length)
+                request = json.loads(raw or b"{}")
+
+                if self.path == "/api/chat":
+                    kind = "chat"
+                elif self.path == "/api/generate":
+                    kind = "generate"
+                else:
+                    self._send_json({"error": "not found"}, 404)
+                    return
+
+                step = server._next(kind, len(raw))
+                latency = step.get("latency_ms", server.latency_ms) / 1000.0
+                stream = request.get("stream", True)
+
+                if kind == "chat":
+                    message = dict(step.get("message") or {"role": "assistant", "content": ""})
+                    message.setdefault("role", "assistant")
+                    message.setdefault("content", "")
+                    text = message["content"] + json.dumps(message.get("tool_calls", []))
+                else:
+                    response_text = step.get("response", "")
+                    if not isinstance(response_text, str):
+                        response_text = json.dumps(response_text, ensure_ascii=False)
+                    text = response_text
+
+                # 模擬 Ollama 的計數器（單位：納秒）
+                prompt_eval_count = _estimate_tokens(raw.decode("utf-8", "ignore"))
+                eval_count = _estimate_tokens(text)
+                total_ns = int(latency * 1e9)
+                counters = {
+                    "model": request.get("model", ""),
+                    "done": True,
+                    "total_duration": total_ns,
+                    "load_duration": 0,
+                    "prompt_eval_count": prompt_eval_count,
+                    "prompt_eval_duration": total_ns // 4,
+                    "eval_count": eval_count,
+                    "eval_duration": total_ns - total_ns // 4,
+                }
+
+                if not stream:
+                    time.sleep(latency)
+                    if kind == "chat":
+                        self._send_json({"message": message, **counters})
+                    else:
+                        self._send_json({"response": response_text, **counters})
+                    return
+
+                # 串流模式：把內容切成數段輸出，tool_calls 放在第一段
+                stream_text = message["content"] if kind == "chat" else text
+                pieces = [stream_text[i:i + 16] for i in range(0, len(stream_text), 16)] or [""]
+                delay = latency / (len(pieces) + 1)
+                chunks = []
+                for index, piece in enumerate(pieces):
+                    if kind == "chat":
+                        delta = {"role": "assistant", "content": piece}
+                        if index == 0 and message.get("tool_calls"):
+                            delta["tool_calls"] = message["tool_calls"]
+                        chunks.append({"message": delta, "done": False})
+                    else:
+                        chunks.append({"response": piece, "done": False})
+                final = dict(counters)
+                if kind == "chat":
+                    final["message"] = {"role": "assistant", "content": ""}
+                else:
+                    final["response"] = ""
+                chunks.append(final)
+                self._send_stream(chunks, delay)
+
+        return Handler
+
+    def start(self) -> "MockOllamaServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock Ollama 服務")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--latency-ms", type=float, default=300.0, help="每次回應的模擬延遲")
+    parser.add_argument("--scenario", help="情境名稱（見 scenarios.py），預設逐一重播全部")
+    args = parser.parse_args()
+
+    from scenarios import SCENARIOS
+
+    selected = [s for s in SCENARIOS if not args.scenario or s["name"] == args.scenario]
+    server = MockOllamaServer(args.host, args.port, args.latency_ms)
+    server.load(
+        chat=[step for s in selected for step in s.get("chat", [])],
+        generate=[step for s in selected for step in s.get("generate", [])],
+    )
+    print(f"Mock Ollama 運行於 {server.base_url}（延遲 {args.latency_ms}ms）")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+性能測試情境
+每個情境包含使用者輸入，以及 Mock Ollama 依序回放的回應：
+- chat：後端 ERPAgent 的 /api/chat 回應
+- cli_chat：CLI agent 原生工具模式的 /api/chat 回應（工具名稱與後端不同）
+- generate：CLI agent 舊 JSON 模式的 /api/generate 回應
+"""
+
+
+def _tool_call(name, arguments=None):
+    return {"function": {"name": name, "arguments": arguments or {}}}
+
+
+def _final(content):
+    return {"message": {"role": "assistant", "content": content}}
+
+
+SCENARIOS = [
+    {
+        "name": "direct_answer",
+        "message": "你好，你能做什麼？",
+        "chat": [
+            _final("您好，我可以幫您查詢產品與訂單、建立訂單、補貨以及查看報表。"),
+        ],
+        "generate": [
+            {"response": {"thought": "打招呼，不需要工具", "action": "none", "response": "您好！"}},
+        ],
+        "cli_chat": [
+            _final("您好！"),
+        ],
+    },
+    {
+        "name": "low_stock_lookup",
+        "message": "查一下哪些產品庫存不夠了",
+        "chat": [
+            {"message": {"role": "assistant", "content": "", "tool_calls": [
+                _tool_call("get_products", {"low_stock_only": True}),
+            ]}},
+            _final("目前有數項產品低於最低庫存，建議盡快補貨。"),
+        ],
+        "generate": [
+            {"response": {"thought": "查詢庫存預警", "action": "get_stock_alerts", "action_input": {}}},
+        ],
+        "cli_chat": [
+            {"message": {"role": "assistant", "content": "", "tool_calls": [_tool_call("get_stock_alerts")]}},
+            _final("以上產品庫存不足。"),
+        ],
+    },
+    {
+        "name": "sales_report",
+        "message": "告訴我目前的銷售情況",
+        "chat": [
+            {"message": {"role": "assistant", "content": "", "tool_calls": [
+                _tool_call("get_sales_report"),
+            ]}},
+            _final("系統目前的銷售報表已為您整理完成。"),
+        ],
+        "generate": [
+            {"response": {"thought": "查看銷售報表", "action": "get_sales_report", "action_input": {}}},
+        ],
+        "cli_chat": [
+            {"message": {"role": "assistant", "content": "", "tool_calls": [_tool_call("get_sales_report")]}},
+            _final("銷售報表如上。"),
+        ],
+    },
+    {
+        "name": "multi_tool",
+        "message": "列出待處理訂單，並給我銷售報表",
+        "chat": [
+            {"message": {"role": "assistant", "content": "", "tool_calls": [
+                _tool_call("get_orders", {"status": "pending"}),
+                _tool_call("get_sales_report"),
+            ]}},
+            _final("待處理訂單與銷售報表如上。"),
+        ],
+        "generate": [
+            {"response": {"thought": "查詢訂單", "action": "get_orders", "action_input": {}}},
+        ],
+        "cli_chat": [
+            {"message": {"role": "assistant", "content": "", "tool_calls": [
+                _tool_call("get_orders"),
+                _tool_call("get_sales_report"),
+            ]}},
+            _final("訂單與銷售報表如上。"),
+        ],
+    },
+    {
+        "name": "create_order",
+        "message": "幫台北科技公司下單，買 1 台 1 號產品",
+        "chat": [
+            {"message": {"role": "assistant", "content": "", "tool_calls": [
+                _tool_call("create_order", {
+                    "customer_name": "台北科技股份有限公司",
+                    "items": [{"product_id": 1, "quantity": 1}],
+                }),
+            ]}},
+            _final("已為您建立訂單。"),
+        ],
+        "generate": [
+            {"response": {"thought": "建立訂單", "action": "create_order", "action_input": {
+                "customer_name": "台北科技股份有限公司",
+                "items": [{"product_id": 1, "quantity": 1}],
+            }}},
+        ],
+        "cli_chat": [
+            {"message": {"role": "assistant", "content": "", "tool_calls": [
+                _tool_call("create_order", {
+                    "customer_name": "台北科技股份有限公司",
+                    "items": [{"product_id": 1, "quantity": 1}],
+                }),
+            ]}},
+            _final("訂單已建立。"),
+        ],
+    },
+]
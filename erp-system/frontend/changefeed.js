@@ -0,0 +1,30 @@
+// 變更推送訂閱（/api/events，Server-Sent Events）
+// 用法：ERPChangeFeed.subscribe(['orders', 'stock'], { 'order.created': data => ..., resync: () => reload() })
+// EventSource 斷線後會自動重連並帶上 Last-Event-ID，伺服器補發期間漏掉的事件；
+// 漏掉的事件已不在緩衝區、或是批量變更時會收到 resync，頁面應重新載入數據。
+(function() {
+    function subscribe(topics, handlers) {
+        if (!window.EventSource) return null;
+        const url = '/api/events' + (topics && topics.length ? '?topics=' + topics.join(',') : '');
+        const source = new EventSource(url);
+        source.onmessage = function(message) {
+            let event;
+            try {
+                event = JSON.parse(message.data);
+            } catch (error) {
+                return;
+            }
+            const handler = handlers[event.type];
+            if (handler) {
+                try {
+                    handler(event.data, event);
+                } catch (error) {
+                    console.error('處理變更事件失敗:', event.type, error);
+                }
+            }
+        };
+        return source;
+    }
+
+    window.ERPChangeFeed = { subscribe: subscribe };
+})();
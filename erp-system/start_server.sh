@@ -34,5 +34,8 @@ echo "按 Ctrl+C 停止服務器"
 echo "======================================"
 echo ""
 
+# 建表、套用遷移並在空數據庫寫入示範數據（可重複執行）
+python3 manage.py init-db || exit 1
+
 # 啟動 Uvicorn 服務器
 python3 -m uvicorn main:app --host 0.0.0.0 --port 8000 --reload
@@ -32,5 +32,8 @@ echo "按 Ctrl+C 停止服务"
 echo "========================================="
 echo ""
 
+# 建表、套用迁移并在空数据库写入示范数据（可重复执行）
+python3 manage.py init-db || exit 1
+
 # 启动FastAPI应用
 python3 main.py